@@ -2,8 +2,10 @@
 SkyCast FastAPI Backend
 Ultra-optimized API for air quality forecasting
 """
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse
 import os
 from dotenv import load_dotenv
@@ -11,14 +13,40 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Import routes
-from app.routes import tempo, openaq, weather, forecast, airquality
+from app.routes import tempo, openaq, weather, forecast, airquality, history
+from app.services.forecast_service import forecast_service
+from app.services.history_service import history_service
+from app.services.openaq_service import openaq_service
+from app.services.prefetch_service import prefetch_service
+from app.utils.cache import cache_stats, close_shared_backend
+from app.utils.http import close_http_clients, http_stats
+from app.utils.metrics import histogram_stats
+from app.utils.resilience import upstream_stats
+from app.utils.responses import GZIP_LEVEL, GZIP_MIN_SIZE, FastJSONResponse
+from app.utils.scheduler import scheduler_stats
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await openaq_service.start_catalog()
+    await forecast_service.start()
+    await prefetch_service.start()
+    await history_service.start()
+    yield
+    await history_service.stop()
+    await prefetch_service.stop()
+    await openaq_service.stop_catalog()
+    await forecast_service.close()
+    await close_shared_backend()
+    await close_http_clients()
 
 app = FastAPI(
     title="SkyCast API",
     description="AI-Powered Air Quality Forecasting with NASA TEMPO Data",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
 # CORS Configuration
@@ -31,6 +59,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Compress large JSON / raster responses for clients sending Accept-Encoding: gzip
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE, compresslevel=GZIP_LEVEL)
 
 # Include routers
 app.include_router(tempo.router, prefix="/api/tempo", tags=["TEMPO"])
@@ -38,6 +68,7 @@ app.include_router(openaq.router, prefix="/api/openaq", tags=["OpenAQ"])
 app.include_router(weather.router, prefix="/api/weather", tags=["Weather"])
 app.include_router(forecast.router, prefix="/api/forecast", tags=["Forecast"])
 app.include_router(airquality.router, prefix="/api/airquality", tags=["Aggregated"])
+app.include_router(history.router, prefix="/api/history", tags=["History"])
 
 @app.get("/")
 async def root():
@@ -51,6 +82,21 @@ async def root():
 async def health_check():
     return {"status": "healthy", "service": "skycast-api"}
 
+@app.get("/metrics")
+async def metrics():
+    """Runtime counters (cache hit/miss/eviction) for capacity sizing"""
+    return {
+        "caches": cache_stats(),
+        "stationCatalog": openaq_service.catalog.stats(),
+        "prefetch": prefetch_service.stats(),
+        "upstreams": upstream_stats(),
+        "rateLimits": scheduler_stats(),
+        "httpPools": http_stats(),
+        "forecast": forecast_service.stats(),
+        "history": history_service.stats(),
+        "histograms": histogram_stats(),
+    }
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("API_PORT", 8000))
@@ -1,79 +1,156 @@
 """Aggregated Air Quality Route
 Combines satellite (TEMPO) + ground (OpenAQ) sources and computes AQI.
 """
-from fastapi import APIRouter, Query, HTTPException
-from typing import Optional
+from fastapi import APIRouter, Query, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+from collections import defaultdict
 from datetime import datetime
+import asyncio
+import math
+import os
+
+import numpy as np
+
+from app.services.grid_service import (
+    BANDS, GRID_MAX_CELLS, PROJECTION_WEBMERCATOR, grid_service, mercator_row_centers, mercator_tile_bounds,
+)
+from app.services.prefetch_service import prefetch_service
 from app.services.tempo_service import tempo_service
-from app.services.openaq_service import openaq_service
-from app.utils.aqi import compute_aqi
+from app.services.openaq_service import SUPPORTED_PARAMETERS, openaq_service
+from app.utils.aqi import POLLUTANTS, compute_aqi, compute_aqi_many
+from app.utils.fusion import estimates_to_dict, idw_estimate, pack_measurements, union_stations
+from app.utils.geo import geohash_encode, haversine_km
+from app.utils.responses import FastJSONResponse, dumps, parse_fields, project
+from app.utils.scheduler import BATCH, request_lane
 
 router = APIRouter()
 
+# Station search tuning (see .env.example)
+FUSION_MAX_STATIONS = int(os.getenv("FUSION_MAX_STATIONS", 10))
+FUSION_EXPANSION_STEPS = int(os.getenv("FUSION_EXPANSION_STEPS", 3))
+# Per-source deadlines (seconds); a late source is dropped, not awaited
+TEMPO_DEADLINE_S = float(os.getenv("AIRQUALITY_TEMPO_DEADLINE_S", 5))
+OPENAQ_DEADLINE_S = float(os.getenv("AIRQUALITY_OPENAQ_DEADLINE_S", 8))
+
+# Batch endpoint limits
+BATCH_MAX_POINTS = int(os.getenv("AIRQUALITY_BATCH_MAX_POINTS", 500))
+BATCH_CONCURRENCY = int(os.getenv("AIRQUALITY_BATCH_CONCURRENCY", 8))
+# Raster tiles are TILE_SIZE x TILE_SIZE cells
+TILE_SIZE = int(os.getenv("AIRQUALITY_TILE_SIZE", 256))
+
+# Every AQI registry pollutant that ground stations report
+TARGET_PARAMS = tuple(code for code in POLLUTANTS if code in SUPPORTED_PARAMETERS)
+
+# IDW weight 1/(d+0.01)^power with optional distance / k-nearest cutoffs
+FUSION_OPTIONS = {
+    "power": float(os.getenv("FUSION_IDW_POWER", 1.0)),
+    "max_distance_km": float(os.environ["FUSION_MAX_DISTANCE_KM"]) if os.getenv("FUSION_MAX_DISTANCE_KM") else None,
+    "k_nearest": int(os.environ["FUSION_K_NEAREST"]) if os.getenv("FUSION_K_NEAREST") else None,
+}
+
+
+class BatchPoint(BaseModel):
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+
+
+class BatchRequest(BaseModel):
+    points: List[BatchPoint] = Field(..., min_length=1, max_length=BATCH_MAX_POINTS)
+    radius: int = Field(10, ge=1, le=200)
+
+
+async def _with_deadline(awaitable: Awaitable[Any], deadline: float) -> Tuple[Any, str]:
+    """Await a source fetch; returns (result, status) with status ok/timeout/error.
+
+    Cancelling on timeout only abandons this request's wait: cached service
+    calls keep loading in the background and warm the cache for the next one.
+    """
+    try:
+        return await asyncio.wait_for(awaitable, deadline), "ok"
+    except asyncio.TimeoutError:
+        return None, "timeout"
+    except Exception:
+        return None, "error"
+
+
+async def _fetch_sources(lat: float, lon: float, radius: int) -> Dict[str, Tuple[Any, str]]:
+    """Fetch TEMPO and OpenAQ concurrently, each bounded by its own deadline."""
+    tempo, ground = await asyncio.gather(
+        _with_deadline(tempo_service.fetch_tempo_data(lat, lon), TEMPO_DEADLINE_S),
+        _with_deadline(
+            openaq_service.get_nearby_stations_adaptive(
+                lat, lon, radius, FUSION_MAX_STATIONS, FUSION_EXPANSION_STEPS
+            ),
+            OPENAQ_DEADLINE_S,
+        ),
+    )
+    return {"tempo": tempo, "openaq": ground}
+
+
+def _fuse_pollutants(stations: List[Dict[str, Any]], meas: Dict[str, Any]) -> Dict[str, float]:
+    """Inverse-distance weighted ground estimates, falling back to satellite values."""
+    matrix = pack_measurements(stations, TARGET_PARAMS)
+    pollutants = estimates_to_dict(TARGET_PARAMS, idw_estimate(matrix.values, matrix.distances, **FUSION_OPTIONS))
+    return _satellite_fallback(pollutants, meas)
+
+
+def _satellite_fallback(pollutants: Dict[str, float], meas: Dict[str, Any]) -> Dict[str, float]:
+    # Fallback to satellite for missing pollutants (note TEMPO naming differences)
+    for param in TARGET_PARAMS:
+        if param not in pollutants and meas.get(param) is not None:
+            pollutants[param] = meas.get(param)
+    return pollutants
+
+
+def _apply_uniqueness(pollutants: Dict[str, float], lat: float, lon: float, stations_used: int) -> Optional[Dict[str, Any]]:
+    """Perturb satellite-only values slightly so neighbouring points differ (in place)."""
+    # If no ground stations contributed, apply deterministic perturbation to avoid uniform values
+    if stations_used == 0 and pollutants:
+        # Compute a small sinusoidal perturbation factor based on lat/lon
+        base_phase = math.sin(lat * 0.17 + lon * 0.11)
+        uniqueness_details = {}
+        for k, v in list(pollutants.items()):
+            if isinstance(v, (int, float)):
+                delta = v * 0.03 * base_phase  # up to ±3%
+                perturbed = round(v + delta, 2)
+                pollutants[k] = perturbed
+                uniqueness_details[k] = {"original": v, "perturbed": perturbed, "delta": round(delta, 3)}
+        return {
+            "mode": "satellite-fallback",
+            "perturbation": "3% * sin(lat*0.17 + lon*0.11)",
+            "details": uniqueness_details,
+        }
+    if stations_used > 0:
+        return {"mode": "ground-weighted", "note": "Inverse-distance weighting provides spatial differentiation"}
+    return None
+
 @router.get("/")
 async def get_aggregated_air_quality(
     lat: float = Query(..., ge=-90, le=90),
     lon: float = Query(..., ge=-180, le=180),
     radius: int = Query(10, ge=1, le=200),
+    include_sources: bool = Query(True, description="Embed the raw TEMPO / OpenAQ payloads"),
+    fields: Optional[str] = Query(None, description="Comma-separated data fields to return, e.g. aqi,pollutants"),
 ):
     try:
-        tempo = await tempo_service.fetch_tempo_data(lat, lon)
-
-        # Adaptive search: expand radius until we have at least one station with measurements or hit cap
-        search_radius = radius
-        ground = await openaq_service.get_nearby_stations(lat, lon, search_radius, None, 10)
-        attempts = 0
-        while attempts < 3 and (
-            not ground.get("stations")
-            or all(not s.get("measurements") for s in ground.get("stations", []))
-        ):
-            search_radius = min(int(search_radius * 2), 200)
-            ground = await openaq_service.get_nearby_stations(
-                lat, lon, search_radius, None, 10
-            )
-            attempts += 1
-
-        # Derive pollutant set using inverse-distance weighting across stations for each pollutant
-        pollutants = {}
+        prefetch_service.record(lat, lon)
+        # Both sources run concurrently; latency is bounded by the slowest deadline.
+        # Adaptive search: smallest of radius, 2x, 4x, ... (cap 200 km) that has a station
+        # with measurements, resolved locally from a single wide lookup
+        fetched = await _fetch_sources(lat, lon, radius)
+        tempo, tempo_status = fetched["tempo"]
+        ground_result, ground_status = fetched["openaq"]
+        if ground_result is not None:
+            ground, search_radius, attempts = ground_result
+        else:
+            ground, search_radius, attempts = {"stations": []}, radius, 0
+        source_status = {"tempo": tempo_status, "openaq": ground_status}
+
         stations = ground.get("stations") if ground else []
-        if stations:
-            # For each pollutant, collect (value, distance)
-            from math import isfinite
-            target_params = ("pm25", "o3", "no2")
-            for param in target_params:
-                values = []
-                for s in stations:
-                    dist = s.get("distance") or 0.1  # avoid zero
-                    for m in s.get("measurements", []):
-                        if m.get("parameter") == param and m.get("value") is not None:
-                            val = m.get("value")
-                            if isinstance(val, (int, float)) and isfinite(val):
-                                values.append((val, dist))
-                if values:
-                    # Inverse distance weights: w = 1/(d+epsilon)
-                    eps = 0.01
-                    weighted_sum = sum(v / (d + eps) for v, d in values)
-                    weight_total = sum(1 / (d + eps) for _, d in values)
-                    pollutants[param] = round(weighted_sum / weight_total, 2)
-            # Fallback: if still missing a param, take first station measurement
-            for param in ("pm25", "o3", "no2"):
-                if param not in pollutants:
-                    for s in stations:
-                        for m in s.get("measurements", []):
-                            if m.get("parameter") == param and m.get("value") is not None:
-                                pollutants[param] = m.get("value")
-                                break
-                        if param in pollutants:
-                            break
-
-        # Fallback to satellite for missing pollutants (note TEMPO naming differences)
         meas = tempo.get("measurements", {}) if tempo else {}
-        if "pm25" not in pollutants and meas.get("pm25") is not None:
-            pollutants["pm25"] = meas.get("pm25")
-        if "o3" not in pollutants and meas.get("o3") is not None:
-            pollutants["o3"] = meas.get("o3")
-        if "no2" not in pollutants and meas.get("no2") is not None:
-            pollutants["no2"] = meas.get("no2")
+        pollutants = _fuse_pollutants(stations, meas)
 
         aqi = compute_aqi(pollutants)
 
@@ -82,35 +159,22 @@ async def get_aggregated_air_quality(
         fusion_meta = {
             "stationsUsed": stations_used,
             "radiusUsedKm": search_radius,
-            "weighting": "inverse-distance (1/(d+0.01))",
+            "weighting": f"inverse-distance (1/(d+0.01)^{FUSION_OPTIONS['power']:g})",
             "pollutantsWeighted": list(pollutants.keys()),
-            "attempts": attempts + 1,
+            "attempts": attempts,
+            "sourceStatus": source_status,
+            "missingSources": [k for k, v in source_status.items() if v != "ok"],
+            # Served from cache past TTL while a refresh runs
+            "staleSources": [k for k, v in {"tempo": tempo, "openaq": ground}.items() if v and v.get("stale")],
         }
-
-        # If no ground stations contributed, apply deterministic perturbation to avoid uniform values
-        if stations_used == 0 and pollutants:
-            import math
-            # Compute a small sinusoidal perturbation factor based on lat/lon
-            base_phase = math.sin(lat * 0.17 + lon * 0.11)
-            uniqueness_details = {}
-            for k, v in list(pollutants.items()):
-                if isinstance(v, (int, float)):
-                    delta = v * 0.03 * base_phase  # up to ±3%
-                    perturbed = round(v + delta, 2)
-                    pollutants[k] = perturbed
-                    uniqueness_details[k] = {"original": v, "perturbed": perturbed, "delta": round(delta, 3)}
-            fusion_meta["uniqueness"] = {
-                "mode": "satellite-fallback",
-                "perturbation": "3% * sin(lat*0.17 + lon*0.11)",
-                "details": uniqueness_details,
-            }
-        elif stations_used > 0:
-            fusion_meta["uniqueness"] = {"mode": "ground-weighted", "note": "Inverse-distance weighting provides spatial differentiation"}
+        uniqueness = _apply_uniqueness(pollutants, lat, lon, stations_used)
+        if uniqueness:
+            fusion_meta["uniqueness"] = uniqueness
 
         unified = {
             "location": {"lat": lat, "lon": lon},
             "timestamp": datetime.utcnow().isoformat(),
-            "sources": {"tempo": tempo, "openaq": ground},
+            **({"sources": {"tempo": tempo, "openaq": ground}} if include_sources else {}),
             "pollutants": {
                 **pollutants,
                 "hcho": meas.get("hcho"),
@@ -119,6 +183,213 @@ async def get_aggregated_air_quality(
             "aqi": aqi,
             "fusion": fusion_meta,
         }
-        return {"success": True, "data": unified}
+        # Returned directly: serialized once by orjson, no jsonable_encoder pass
+        return FastJSONResponse({"success": True, "data": project(unified, parse_fields(fields))})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _resolve_point(index: int, point: BatchPoint, tile: str, radius: int,
+                         meas: Dict[str, Any], tempo_status: str) -> Dict[str, Any]:
+    ground_result, ground_status = await _with_deadline(
+        openaq_service.get_nearby_stations_adaptive(
+            point.lat, point.lon, radius, FUSION_MAX_STATIONS, FUSION_EXPANSION_STEPS
+        ),
+        OPENAQ_DEADLINE_S,
+    )
+    if ground_result is not None:
+        ground, search_radius, attempts = ground_result
+    else:
+        ground, search_radius, attempts = {"stations": []}, radius, 0
+    stations = ground.get("stations", [])
+    source_status = {"tempo": tempo_status, "openaq": ground_status}
+    return {
+        "index": index,
+        "location": {"lat": point.lat, "lon": point.lon},
+        "tile": tile,
+        "_stations": stations,
+        "_satellite": meas,
+        "fusion": {
+            "stationsUsed": len(stations),
+            "radiusUsedKm": search_radius,
+            "attempts": attempts,
+            "missingSources": [k for k, v in source_status.items() if v != "ok"],
+        },
+    }
+
+
+def _finalize(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Fuse and score a set of resolved points in one vectorized pass.
+
+    Stations are de-duplicated across points into one (stations x parameters)
+    matrix; IDW runs over the (points x stations) distance matrix, restricted
+    to each point's own station selection, then AQI is scored for all points.
+    """
+    if not results:
+        return results
+    stations, membership = union_stations([r.pop("_stations") for r in results])
+    matrix = pack_measurements(stations, TARGET_PARAMS)
+    lat = np.array([r["location"]["lat"] for r in results])
+    lon = np.array([r["location"]["lon"] for r in results])
+    distances = haversine_km(lat[:, None], lon[:, None], matrix.lat[None, :], matrix.lon[None, :])
+    estimates = idw_estimate(matrix.values, distances, membership, **FUSION_OPTIONS)
+
+    satellite = [r.pop("_satellite") for r in results]
+    for result, row, meas in zip(results, estimates, satellite):
+        result["pollutants"] = _satellite_fallback(estimates_to_dict(TARGET_PARAMS, row), meas)
+    for result, aqi, meas in zip(results, compute_aqi_many([r["pollutants"] for r in results]), satellite):
+        result["aqi"] = aqi
+        loc = result["location"]
+        _apply_uniqueness(result["pollutants"], loc["lat"], loc["lon"], result["fusion"]["stationsUsed"])
+        result["pollutants"].update({"hcho": meas.get("hcho"), "aerosolIndex": meas.get("aerosolIndex")})
+    return results
+
+
+async def _resolve_tile(tile: str, members: List[Tuple[int, BatchPoint]], radius: int,
+                        semaphore: asyncio.Semaphore) -> List[Dict[str, Any]]:
+    """One vectorized TEMPO call for the tile's points + one shared station lookup per tile."""
+    async with semaphore:
+        lat = np.array([point.lat for _, point in members])
+        lon = np.array([point.lon for _, point in members])
+        # Sampled per point, so batch values match the single-point endpoint
+        samples, tempo_status = await _with_deadline(tempo_service.sample_points(lat, lon), TEMPO_DEADLINE_S)
+        samples = samples or [{}] * len(members)
+        # Members coalesce on the tile's single-flight station fetch
+        return await asyncio.gather(*(
+            _resolve_point(index, point, tile, radius, meas, tempo_status)
+            for (index, point), meas in zip(members, samples)
+        ))
+
+
+def _tile_tasks(request: BatchRequest) -> List[asyncio.Task]:
+    groups: Dict[str, List[Tuple[int, BatchPoint]]] = defaultdict(list)
+    for index, point in enumerate(request.points):
+        groups[geohash_encode(point.lat, point.lon, openaq_service.tile_precision)].append((index, point))
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    # Tasks copy the context: their upstream calls run in the batch lane
+    with request_lane(BATCH):
+        return [
+            asyncio.create_task(_resolve_tile(tile, members, request.radius, semaphore))
+            for tile, members in groups.items()
+        ]
+
+
+@router.post("/batch")
+async def get_batch_air_quality(
+    request: BatchRequest,
+    stream: bool = Query(False, description="Stream results as NDJSON as tiles complete"),
+):
+    """AQI for many points in one call.
+
+    Points are grouped by cache tile so each tile costs one vectorized TEMPO
+    call (every point sampled) and one station lookup; tiles are resolved with bounded concurrency, then IDW
+    fusion and AQI run for the whole batch (or each streamed tile) in one
+    vectorized pass.
+    """
+    if stream:
+        async def ndjson():
+            tasks = _tile_tasks(request)
+            try:
+                for done in asyncio.as_completed(tasks):
+                    for result in _finalize(await done):
+                        yield dumps(result) + b"\n"
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+        # identity: GZipMiddleware would buffer the stream instead of flushing per tile
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson",
+                                 headers={"Content-Encoding": "identity"})
+
+    try:
+        tasks = _tile_tasks(request)
+        results = [r for tile_results in await asyncio.gather(*tasks) for r in tile_results]
+        results.sort(key=lambda r: r["index"])
+        _finalize(results)
+        return FastJSONResponse({
+            "success": True,
+            "count": len(results),
+            "tiles": len(tasks),
+            "timestamp": datetime.utcnow().isoformat(),
+            "results": results,
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _parse_bands(bands: str) -> List[str]:
+    names = [b.strip() for b in bands.split(",") if b.strip()]
+    unknown = [b for b in names if b not in BANDS]
+    if not names or unknown:
+        raise HTTPException(status_code=400, detail=f"bands must be a subset of {', '.join(BANDS)}")
+    return list(dict.fromkeys(names))
+
+
+def _grid_response(request: Request, payload: bytes, etag: str, width: int, height: int) -> Response:
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=300",
+        "X-Grid-Width": str(width),
+        "X-Grid-Height": str(height),
+    }
+    match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in match.split(",")] or match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type="application/octet-stream", headers=headers)
+
+
+@router.get("/grid")
+async def get_air_quality_grid(
+    request: Request,
+    bbox: str = Query(..., description="minLon,minLat,maxLon,maxLat"),
+    res: float = Query(0.1, gt=0.001, le=5, description="Cell size in degrees"),
+    bands: str = Query("aqi", description=f"Comma separated subset of {','.join(BANDS)}"),
+):
+    """Gridded AQI raster over a bounding box as binary float32 (see grid_service).
+
+    Cells are evaluated in one vectorized pass; responses carry a strong ETag
+    and honour If-None-Match with 304.
+    """
+    try:
+        west, south, east, north = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be minLon,minLat,maxLon,maxLat")
+    if not (-180 <= west < east <= 180 and -90 <= south < north <= 90):
+        raise HTTPException(status_code=400, detail="bbox out of range or empty")
+    names = _parse_bands(bands)
+    width = max(1, math.ceil(round((east - west) / res, 9)))
+    height = max(1, math.ceil(round((north - south) / res, 9)))
+    if width * height > GRID_MAX_CELLS:
+        raise HTTPException(status_code=400, detail=f"grid of {width}x{height} cells exceeds {GRID_MAX_CELLS}")
+    try:
+        # Cell centres; rows north -> south
+        lon_centers = west + (np.arange(width) + 0.5) * (east - west) / width
+        lat_centers = north - (np.arange(height) + 0.5) * (north - south) / height
+        payload, etag = await grid_service.render(lat_centers, lon_centers, (west, south, east, north), names)
+        return _grid_response(request, payload, etag, width, height)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/tiles/{z}/{x}/{y}")
+async def get_air_quality_tile(
+    request: Request,
+    z: int,
+    x: int,
+    y: int,
+    bands: str = Query("aqi", description=f"Comma separated subset of {','.join(BANDS)}"),
+):
+    """XYZ Web Mercator raster tile (TILE_SIZE x TILE_SIZE cells, same binary format as /grid)."""
+    if not (0 <= z <= 18 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail="invalid tile coordinates")
+    names = _parse_bands(bands)
+    try:
+        west, south, east, north = mercator_tile_bounds(z, x, y)
+        lon_centers = west + (np.arange(TILE_SIZE) + 0.5) * (east - west) / TILE_SIZE
+        lat_centers = mercator_row_centers(z, y, TILE_SIZE)
+        payload, etag = await grid_service.render(
+            lat_centers, lon_centers, (west, south, east, north), names, PROJECTION_WEBMERCATOR
+        )
+        return _grid_response(request, payload, etag, TILE_SIZE, TILE_SIZE)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,65 @@
+"""
+Observation History Route
+Hourly past values and rolling averages served from the local time-series store
+"""
+from fastapi import APIRouter, Query, HTTPException
+from typing import Optional
+from datetime import datetime, timedelta, timezone
+from app.services.history_service import history_service, station_series, tile_series
+from app.services.timeseries_store import AGGREGATES
+
+router = APIRouter()
+
+
+def _utc(ts: Optional[datetime]) -> Optional[datetime]:
+    return ts.replace(tzinfo=timezone.utc) if ts is not None and ts.tzinfo is None else ts
+
+
+def _range(start: Optional[datetime], end: Optional[datetime], days: int):
+    end = _utc(end) or datetime.now(timezone.utc) + timedelta(hours=1)
+    return _utc(start) or end - timedelta(days=days), end
+
+
+def _query(series: str, start, end, days: int, parameters: Optional[str]):
+    start, end = _range(start, end, days)
+    param_list = [p.strip() for p in parameters.split(",")] if parameters else None
+    try:
+        data = history_service.query(series, start, end, param_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"success": True, "data": data}
+
+
+@router.get("/station/{station_id}")
+async def station_history(
+    station_id: str,
+    start: Optional[datetime] = Query(None, description="Range start (ISO 8601, UTC)"),
+    end: Optional[datetime] = Query(None, description="Range end, exclusive (default: now)"),
+    days: int = Query(7, ge=1, le=93, description="Range length when start is omitted"),
+    parameters: Optional[str] = Query(None, description="Comma-separated parameters (default: all)"),
+):
+    """Hourly history of a ground station with 8h O3 / 24h PM2.5 rolling means."""
+    return _query(station_series(station_id), start, end, days, parameters)
+
+
+@router.get("/")
+async def tile_history(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    start: Optional[datetime] = Query(None, description="Range start (ISO 8601, UTC)"),
+    end: Optional[datetime] = Query(None, description="Range end, exclusive (default: now)"),
+    days: int = Query(7, ge=1, le=93, description="Range length when start is omitted"),
+    parameters: Optional[str] = Query(None, description="Comma-separated parameters (default: all)"),
+):
+    """Hourly TEMPO history of the tile containing the point."""
+    return _query(tile_series(lat, lon), start, end, days, parameters)
+
+
+@router.get("/aggregates")
+async def list_aggregates():
+    """Rolling aggregates reported with every history query."""
+    return {"success": True, "results": [
+        {"name": name, "parameter": parameter, "windowHours": window} for name, (parameter, window) in AGGREGATES.items()
+    ]}
@@ -6,6 +6,7 @@ from fastapi import APIRouter, Query, HTTPException
 from typing import Optional
 from datetime import datetime
 import asyncio
+from app.services.prefetch_service import prefetch_service
 from app.services.tempo_service import tempo_service
 
 router = APIRouter()
@@ -29,6 +30,8 @@ async def get_tempo_data(
     """
     try:
         param_list = parameters.split(',') if parameters else None
+        if date is None:
+            prefetch_service.record(lat, lon)
         data = await tempo_service.fetch_tempo_data(lat, lon, date, param_list)
         
         return {
@@ -40,23 +43,21 @@ async def get_tempo_data(
 
 @router.get("/latest")
 async def get_latest_tempo():
-    """Get latest available TEMPO data across North America"""
+    """Get latest available TEMPO data across North America
+
+    Locations come from PREFETCH_LOCATIONS and are kept warm by the prefetch
+    scheduler, so this is normally answered from cache.
+    """
     try:
-        # Sample locations for demo
-        locations = [
-            {"name": "New York", "lat": 40.7128, "lon": -74.0060},
-            {"name": "Los Angeles", "lat": 34.0522, "lon": -118.2437},
-            {"name": "Chicago", "lat": 41.8781, "lon": -87.6298},
+        locations = prefetch_service.locations
+        fetched = await asyncio.gather(*(
+            tempo_service.fetch_tempo_data(loc["lat"], loc["lon"]) for loc in locations
+        ))
+        results = [
+            {"location": loc["name"], "data": data}
+            for loc, data in zip(locations, fetched)
         ]
-        
-        results = []
-        for loc in locations:
-            data = await tempo_service.fetch_tempo_data(loc["lat"], loc["lon"])
-            results.append({
-                "location": loc["name"],
-                "data": data
-            })
-        
+
         return {
             "success": True,
             "data": results
@@ -0,0 +1,389 @@
+"""Forecast Inference Service
+
+Runs the AQI forecast model behind ``/api/forecast``.
+
+    - the model artifact (joblib, scikit-learn style ``predict``) is loaded
+      once at startup with ``mmap_mode="r"``: large NumPy arrays inside the
+      estimator are memory-mapped instead of copied into each worker
+    - features for every requested horizon are built as one matrix
+      (``build_features``) and scored with a single ``predict`` call
+    - inference runs in a small thread pool so CPU-bound predicts never block
+      the event loop
+    - concurrent requests are coalesced by a micro-batcher into one predict
+      per model (``app.utils.batching``)
+    - runs are cached per (geohash tile, run length, model version, input
+      data hour); shorter horizons are served as a prefix of a longer cached
+      run, and a new model version or newly ingested data changes the key
+    - without an artifact a persistence baseline (AQI stays at its current
+      value) is served and reported as such
+    - ``MODEL_DIR`` is a registry of versioned artifacts: it is polled for a
+      newer file matching ``FORECAST_MODEL_GLOB``, which is loaded and warmed
+      up (one predict) in a worker thread and then swapped in with a single
+      assignment; requests already running finish on the model they started
+      with, and a broken artifact is logged and skipped
+
+Artifact format (see ``save_model``): a dict with ``model`` (estimator),
+``features`` (column names, a subset of ``FEATURES`` in any order),
+``version``, ``name``, ``metrics`` (mae / rmse / r2 on held-out data) and
+optional ``fill`` values (feature -> value) replacing missing inputs.
+
+Environment Variables:
+    MODEL_DIR              -> directory with trained artifacts (default "models")
+    FORECAST_MODEL_GLOB    -> artifact names inside MODEL_DIR; the newest wins (default forecast*.joblib)
+    FORECAST_MODEL_POLL_SECONDS  -> how often MODEL_DIR is checked for a new artifact (default 30; 0 disables)
+    FORECAST_WORKERS       -> inference threads (default 2)
+    FORECAST_MAX_HOURS     -> longest horizon served (default 72)
+    FORECAST_BATCH_MAX_ROWS      -> rows that trigger an immediate batch predict (default 512)
+    FORECAST_BATCH_MAX_WAIT_MS   -> longest a request waits for others to join (default 5; 0 disables)
+    FORECAST_TILE_PRECISION      -> geohash precision of cached forecasts (default 5, ~5 km)
+    FORECAST_RUN_HOURS           -> horizon computed per cached run (default 24)
+"""
+from __future__ import annotations
+
+import asyncio
+import glob
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import joblib
+import numpy as np
+
+from app.services.openaq_service import openaq_service
+from app.services.tempo_service import tempo_service
+from app.utils.batching import MicroBatcher
+from app.utils.cache import build_cache
+from app.utils.geo import geohash_center, geohash_encode
+from app.utils.aqi import AQI_CATEGORIES, aqi_category_index, compute_aqi
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_FORMAT = 1
+# Feature columns produced by build_features (models may use any subset)
+FEATURES = (
+    "horizon", "hour_sin", "hour_cos", "dow_sin", "dow_cos",
+    "lat", "lon", "pm25", "o3", "no2", "aqi_now",
+)
+_COLUMN = {name: i for i, name in enumerate(FEATURES)}
+# Current-condition inputs taken from the TEMPO sample
+INPUT_POLLUTANTS = ("pm25", "o3", "no2")
+MAX_HOURS = int(os.getenv("FORECAST_MAX_HOURS", 72))
+# Plausible conditions for the warm-up predict of a newly loaded model
+WARMUP_CONDITIONS = {"pm25": 12.0, "o3": 40.0, "no2": 15.0, "aqi_now": 50}
+
+
+def build_features(lat: float, lon: float, start: datetime, hours: int,
+                   current: Dict[str, Optional[float]]) -> np.ndarray:
+    """(hours x FEATURES) matrix for horizons 1..hours from ``start`` (UTC)."""
+    horizon = np.arange(1, hours + 1, dtype=float)
+    target_hour = (start.hour + horizon) % 24
+    target_dow = (start.weekday() + (start.hour + horizon) // 24) % 7
+    X = np.empty((hours, len(FEATURES)))
+    X[:, _COLUMN["horizon"]] = horizon
+    X[:, _COLUMN["hour_sin"]] = np.sin(2 * np.pi * target_hour / 24)
+    X[:, _COLUMN["hour_cos"]] = np.cos(2 * np.pi * target_hour / 24)
+    X[:, _COLUMN["dow_sin"]] = np.sin(2 * np.pi * target_dow / 7)
+    X[:, _COLUMN["dow_cos"]] = np.cos(2 * np.pi * target_dow / 7)
+    X[:, _COLUMN["lat"]] = lat
+    X[:, _COLUMN["lon"]] = lon
+    for name in (*INPUT_POLLUTANTS, "aqi_now"):
+        value = current.get(name)
+        X[:, _COLUMN[name]] = np.nan if value is None else value
+    return X
+
+
+class PersistenceModel:
+    """Baseline used when no trained artifact is available: AQI stays as it is now."""
+
+    name = "Persistence baseline"
+    version = "baseline"
+    metrics: Dict[str, float] = {}
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return np.nan_to_num(X[:, _COLUMN["aqi_now"]], nan=0.0)
+
+
+class ForecastModel:
+    """Loaded artifact: estimator + the feature columns it was trained on."""
+
+    def __init__(self, artifact: Dict[str, Any], path: Optional[str] = None):
+        self.estimator = artifact["model"]
+        self.features = tuple(artifact.get("features") or FEATURES)
+        unknown = set(self.features) - set(FEATURES)
+        if unknown:
+            raise ValueError(f"artifact uses unknown features: {', '.join(sorted(unknown))}")
+        self._columns = [_COLUMN[f] for f in self.features]
+        self.version = str(artifact.get("version", "unversioned"))
+        self.name = artifact.get("name") or type(self.estimator).__name__
+        self.metrics = dict(artifact.get("metrics") or {})
+        fill = artifact.get("fill") or {}
+        self._fill = np.array([fill.get(f, np.nan) for f in self.features], dtype=float)
+        self.path = path
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        X = X[:, self._columns]
+        missing = np.isnan(X) & ~np.isnan(self._fill)
+        if missing.any():
+            X = np.where(missing, self._fill, X)
+        return np.asarray(self.estimator.predict(X), dtype=float)
+
+
+def save_model(path: str, estimator: Any, version: str, metrics: Optional[Dict[str, float]] = None,
+               name: Optional[str] = None, features: Sequence[str] = FEATURES,
+               fill: Optional[Dict[str, float]] = None) -> None:
+    """Write an artifact (uncompressed, so it can be memory-mapped on load)."""
+    tmp = f"{path}.tmp"
+    joblib.dump({
+        "format": ARTIFACT_FORMAT,
+        "model": estimator,
+        "features": list(features),
+        "version": version,
+        "name": name,
+        "metrics": metrics or {},
+        "fill": fill or {},
+    }, tmp)
+    os.replace(tmp, path)
+
+
+def load_model(path: str) -> ForecastModel:
+    artifact = joblib.load(path, mmap_mode="r")
+    if not isinstance(artifact, dict) or artifact.get("format") != ARTIFACT_FORMAT:
+        raise ValueError(f"{path} is not a forecast artifact (format {ARTIFACT_FORMAT})")
+    return ForecastModel(artifact, path)
+
+
+class ModelRegistry:
+    """Versioned forecast artifacts in a directory; the newest file is the candidate."""
+
+    def __init__(self, model_dir: str, pattern: str):
+        self.model_dir = model_dir
+        self.pattern = pattern
+        self.seen: Optional[Tuple[str, int, int]] = None  # last artifact tried (path, mtime, size)
+        self.loaded_at: Optional[float] = None
+        self.swaps = 0
+        self.warmup_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def latest(self) -> Optional[Tuple[str, int, int]]:
+        """(path, mtime_ns, size) of the newest matching artifact, or None."""
+        found = []
+        for path in glob.glob(os.path.join(self.model_dir, self.pattern)):
+            try:
+                st = os.stat(path)
+            except OSError:  # removed while listing
+                continue
+            found.append((path, st.st_mtime_ns, st.st_size))
+        return max(found, key=lambda f: (f[1], f[0])) if found else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "dir": self.model_dir,
+            "pattern": self.pattern,
+            "loadedAt": datetime.fromtimestamp(self.loaded_at, timezone.utc).isoformat() if self.loaded_at else None,
+            "swaps": self.swaps,
+            "warmupMs": self.warmup_ms,
+            "lastError": self.last_error,
+        }
+
+
+def start_hour(now: Optional[datetime] = None) -> datetime:
+    return (now or datetime.now(timezone.utc)).replace(minute=0, second=0, microsecond=0)
+
+
+def _confidence(metrics: Dict[str, float], horizon: np.ndarray) -> np.ndarray:
+    """Held-out r2 of the model, decaying 1% per forecast hour (heuristic)."""
+    base = min(max(float(metrics.get("r2", 0.5)), 0.0), 1.0)
+    return np.round(base * 0.99 ** horizon, 2)
+
+
+class ForecastService:
+    def __init__(self, model_dir: Optional[str] = None, pattern: Optional[str] = None,
+                 workers: Optional[int] = None):
+        self.registry = ModelRegistry(
+            model_dir or os.getenv("MODEL_DIR", "models"),
+            pattern or os.getenv("FORECAST_MODEL_GLOB", "forecast*.joblib"),
+        )
+        self.poll_interval = float(os.getenv("FORECAST_MODEL_POLL_SECONDS", 30))
+        self._watcher: Optional[asyncio.Task] = None
+        self.model: Any = PersistenceModel()
+        self.workers = workers or int(os.getenv("FORECAST_WORKERS", 2))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.predictions = 0
+        max_wait_ms = float(os.getenv("FORECAST_BATCH_MAX_WAIT_MS", 5))
+        # Requests for the same model share one predict; keyed by model object
+        self.batcher: Optional[MicroBatcher] = MicroBatcher(
+            "forecast",
+            lambda model, X: self.predict(X, model),
+            max_rows=int(os.getenv("FORECAST_BATCH_MAX_ROWS", 512)),
+            max_wait_ms=max_wait_ms,
+        ) if max_wait_ms > 0 else None
+        self.tile_precision = int(os.getenv("FORECAST_TILE_PRECISION", 5))
+        self.run_hours = int(os.getenv("FORECAST_RUN_HOURS", 24))
+        self._cache = build_cache("forecast", ttl=3600, max_entries=4096)
+
+    def warm_up(self, model: Any) -> None:
+        """Run one predict so the first request doesn't pay for lazy init / page faults."""
+        X = build_features(40.0, -95.0, start_hour(), self.run_hours, WARMUP_CONDITIONS)
+        out = np.asarray(model.predict(X))
+        if out.shape != (len(X),) or not np.isfinite(out).all():
+            raise ValueError(f"warm-up predict returned {out.shape} values, expected {len(X)} finite")
+
+    def load(self) -> bool:
+        """Load, warm up and swap in the newest artifact if it changed.
+
+        Blocking (call from a worker thread). False keeps the current model;
+        an artifact that fails to load or warm up raises once and is not
+        retried until the file changes.
+        """
+        latest = self.registry.latest()
+        if latest is None or latest == self.registry.seen:
+            return False
+        self.registry.seen = latest
+        try:
+            model = load_model(latest[0])
+            began = time.perf_counter()
+            self.warm_up(model)
+        except Exception as e:
+            self.registry.last_error = f"{os.path.basename(latest[0])}: {e}"
+            raise
+        self.registry.warmup_ms = round((time.perf_counter() - began) * 1000, 3)
+        # Single reference swap: running requests hold the model they started with
+        self.model = model
+        self.registry.loaded_at = time.time()
+        self.registry.swaps += 1
+        self.registry.last_error = None
+        return True
+
+    async def _reload(self) -> None:
+        try:
+            if await asyncio.to_thread(self.load):
+                logger.info("Forecast model %s loaded from %s", self.model.version, self.model.path)
+        except Exception as e:  # keep serving the current model
+            logger.warning("Could not load forecast model: %s", self.registry.last_error or e)
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            await self._reload()
+
+    async def start(self) -> None:
+        await self._reload()
+        if isinstance(self.model, PersistenceModel):
+            logger.warning("No forecast model in %s; serving the persistence baseline", self.registry.model_dir)
+        if self.poll_interval > 0 and self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def predict(self, X: np.ndarray, model: Any = None) -> np.ndarray:
+        """Score a feature matrix on the inference pool."""
+        model = model or self.model
+        self.predictions += 1
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="forecast")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, model.predict, X)
+
+    async def current_conditions(self, lat: float, lon: float) -> Dict[str, Optional[float]]:
+        data = await tempo_service.fetch_tempo_data(lat, lon)
+        meas = data.get("measurements", {}) if data else {}
+        current = {p: meas.get(p) for p in INPUT_POLLUTANTS}
+        current["aqi_now"] = compute_aqi({p: v for p, v in current.items() if v is not None})["value"]
+        return current
+
+    async def forecast(self, lat: float, lon: float, hours: int,
+                       now: Optional[datetime] = None, model: Any = None) -> Dict[str, Any]:
+        """Uncached forecast for the exact point."""
+        model = model or self.model  # one model for the whole request, even across a swap
+        start = start_hour(now)
+        current = await self.current_conditions(lat, lon)
+        X = build_features(lat, lon, start, hours, current)
+        if self.batcher is not None:
+            aqi = await self.batcher.submit(model, X)
+        else:
+            aqi = await self.predict(X, model)
+        return self.format(lat, lon, start, aqi, model)
+
+    def _run_hours(self, hours: int) -> int:
+        """Cached run length covering ``hours`` (multiples of FORECAST_RUN_HOURS)."""
+        return -(-hours // self.run_hours) * self.run_hours
+
+    def cache_key(self, lat: float, lon: float, hours: int, now: Optional[datetime] = None,
+                  model: Any = None) -> str:
+        model = model or self.model
+        tile = geohash_encode(lat, lon, self.tile_precision)
+        data = f"{tempo_service.data_version()}:{openaq_service.catalog.version}"
+        return f"{tile}:{self._run_hours(hours)}:{model.version}:{start_hour(now):%Y%m%dT%H}:{data}"
+
+    async def forecast_cached(self, lat: float, lon: float, hours: int,
+                              now: Optional[datetime] = None) -> Tuple[Dict[str, Any], str]:
+        """(forecast, ETag) served from the tile's cached run.
+
+        The run is computed once at the tile centre for ``_run_hours(hours)``
+        horizons; shorter requests get its first ``hours`` predictions.
+        """
+        model = self.model
+        key = self.cache_key(lat, lon, hours, now, model)
+        tile = key.split(":", 1)[0]
+        c_lat, c_lon = geohash_center(tile)
+        run = await self._cache.get_or_load(
+            key, lambda: self.forecast(c_lat, c_lon, self._run_hours(hours), now, model)
+        )
+        data = {
+            **run,
+            "location": {"lat": lat, "lon": lon, "name": f"{lat:.3f}, {lon:.3f}"},
+            "predictions": run["predictions"][:hours],
+            "tile": tile,
+        }
+        etag = '"' + hashlib.sha256(f"{key}:{hours}".encode()).hexdigest()[:32] + '"'
+        return data, etag
+
+    @staticmethod
+    def format(lat: float, lon: float, start: datetime, aqi: np.ndarray, model: Any) -> Dict[str, Any]:
+        horizon = np.arange(1, len(aqi) + 1)
+        values = np.clip(np.rint(aqi), 0, 500).astype(int)
+        confidence = _confidence(model.metrics, horizon)
+        levels = aqi_category_index(values)
+        predictions = []
+        for h, value, conf, level in zip(horizon.tolist(), values.tolist(), confidence.tolist(), levels.tolist()):
+            predictions.append({
+                "hour": h,
+                "timestamp": (start + timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "aqi": value,
+                "confidence": conf,
+                "level": AQI_CATEGORIES[level],
+            })
+        return {
+            "location": {"lat": lat, "lon": lon, "name": f"{lat:.3f}, {lon:.3f}"},
+            "predictions": predictions,
+            "model": f"{model.name} ({model.version})",
+            "modelVersion": model.version,
+            "accuracy": {k: model.metrics[k] for k in ("mae", "rmse", "r2") if k in model.metrics},
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model.name,
+            "version": self.model.version,
+            "path": getattr(self.model, "path", None),
+            "registry": self.registry.stats(),
+            "predictions": self.predictions,
+            **({"batching": self.batcher.stats()} if self.batcher is not None else {}),
+        }
+
+    async def close(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+forecast_service = ForecastService()
@@ -0,0 +1,183 @@
+"""Gridded AQI Service
+
+Evaluates the TEMPO field and the IDW-fused ground field over a whole lat/lon
+grid with NumPy and serializes it as a compact binary raster, so a map view
+needs one request instead of one /api/airquality call per point.
+
+Binary layout (little-endian):
+    header  struct "<4sBBHII4dH": magic b"SKYG", version, band count,
+            projection (0 = regular lat/lon, 1 = Web Mercator rows),
+            width, height, west, south, east, north, band-name byte length
+    names   ASCII band names, comma separated
+    data    float32[band][row][col], rows ordered north -> south, NaN = no data
+
+Ground stations override the satellite value within FUSION_GRID_MAX_DISTANCE_KM
+of a cell; elsewhere the TEMPO value is used. With a fresh local station
+catalog every station in (or within that distance of) the box is used.
+Without it stations come from one radius lookup around the box centre, which
+is capped at 200 km: larger boxes (map zoom < ~7) are rendered from TEMPO
+only rather than fusing the stations near their centre alone.
+
+Environment Variables:
+    GRID_MAX_CELLS                 -> largest grid served per request (default 250000)
+    FUSION_GRID_MAX_DISTANCE_KM    -> ground influence radius on grids (default 25)
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import math
+import os
+import struct
+from datetime import datetime
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+from app.services.openaq_service import STATION_FETCH_LIMIT, openaq_service
+from app.services.tempo_service import tempo_service
+from app.utils.aqi import compute_aqi_array
+from app.utils.cache import AsyncTTLCache
+from app.utils.fusion import StationMatrix, idw_estimate, pack_measurements
+from app.utils.geo import haversine_km
+
+GRID_MAGIC = b"SKYG"
+GRID_VERSION = 1
+PROJECTION_LATLON = 0
+PROJECTION_WEBMERCATOR = 1
+_HEADER = struct.Struct("<4sBBHII4dH")
+
+# Satellite-backed pollutants, then ground-only ones
+TEMPO_BANDS = ("pm25", "o3", "no2", "hcho", "aerosolIndex")
+GROUND_PARAMS = ("pm25", "pm10", "o3", "no2", "so2", "co")
+BANDS = ("aqi",) + TEMPO_BANDS + ("pm10", "so2", "co")
+
+GRID_MAX_CELLS = int(os.getenv("GRID_MAX_CELLS", 250_000))
+GROUND_MAX_DISTANCE_KM = float(os.getenv("FUSION_GRID_MAX_DISTANCE_KM", 25))
+# Largest radius of a single upstream station lookup
+MAX_LOOKUP_RADIUS_KM = 200
+# Cells per IDW chunk (bounds the cells x stations distance matrix)
+_CHUNK = 16384
+
+
+def mercator_tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """(west, south, east, north) of an XYZ Web Mercator tile."""
+    n = 2 ** z
+
+    def lat(row: float) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def mercator_row_centers(z: int, y: int, size: int) -> np.ndarray:
+    """Latitudes of pixel-row centres of a tile, north -> south."""
+    n = 2 ** z
+    rows = y + (np.arange(size) + 0.5) / size
+    return np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * rows / n))))
+
+
+def encode_grid(bands: Dict[str, np.ndarray], bbox: Tuple[float, float, float, float],
+                projection: int = PROJECTION_LATLON) -> bytes:
+    names = ",".join(bands).encode("ascii")
+    first = next(iter(bands.values()))
+    height, width = first.shape
+    header = _HEADER.pack(GRID_MAGIC, GRID_VERSION, len(bands), projection, width, height, *bbox, len(names))
+    data = b"".join(np.ascontiguousarray(b, dtype="<f4").tobytes() for b in bands.values())
+    return header + names + data
+
+
+def decode_grid(payload: bytes) -> Tuple[Dict[str, np.ndarray], Dict[str, object]]:
+    """Inverse of encode_grid (used by tests and Python clients)."""
+    magic, version, count, projection, width, height, west, south, east, north, name_len = _HEADER.unpack_from(payload)
+    if magic != GRID_MAGIC:
+        raise ValueError("not a SkyCast grid payload")
+    offset = _HEADER.size
+    names = payload[offset:offset + name_len].decode("ascii").split(",")
+    offset += name_len
+    data = np.frombuffer(payload, dtype="<f4", offset=offset).reshape(count, height, width)
+    meta = {"version": version, "projection": projection, "width": width, "height": height,
+            "bbox": (west, south, east, north)}
+    return dict(zip(names, data)), meta
+
+
+def ground_field(matrix: StationMatrix, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """IDW estimates (cells x params); NaN where no station is in range."""
+    out = np.full((lat.size, len(matrix.parameters)), np.nan)
+    if len(matrix) == 0:
+        return out
+    for start in range(0, lat.size, _CHUNK):
+        sl = slice(start, start + _CHUNK)
+        d = haversine_km(lat[sl, None], lon[sl, None], matrix.lat[None, :], matrix.lon[None, :])
+        out[sl] = idw_estimate(matrix.values, d, max_distance_km=GROUND_MAX_DISTANCE_KM, fallback=False)
+    return out
+
+
+def render_grid(lat_centers: np.ndarray, lon_centers: np.ndarray, tempo: Dict[str, np.ndarray],
+                matrix: StationMatrix, bands: Sequence[str]) -> Dict[str, np.ndarray]:
+    """Blend ground + satellite fields on the grid and score AQI."""
+    lat, lon = np.meshgrid(lat_centers, lon_centers, indexing="ij")
+    shape = lat.shape
+    ground = ground_field(matrix, lat.ravel(), lon.ravel())
+    fields: Dict[str, np.ndarray] = {}
+    for j, param in enumerate(matrix.parameters):
+        g = ground[:, j].reshape(shape)
+        sat = tempo.get(param)
+        fields[param] = g if sat is None else np.where(np.isnan(g), sat, g)
+    for name in ("hcho", "aerosolIndex"):
+        fields[name] = tempo[name]
+    aqi = compute_aqi_array(**{p: fields[p] for p in matrix.parameters})
+    fields["aqi"] = np.where(aqi["dominant"] >= 0, aqi["value"], np.nan)
+    return {b: fields[b] for b in bands}
+
+
+class GridService:
+    """Renders and caches binary AQI rasters (single-flight per grid key)."""
+
+    def __init__(self):
+        self._cache = AsyncTTLCache("aqi-grid", ttl=300, max_entries=512, max_bytes=128 * 1024 * 1024)
+
+    async def _stations(self, bbox: Tuple[float, float, float, float]) -> StationMatrix:
+        west, south, east, north = bbox
+        snapshot = openaq_service.catalog.snapshot
+        if openaq_service.catalog_fresh:
+            stations = snapshot.in_bbox(west, south, east, north, GROUND_MAX_DISTANCE_KM, GROUND_PARAMS)
+            return pack_measurements(stations, GROUND_PARAMS)
+        c_lat, c_lon = (south + north) / 2, (west + east) / 2
+        # Farthest corner (the one nearer the equator is widest in longitude)
+        reach = float(haversine_km(c_lat, c_lon, north if abs(north) < abs(south) else south, east))
+        radius = math.ceil(reach + GROUND_MAX_DISTANCE_KM)
+        if radius > MAX_LOOKUP_RADIUS_KM:
+            return pack_measurements([], GROUND_PARAMS)  # one lookup can't cover the box
+        data = await openaq_service.get_nearby_stations(
+            c_lat, c_lon, radius, list(GROUND_PARAMS), STATION_FETCH_LIMIT
+        )
+        return pack_measurements(data.get("stations", []), GROUND_PARAMS)
+
+    async def render(
+        self,
+        lat_centers: np.ndarray,
+        lon_centers: np.ndarray,
+        bbox: Tuple[float, float, float, float],
+        bands: Sequence[str],
+        projection: int = PROJECTION_LATLON,
+    ) -> Tuple[bytes, str]:
+        """(payload, strong ETag) for the grid; cached for the current data hour."""
+        hour = datetime.utcnow().strftime("%Y%m%d%H")  # synthetic TEMPO field changes hourly
+        key = ":".join([
+            ",".join(f"{v:.6f}" for v in bbox), str(lat_centers.size), str(lon_centers.size),
+            str(projection), ",".join(bands), hour, str(openaq_service.catalog.version),
+        ])
+
+        async def load() -> Tuple[bytes, str]:
+            matrix = await self._stations(bbox)
+            lat, lon = np.meshgrid(lat_centers, lon_centers, indexing="ij")
+            tempo = await asyncio.to_thread(tempo_service.sample_grid, lat, lon)
+            fields = await asyncio.to_thread(render_grid, lat_centers, lon_centers, tempo, matrix, bands)
+            payload = encode_grid(fields, bbox, projection)
+            return payload, f'"{hashlib.sha256(payload).hexdigest()[:32]}"'
+
+        return await self._cache.get_or_load(key, load)
+
+
+grid_service = GridService()
@@ -0,0 +1,170 @@
+"""Observation History Service
+
+Feeds the local time-series store (``app.services.timeseries_store``) and
+answers history queries from it, so trend views and forecast features never
+need an upstream call:
+
+    - ground stations: every ingest tick records each catalog station's last
+      values at the hour of their ``lastUpdated`` timestamp (series
+      ``station-<id>``); units are as reported by OpenAQ
+    - TEMPO: the prefetch locations and hottest tiles (already kept warm in
+      the TEMPO cache) are recorded at the current hour under their geohash
+      tile (series ``tile-<geohash>``)
+    - segments older than the retention period are pruned each tick
+
+Environment Variables:
+    HISTORY_DIR                        -> store directory (default data/history)
+    HISTORY_INGEST_INTERVAL_SECONDS    -> ingest period (default 900; 0 disables ingestion)
+    HISTORY_RETENTION_DAYS             -> days of history kept (default 90)
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.services.openaq_service import openaq_service
+from app.services.prefetch_service import prefetch_service
+from app.services.tempo_service import tempo_service
+from app.services.timeseries_store import AGGREGATES, PARAMETERS, Record, TimeSeriesStore
+from app.utils.geo import geohash_encode
+
+logger = logging.getLogger(__name__)
+
+# Longest range a single query may scan
+MAX_QUERY_DAYS = 93
+
+
+def station_series(station_id: Any) -> str:
+    return f"station-{station_id}"
+
+
+def tile_series(lat: float, lon: float) -> str:
+    return f"tile-{geohash_encode(lat, lon, openaq_service.tile_precision)}"
+
+
+def _parse_time(value: Any) -> Optional[datetime]:
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def station_records(stations: Sequence[Dict[str, Any]]) -> List[Record]:
+    """One record per (station, observation hour) from catalog station entries."""
+    records = []
+    for s in stations:
+        if s.get("stationId") is None:
+            continue
+        by_time: Dict[datetime, Dict[str, float]] = {}
+        for m in s.get("measurements", []):
+            observed = _parse_time(m.get("lastUpdated"))
+            if observed is not None and isinstance(m.get("value"), (int, float)):
+                by_time.setdefault(observed, {})[m.get("parameter")] = m["value"]
+        records.extend((station_series(s["stationId"]), ts, values) for ts, values in by_time.items())
+    return records
+
+
+class HistoryService:
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or os.getenv("HISTORY_DIR", "data/history")
+        self.interval = float(os.getenv("HISTORY_INGEST_INTERVAL_SECONDS", 900))
+        self.retention_days = int(os.getenv("HISTORY_RETENTION_DAYS", 90))
+        self._store: Optional[TimeSeriesStore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._catalog_version = 0  # last catalog snapshot ingested
+        self.ticks = 0
+        self.failures = 0
+
+    @property
+    def store(self) -> TimeSeriesStore:
+        if self._store is None:
+            self._store = TimeSeriesStore(self.root)
+        return self._store
+
+    # ---------- ingestion ----------
+    async def ingest_stations(self) -> int:
+        """Record the loaded station catalog (once per catalog version)."""
+        snapshot = openaq_service.catalog.snapshot
+        if snapshot is None or snapshot.version == self._catalog_version:
+            return 0
+        self._catalog_version = snapshot.version
+        return await asyncio.to_thread(self.store.append, station_records(snapshot.stations))
+
+    async def ingest_tiles(self, now: Optional[datetime] = None) -> int:
+        """Record TEMPO values for the prefetched points (served from the TEMPO cache)."""
+        now = now or datetime.now(timezone.utc)
+        points = [(loc["lat"], loc["lon"]) for loc in prefetch_service.locations]
+        points += [p for p in prefetch_service.top_points() if p not in points]
+        records: List[Record] = []
+        for lat, lon in points:
+            data = await tempo_service.fetch_tempo_data(lat, lon)
+            if data and not data.get("stale"):
+                records.append((tile_series(lat, lon), now, data.get("measurements", {})))
+        return await asyncio.to_thread(self.store.append, records)
+
+    async def tick(self) -> int:
+        stored = await self.ingest_stations() + await self.ingest_tiles()
+        await asyncio.to_thread(self.store.prune, self.retention_days)
+        self.ticks += 1
+        return stored
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.tick()
+            except Exception:  # keep the loop alive
+                self.failures += 1
+                logger.exception("History ingest failed")
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # ---------- queries ----------
+    def query(self, series: str, start: datetime, end: datetime,
+              parameters: Optional[Sequence[str]] = None,
+              aggregates: Sequence[str] = tuple(AGGREGATES)) -> Dict[str, Any]:
+        """Hourly values + rolling aggregates for ``start <= t < end`` (columnar, NaN -> null)."""
+        if end - start > timedelta(days=MAX_QUERY_DAYS):
+            raise ValueError(f"range longer than {MAX_QUERY_DAYS} days")
+        parameters = [p for p in parameters or PARAMETERS if p in PARAMETERS]
+        times, values = self.store.scan(series, start, end, parameters)
+        rolled = {}
+        for name in aggregates:
+            parameter, window = AGGREGATES[name]
+            _, means = self.store.rolling_mean(series, parameter, window, start, end)
+            rolled[name] = np.round(means, 2).tolist()
+        return {
+            "series": series,
+            "timestamps": [f"{t}:00:00Z" for t in times.astype(str)],
+            "values": {p: np.round(values[:, i].astype(float), 3).tolist() for i, p in enumerate(parameters)},
+            "aggregates": rolled,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "ticks": self.ticks,
+            "failures": self.failures,
+            **(self._store.stats() if self._store is not None else {"root": self.root}),
+        }
+
+
+history_service = HistoryService()
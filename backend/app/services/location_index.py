@@ -0,0 +1,222 @@
+"""Local Location Search Index
+
+Answers ``/api/openaq/cities`` autocomplete from memory instead of an
+upstream ``/locations`` query per keystroke. Built from the station catalog
+(``StationCatalog``) whenever it is refreshed and persisted next to it, so a
+restart loads the index without crawling OpenAQ.
+
+Structure (all built once, immutable afterwards):
+    entries     one record per distinct (name, country), in catalog order
+                (most recently updated first); the record shape matches the
+                upstream search results (id, name, country, city, lat, lon)
+    words       sorted array of the lower-cased, accent-folded words of each
+                name and city -> prefix queries are two binary searches
+    trigrams    CSR posting lists (trigram -> entry ids) for substring queries
+    countries   one bitmap per country code, ANDed with the candidates
+
+Ranking: exact name, name prefix, word prefix, substring; ties keep catalog
+order. ``limit`` applies after de-duplication, so results are never short.
+"""
+from __future__ import annotations
+
+import json
+import os
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+INDEX_FORMAT = 1
+
+
+def normalize(text: Optional[str]) -> str:
+    """Lower-case and strip accents ("São Paulo" -> "sao paulo")."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold().strip()
+
+
+def _words(text: str) -> List[str]:
+    return [w for w in "".join(c if c.isalnum() else " " for c in text).split() if w]
+
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _rank(name: str, query: str) -> int:
+    """0 exact name, 1 name prefix, 2 word prefix (name or city), 3 substring."""
+    if name == query:
+        return 0
+    if name.startswith(query):
+        return 1
+    if query in name and f" {query}" not in f" {name}":
+        return 3
+    return 2
+
+
+class LocationIndex:
+    def __init__(
+        self,
+        entries: List[Dict[str, Any]],
+        names: np.ndarray,
+        words: np.ndarray,
+        word_ids: np.ndarray,
+        grams: np.ndarray,
+        gram_offsets: np.ndarray,
+        gram_ids: np.ndarray,
+        countries: Dict[str, np.ndarray],
+    ):
+        self.entries = entries
+        self._names = names            # normalized names, aligned with entries
+        self._words = words            # sorted words
+        self._word_ids = word_ids      # entry id of each word
+        self._grams = grams            # sorted trigrams
+        self._gram_offsets = gram_offsets
+        self._gram_ids = gram_ids
+        self._countries = countries    # code -> bool mask over entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def ready(self) -> bool:
+        return len(self.entries) > 0
+
+    # ---------- build ----------
+    @classmethod
+    def build(cls, stations: Iterable[Dict[str, Any]]) -> "LocationIndex":
+        entries: List[Dict[str, Any]] = []
+        seen = set()
+        for s in stations:
+            if s.get("lat") is None or s.get("lon") is None or not s.get("name"):
+                continue
+            key = (s["name"], s.get("country"))
+            if key in seen:
+                continue
+            seen.add(key)
+            entries.append({
+                "id": s.get("stationId", s.get("id")),
+                "name": s["name"],
+                "country": s.get("country"),
+                "city": s.get("city"),
+                "lat": s["lat"],
+                "lon": s["lon"],
+            })
+
+        names = [normalize(e["name"]) for e in entries]
+        word_pairs = sorted(
+            (w, i)
+            for i, e in enumerate(entries)
+            for w in set(_words(names[i]) + _words(normalize(e.get("city"))))
+        )
+        postings: Dict[str, List[int]] = {}
+        for i, name in enumerate(names):
+            for gram in _trigrams(name):
+                postings.setdefault(gram, []).append(i)
+        grams = sorted(postings)
+        offsets = np.cumsum([0] + [len(postings[g]) for g in grams]).astype(np.int64)
+        ids = np.array([i for g in grams for i in postings[g]], dtype=np.int32)
+
+        codes = np.array([(e.get("country") or "").upper() for e in entries])
+        countries = {code: codes == code for code in set(codes.tolist()) if code}
+        return cls(
+            entries,
+            np.array(names, dtype=str),
+            np.array([w for w, _ in word_pairs], dtype=str),
+            np.array([i for _, i in word_pairs], dtype=np.int32),
+            np.array(grams, dtype=str),
+            offsets,
+            ids,
+            countries,
+        )
+
+    # ---------- query ----------
+    def _word_prefix(self, prefix: str) -> np.ndarray:
+        lo = np.searchsorted(self._words, prefix, side="left")
+        hi = np.searchsorted(self._words, prefix + "\U0010ffff", side="left")
+        return np.unique(self._word_ids[lo:hi])
+
+    def _substring(self, query: str) -> np.ndarray:
+        """Entries whose name contains ``query`` (trigram candidates, then verified)."""
+        candidates: Optional[np.ndarray] = None
+        for gram in _trigrams(query):
+            pos = np.searchsorted(self._grams, gram)
+            if pos >= len(self._grams) or self._grams[pos] != gram:
+                return np.empty(0, dtype=np.int32)
+            ids = self._gram_ids[self._gram_offsets[pos]:self._gram_offsets[pos + 1]]
+            candidates = ids if candidates is None else np.intersect1d(candidates, ids, assume_unique=True)
+            if not candidates.size:
+                return candidates
+        if candidates is None:
+            return np.empty(0, dtype=np.int32)
+        return np.array([i for i in candidates if query in self._names[i]], dtype=np.int32)
+
+    def search(self, query: Optional[str] = None, country: Optional[str] = None,
+               limit: int = 20) -> List[Dict[str, Any]]:
+        q = normalize(query)
+        mask = self._countries.get(country.upper()) if country else None
+        if country and mask is None:
+            return []
+        if not q:
+            ids = np.flatnonzero(mask) if mask is not None else np.arange(len(self.entries))
+            return [self.entries[i] for i in ids[:limit]]
+
+        words = _words(q)
+        matched = self._word_prefix(words[-1]) if words else np.empty(0, dtype=np.int32)
+        for word in words[:-1]:  # every word must start a word of the name or city
+            matched = np.intersect1d(matched, self._word_prefix(word))
+        if len(q) >= 3:
+            matched = np.union1d(matched, self._substring(q))
+        matched = matched.astype(np.intp)
+        if mask is not None:
+            matched = matched[mask[matched]]
+        if not matched.size:
+            return []
+        rank = np.array([_rank(name, q) for name in self._names[matched]])
+        order = np.lexsort((matched, rank))[:limit]
+        return [self.entries[i] for i in matched[order]]
+
+    # ---------- persistence ----------
+    def save(self, path: str) -> None:
+        tmp = f"{path}.tmp.npz"
+        np.savez(
+            tmp,
+            format=np.array(INDEX_FORMAT),
+            entries=np.array(json.dumps(self.entries)),
+            names=self._names,
+            words=self._words,
+            word_ids=self._word_ids,
+            grams=self._grams,
+            gram_offsets=self._gram_offsets,
+            gram_ids=self._gram_ids,
+            country_codes=np.array(sorted(self._countries), dtype=str),
+            country_bits=np.array([np.packbits(self._countries[c]) for c in sorted(self._countries)],
+                                  dtype=np.uint8).reshape(len(self._countries), (len(self.entries) + 7) // 8),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LocationIndex":
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["format"]) != INDEX_FORMAT:
+                raise ValueError(f"unsupported location index format in {path}")
+            entries = json.loads(str(data["entries"]))
+            n = len(entries)
+            countries = {
+                str(code): np.unpackbits(bits, count=n).astype(bool)
+                for code, bits in zip(data["country_codes"], data["country_bits"])
+            }
+            return cls(entries, data["names"], data["words"], data["word_ids"], data["grams"],
+                       data["gram_offsets"], data["gram_ids"], countries)
+
+    @classmethod
+    def empty(cls) -> "LocationIndex":
+        return cls.build(())
+
+
+def build_index(stations: Sequence[Dict[str, Any]], path: Optional[str] = None) -> LocationIndex:
+    """Build (and persist when ``path`` is given) the index for a station list."""
+    index = LocationIndex.build(stations)
+    if path:
+        index.save(path)
+    return index
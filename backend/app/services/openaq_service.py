@@ -1,27 +1,131 @@
+"""OpenAQ Ground Station Service
+
+Environment Variables:
+    OPENAQ_BASE_URL                   -> API root (default OpenAQ v2)
+    OPENAQ_TILE_PRECISION             -> geohash precision of the station cache grid
+    STATION_CATALOG_PATH              -> JSON snapshot of the local station catalog
+                                         (loaded at startup, rewritten on refresh)
+    STATION_CATALOG_REFRESH_SECONDS   -> background catalog refresh period (0 = off)
+    STATION_CATALOG_MAX_PAGES         -> /locations pages crawled per refresh
+    STATION_CATALOG_MAX_AGE_SECONDS   -> older catalogs are only a fallback for failed
+                                         tile lookups, marked stale (default 21600; 0 = never)
+    LOCATION_INDEX_PATH               -> persisted city/location search index
+                                         (default <STATION_CATALOG_PATH>.search.npz)
+    OPENAQ_LATENCY_BUDGET_S           -> per-request budget for /locations lookups (default 4)
+    OPENAQ_STALE_SECONDS              -> how long expired station tiles may be served
+                                         (marked stale) while refreshing (default 3600)
+    OPENAQ_RATE_PER_MINUTE            -> upstream request quota (default 60)
+    OPENAQ_RATE_BURST                 -> requests allowed back to back (default 10)
+    OPENAQ_QUEUE_LIMIT                -> waiting requests per priority lane (default 64)
+    OPENAQ_INTERACTIVE_MAX_WAIT_S     -> longest queueing for user-facing lookups (default 2)
+"""
 from __future__ import annotations
 
+import asyncio
+import logging
 import os
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+import math
 import httpx
-from math import radians, sin, cos, acos
+import numpy as np
+
+from app.services.location_index import LocationIndex, build_index
+from app.services.station_catalog import StationCatalog
+from app.utils.cache import build_cache
+from app.utils.geo import bucket_radius, geohash_center, geohash_encode, geohash_reach_km, haversine_km
+from app.utils.http import close_client, http_client
+from app.utils.resilience import Upstream
+from app.utils.scheduler import BATCH, RequestScheduler, parse_retry_after, request_lane
 
 SUPPORTED_PARAMETERS = {"pm25", "pm10", "o3", "no2", "so2", "co", "bc"}
+# Parameters requested when callers don't pass any
+DEFAULT_PARAMETERS = ["pm25", "pm10", "o3", "no2"]
+
+# Stations requested per tile fetch (ordered by distance from the tile centre)
+STATION_FETCH_LIMIT = 100
+# Page size for catalog crawls
+CATALOG_PAGE_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def _has_stations(data: Dict[str, Any]) -> bool:
+    return "error" not in data
 
 
 class OpenAQService:
     def __init__(self):
         self.base_url = os.getenv("OPENAQ_BASE_URL", "https://api.openaq.org/v2")
+        # Explicit client override (tests); otherwise the shared pooled client
         self._client: Optional[httpx.AsyncClient] = None
-        self._countries_cache: Optional[Dict[str, Any]] = None
-        self._countries_cache_ts: Optional[float] = None
-        self._cache_ttl = 3600  # seconds
+        # Geohash precision of the station cache grid (5 -> ~4.9 km cells)
+        self.tile_precision = int(os.getenv("OPENAQ_TILE_PRECISION", 5))
+        # Two-tier caches (in-process L1, shared Redis L2 when configured)
+        self._stations_cache = build_cache(
+            "openaq-stations", ttl=600, max_entries=4096,
+            stale_ttl=float(os.getenv("OPENAQ_STALE_SECONDS", 3600)),
+        )
+        self._cities_cache = build_cache("openaq-cities", ttl=3600, max_entries=2048)
+        self._countries_cache = build_cache("openaq-countries", ttl=3600, max_entries=1)
+        # Last good country list, served if the upstream fails after expiry
+        self._countries_fallback: List[Dict[str, str]] = []
+        # Local station catalog answers nearby lookups without upstream calls once loaded
+        self.catalog = StationCatalog()
+        self.catalog_path = os.getenv("STATION_CATALOG_PATH")
+        self.catalog_refresh_seconds = float(os.getenv("STATION_CATALOG_REFRESH_SECONDS", 0))
+        self.catalog_max_pages = int(os.getenv("STATION_CATALOG_MAX_PAGES", 20))
+        self.catalog_max_age = float(os.getenv("STATION_CATALOG_MAX_AGE_SECONDS", 6 * 3600))
+        self._catalog_task: Optional[asyncio.Task] = None
+        # City/location autocomplete index, rebuilt with the catalog
+        self.locations = LocationIndex.empty()
+        self.location_index_path = os.getenv("LOCATION_INDEX_PATH") or (
+            f"{self.catalog_path}.search.npz" if self.catalog_path else None
+        )
+        # Circuit breaker + latency budgets: a slow OpenAQ fails fast instead of
+        # holding every request for the full client timeout
+        self.upstream = Upstream(
+            "openaq",
+            budgets={
+                "/locations": float(os.getenv("OPENAQ_LATENCY_BUDGET_S", 4)),
+                "/countries": 6.0,
+            },
+        )
+        # Background catalog crawls get their own breaker: a failing crawl must
+        # not open the circuit for interactive lookups (and vice versa)
+        self.catalog_upstream = Upstream("openaq-catalog", budgets={"catalog": 60.0})
+        # Request quota shared by all callers; interactive lookups go first,
+        # batch jobs and prefetch use what is left
+        self.scheduler = RequestScheduler(
+            "openaq",
+            rate=float(os.getenv("OPENAQ_RATE_PER_MINUTE", 60)) / 60,
+            burst=float(os.getenv("OPENAQ_RATE_BURST", 10)),
+            queue_limit=int(os.getenv("OPENAQ_QUEUE_LIMIT", 64)),
+            max_wait={"interactive": float(os.getenv("OPENAQ_INTERACTIVE_MAX_WAIT_S", 2))},
+        )
 
     @property
     def client(self) -> httpx.AsyncClient:
-        if self._client is None:
-            headers = {"User-Agent": "SkyCast/1.0 (https://github.com/skycast)"}
-            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=15.0, headers=headers)
-        return self._client
+        if self._client is not None:
+            return self._client
+        headers = {"User-Agent": "SkyCast/1.0 (https://github.com/skycast)"}
+        return http_client("openaq", base_url=self.base_url, timeout=15.0, headers=headers)
+
+    async def _get(self, path: str, params: Dict[str, Any], endpoint: Optional[str] = None,
+                   upstream: Optional[Upstream] = None) -> httpx.Response:
+        """GET through the rate limiter and circuit breaker (``self.upstream`` unless given).
+
+        Raises httpx errors, including fail-fast rejections (open circuit,
+        rate-limit queue over budget).
+        """
+        async def request() -> httpx.Response:
+            resp = await self.client.get(path, params=params)
+            if resp.status_code == 429:
+                self.scheduler.retry_after(parse_retry_after(resp.headers.get("Retry-After")))
+            resp.raise_for_status()
+            return resp
+
+        await self.scheduler.acquire()
+        return await (upstream or self.upstream).call(endpoint or path, request)
 
     async def get_nearby_stations(
         self,
@@ -33,15 +137,131 @@ class OpenAQService:
     ) -> Dict[str, Any]:
         """Fetch nearest stations with latest measurements.
 
-        Uses the OpenAQ locations endpoint to retrieve stations & related parameters.
-        A second query (latest) can fetch freshest datapoints if needed.
+        When the local station catalog is loaded (and younger than its max
+        age) the lookup is a BallTree radius query with no network call.
+        Otherwise queries are snapped to a geohash tile: the station set
+        covering the tile (plus the requested radius) is fetched from the
+        OpenAQ locations endpoint once and cached, then distances, radius
+        filtering and ordering are computed locally for the exact query point.
+        An outdated catalog still answers, marked stale, if that fetch fails.
         """
         if parameters:
             # Sanitize & filter
             param_set = [p.lower() for p in parameters if p.lower() in SUPPORTED_PARAMETERS]
         else:
-            param_set = ["pm25", "pm10", "o3", "no2"]
+            param_set = list(DEFAULT_PARAMETERS)
+
+        snapshot = self.catalog.snapshot
+        from_catalog = None
+        if snapshot is not None and len(snapshot):
+            stations = snapshot.nearby(lat, lon, radius_km, limit, param_set)
+            from_catalog = {
+                "stations": stations,
+                "summary": self._summarize(stations),
+                "parameters": param_set,
+                "source": "OpenAQ",
+                "catalogVersion": snapshot.version,
+            }
+            if self.catalog_fresh:
+                return from_catalog
+
+        tile_data = await self.get_tile_stations(lat, lon, radius_km, param_set)
+        if "error" in tile_data:
+            if from_catalog is not None:
+                return {**from_catalog, "stale": True}  # outdated stations beat none
+            return {"stations": [], "error": tile_data["error"]}
+
+        stations = self._select_stations(tile_data["stations"], lat, lon, radius_km, limit)
+        result = {
+            "stations": stations,
+            "summary": self._summarize(stations),
+            "parameters": param_set,
+            "source": "OpenAQ",
+        }
+        if tile_data.get("stale"):
+            result["stale"] = True
+        return result
+
+    async def get_nearby_stations_adaptive(
+        self,
+        lat: float,
+        lon: float,
+        radius_km: int = 10,
+        limit: int = 10,
+        expansions: int = 3,
+        max_radius_km: int = 200,
+    ) -> Tuple[Dict[str, Any], int, int]:
+        """Nearest stations with an adaptively widened radius, in one lookup.
+
+        Equivalent to retrying with radius r, 2r, 4r, ... (capped) until a station
+        with measurements is found, but issues a single query at the widest
+        radius and picks the effective radius locally. Because results are
+        ordered by distance, the stations within each smaller radius are a
+        prefix of the wide result.
+
+        Returns (data, radius_used_km, attempts) where ``attempts`` is the
+        number of radii the sequential search would have tried.
+        """
+        ladder = [radius_km]
+        for _ in range(expansions):
+            ladder.append(min(int(ladder[-1] * 2), max_radius_km))
+
+        wide = await self.get_nearby_stations(lat, lon, ladder[-1], None, limit)
+        stations = wide.get("stations", [])
+        for attempt, radius in enumerate(ladder, start=1):
+            within = [s for s in stations if s["distance"] <= radius]
+            if any(s.get("measurements") for s in within):
+                return {**wide, "stations": within, "summary": self._summarize(within)}, radius, attempt
+        return wide, ladder[-1], len(ladder)
+
+    async def get_tile_stations(
+        self,
+        lat: float,
+        lon: float,
+        radius_km: float,
+        param_set: List[str],
+        refresh: bool = False,
+    ) -> Dict[str, Any]:
+        """Cached station set covering every point of the query's tile within ``radius_km``.
+
+        An expired tile is still returned (with ``stale: True``) during its
+        stale window while one background fetch replaces it.
+        ``refresh=True`` reloads a cached tile in place (used by the prefetcher).
+        """
+        tile = geohash_encode(lat, lon, self.tile_precision)
+        radius_bucket = bucket_radius(radius_km)
+        key = self._tile_key(tile, radius_bucket, param_set)
+
+        async def load() -> Dict[str, Any]:
+            c_lat, c_lon = geohash_center(tile)
+            fetch_radius = radius_bucket + math.ceil(geohash_reach_km(tile))
+            return await self._fetch_stations(c_lat, c_lon, fetch_radius, param_set, STATION_FETCH_LIMIT)
+
+        stale = False
+        if refresh:
+            data = await self._stations_cache.refresh(key, load, should_cache=_has_stations)
+        else:
+            data, stale = await self._stations_cache.get_or_load_stale(key, load, should_cache=_has_stations)
+        return {**data, "tile": tile, **({"stale": True} if stale else {})}
 
+    def _tile_key(self, tile: str, radius_bucket: int, param_set: List[str]) -> str:
+        return f"{tile}:{radius_bucket}:{','.join(sorted(param_set))}"
+
+    def tile_ttl_remaining(self, lat: float, lon: float, radius_km: float,
+                           param_set: Optional[List[str]] = None) -> Optional[float]:
+        """Seconds before the cached station tile for a point expires (None if not cached)."""
+        tile = geohash_encode(lat, lon, self.tile_precision)
+        key = self._tile_key(tile, bucket_radius(radius_km), param_set or DEFAULT_PARAMETERS)
+        return self._stations_cache.ttl_remaining(key)
+
+    async def _fetch_stations(
+        self,
+        lat: float,
+        lon: float,
+        radius_km: int,
+        param_set: List[str],
+        limit: int,
+    ) -> Dict[str, Any]:
         params = {
             "coordinates": f"{lat},{lon}",
             "radius": radius_km * 1000,  # meters
@@ -53,87 +273,116 @@ class OpenAQService:
         }
 
         try:
-            resp = await self.client.get("/locations", params=params)
-            resp.raise_for_status()
+            resp = await self._get("/locations", params)
         except httpx.HTTPError as e:
             return {"stations": [], "error": f"OpenAQ fetch failed: {e}"}
 
-        payload = resp.json()
-        results = payload.get("results", [])
+        results = resp.json().get("results", [])
+        return {"stations": [self._parse_station(r) for r in results]}
 
-        stations = []
-        parameter_stats: Dict[str, Dict[str, float]] = {}
+    def _parse_station(self, r: Dict[str, Any]) -> Dict[str, Any]:
+        coords = r.get("coordinates") or {}
+        measurements = []
+        for m in r.get("parameters", []):
+            value = m.get("lastValue")
+            if value is None:
+                continue
+            measurements.append({
+                "parameter": m.get("parameter"),
+                "value": value,
+                "unit": m.get("unit"),
+                "lastUpdated": m.get("lastUpdated"),
+            })
+        return {
+            "stationId": r.get("id"),
+            "name": r.get("name"),
+            "lat": coords.get("latitude"),
+            "lon": coords.get("longitude"),
+            "measurements": measurements,
+            "country": r.get("country"),
+            "city": r.get("city"),
+            "sources": r.get("sources"),
+        }
 
-        for r in results:
-            coords = r.get("coordinates") or {}
-            measurements = []
-            parameters_meta = r.get("parameters", [])
-            for m in parameters_meta:
-                param_name = m.get("parameter")
-                value = m.get("lastValue")
-                if value is None:
-                    continue
-                unit = m.get("unit")
-                last_updated = m.get("lastUpdated")
-
-                measurements.append({
-                    "parameter": param_name,
-                    "value": value,
-                    "unit": unit,
-                    "lastUpdated": last_updated,
-                })
-
-                # Aggregate stats
-                stats = parameter_stats.setdefault(param_name, {"sum": 0.0, "count": 0, "max": value, "min": value})
+    def _select_stations(
+        self,
+        stations: List[Dict[str, Any]],
+        lat: float,
+        lon: float,
+        radius_km: float,
+        limit: int,
+    ) -> List[Dict[str, Any]]:
+        """Exact-point distance filter + ordering over a cached station set."""
+        located = [s for s in stations if s.get("lat") is not None and s.get("lon") is not None]
+        if not located:
+            return []
+        distances = haversine_km(
+            lat, lon,
+            np.array([s["lat"] for s in located], dtype=float),
+            np.array([s["lon"] for s in located], dtype=float),
+        )
+        order = np.argsort(distances, kind="stable")
+        selected = []
+        for i in order[:limit]:
+            d = float(distances[i])
+            if d > radius_km:
+                break
+            selected.append({**located[i], "distance": round(d, 2)})
+        return selected
+
+    def _summarize(self, stations: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        parameter_stats: Dict[str, Dict[str, float]] = {}
+        for s in stations:
+            for m in s.get("measurements", []):
+                value = m["value"]
+                stats = parameter_stats.setdefault(m["parameter"], {"sum": 0.0, "count": 0, "max": value, "min": value})
                 stats["sum"] += value
                 stats["count"] += 1
                 stats["max"] = max(stats["max"], value)
                 stats["min"] = min(stats["min"], value)
 
-            # Distance is provided by API ordering; compute fallback distance if not present
-            distance_km = self._haversine(lat, lon, coords.get("latitude"), coords.get("longitude")) if coords else None
-            stations.append({
-                "stationId": r.get("id"),
-                "name": r.get("name"),
-                "lat": coords.get("latitude"),
-                "lon": coords.get("longitude"),
-                "distance": round(distance_km, 2) if distance_km else r.get("distance"),
-                "measurements": measurements,
-                "country": r.get("country"),
-                "city": r.get("city"),
-                "sources": r.get("sources"),
-            })
-
         # Convert stats to avg structure
-        summary = {p: {
+        return {p: {
             "avg": round(v["sum"] / v["count"], 2) if v["count"] else None,
             "max": v["max"],
             "min": v["min"],
             "count": v["count"],
         } for p, v in parameter_stats.items()}
 
-        return {
-            "stations": stations,
-            "summary": summary,
-            "parameters": param_set,
-            "source": "OpenAQ",
-        }
-
     async def search_cities(
         self,
         query: Optional[str] = None,
         country: Optional[str] = None,
         limit: int = 20,
     ) -> List[Dict[str, Any]]:
-        """Search available locations (cities/stations) via OpenAQ.
+        """Search available locations (cities/stations).
+
+        Answered from the local location index once the station catalog is
+        loaded; otherwise via OpenAQ (cached per query).
 
         Filters:
           - query: part of location name (case-insensitive)
           - country: 2-letter ISO code
         Returns simplified list for UI selection.
         """
+        if self.locations.ready:
+            return self.locations.search(query, country, limit)
+        key = f"{(query or '').lower()}:{(country or '').upper()}:{limit}"
+        return await self._cities_cache.get_or_load(
+            key,
+            lambda: self._fetch_cities(query, country, limit),
+            should_cache=bool,
+        )
+
+    async def _fetch_cities(
+        self,
+        query: Optional[str],
+        country: Optional[str],
+        limit: int,
+    ) -> List[Dict[str, Any]]:
         params = {
-            "limit": limit,
+            # Over-fetch: many stations share a name, limit applies after de-duplication
+            "limit": min(limit * 5, CATALOG_PAGE_SIZE),
             "sort": "desc",
             "order_by": "lastUpdated",
         }
@@ -143,8 +392,7 @@ class OpenAQService:
             params["location"] = query  # OpenAQ matches location names
 
         try:
-            resp = await self.client.get("/locations", params=params)
-            resp.raise_for_status()
+            resp = await self._get("/locations", params)
         except httpx.HTTPError as e:
             return []
         data = resp.json().get("results", [])
@@ -167,44 +415,106 @@ class OpenAQService:
             if key not in seen and item["lat"] is not None and item["lon"] is not None:
                 seen.add(key)
                 unique.append(item)
-        return unique
+        return unique[:limit]
 
     async def list_countries(self) -> List[Dict[str, str]]:
-        import time
-        now = time.time()
-        if self._countries_cache and self._countries_cache_ts and now - self._countries_cache_ts < self._cache_ttl:
-            return self._countries_cache  # type: ignore
         try:
-            resp = await self.client.get("/countries", params={"limit": 300, "order_by": "name", "sort": "asc"})
-            resp.raise_for_status()
-            data = resp.json().get("results", [])
-            simplified = [
-                {"code": c.get("code"), "name": c.get("name")}
-                for c in data if c.get("code") and c.get("name")
-            ]
-            self._countries_cache = simplified  # type: ignore
-            self._countries_cache_ts = now
-            return simplified
+            countries = await self._countries_cache.get_or_load("all", self._fetch_countries)
         except httpx.HTTPError:
-            return self._countries_cache or []  # fallback to stale if present
+            return self._countries_fallback  # fallback to stale if present
+        self._countries_fallback = countries
+        return countries
+
+    async def _fetch_countries(self) -> List[Dict[str, str]]:
+        resp = await self._get("/countries", {"limit": 300, "order_by": "name", "sort": "asc"})
+        data = resp.json().get("results", [])
+        return [
+            {"code": c.get("code"), "name": c.get("name")}
+            for c in data if c.get("code") and c.get("name")
+        ]
 
     async def get_nearest_station(self, lat: float, lon: float) -> Optional[Dict[str, Any]]:
         data = await self.get_nearby_stations(lat, lon, 25, None, 1)
         stations = data.get("stations") if isinstance(data, dict) else []
         return stations[0] if stations else None
 
-    def _haversine(self, lat1, lon1, lat2, lon2) -> float:
-        if None in (lat1, lon1, lat2, lon2):
-            return 0.0
-        # Radius of Earth in km
-        R = 6371
-        lat1_r, lon1_r, lat2_r, lon2_r = map(radians, [lat1, lon1, lat2, lon2])
-        return acos(min(1, sin(lat1_r) * sin(lat2_r) + cos(lat1_r) * cos(lat2_r) * cos(lon2_r - lon1_r))) * R
+    # ---------- Local station catalog ----------
+    @property
+    def catalog_fresh(self) -> bool:
+        return self.catalog.fresh(self.catalog_max_age)
+
+    async def refresh_catalog(self) -> int:
+        """Crawl /locations and swap in a freshly indexed catalog; returns station count."""
+        stations: List[Dict[str, Any]] = []
+        for page in range(1, self.catalog_max_pages + 1):
+            with request_lane(BATCH):
+                resp = await self._get("/locations", {
+                    "limit": CATALOG_PAGE_SIZE,
+                    "page": page,
+                    "entity": "government",
+                    "order_by": "lastUpdated",
+                    "sort": "desc",
+                }, endpoint="catalog", upstream=self.catalog_upstream)
+            results = resp.json().get("results", [])
+            stations.extend(self._parse_station(r) for r in results)
+            if len(results) < CATALOG_PAGE_SIZE:
+                break
+        if not stations:
+            return 0
+        # Tree and index builds are CPU-bound; keep them off the event loop
+        await asyncio.to_thread(self.catalog.swap, stations)
+        self.locations = await asyncio.to_thread(build_index, stations, self.location_index_path)
+        if self.catalog_path:
+            await asyncio.to_thread(self.catalog.save_file, self.catalog_path)
+        return len(stations)
+
+    async def start_catalog(self) -> None:
+        """Load the persisted catalog and start the refresh loop (if enabled)."""
+        if self.catalog_path:
+            try:
+                await asyncio.to_thread(self.catalog.load_file, self.catalog_path)
+            except (OSError, ValueError) as e:
+                logger.warning("Could not load station catalog %s: %s", self.catalog_path, e)
+        await self._load_locations()
+        if self.catalog_refresh_seconds > 0 and self._catalog_task is None:
+            self._catalog_task = asyncio.create_task(self._catalog_loop())
+
+    async def _load_locations(self) -> None:
+        """Persisted search index if present, else one built from the loaded catalog."""
+        path = self.location_index_path
+        if path and os.path.exists(path):
+            try:
+                self.locations = await asyncio.to_thread(LocationIndex.load, path)
+                return
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Could not load location index %s: %s", path, e)
+        snapshot = self.catalog.snapshot
+        if snapshot is not None and len(snapshot):
+            self.locations = await asyncio.to_thread(build_index, snapshot.stations, path)
+
+    async def _catalog_loop(self) -> None:
+        while True:
+            try:
+                count = await self.refresh_catalog()
+                logger.info("Station catalog refreshed: %s stations", count)
+            except Exception as e:  # keep serving the previous snapshot
+                logger.warning("Station catalog refresh failed: %s", e)
+            await asyncio.sleep(self.catalog_refresh_seconds)
+
+    async def stop_catalog(self) -> None:
+        if self._catalog_task is not None:
+            self._catalog_task.cancel()
+            try:
+                await self._catalog_task
+            except asyncio.CancelledError:
+                pass
+            self._catalog_task = None
 
     async def close(self):
         if self._client:
             await self._client.aclose()
             self._client = None
+        await close_client("openaq")
 
 
 openaq_service = OpenAQService()
@@ -0,0 +1,190 @@
+"""Prefetch / Warm-up Scheduler
+
+Background task (started from the FastAPI lifespan) that keeps popular
+locations hot in the TEMPO and OpenAQ station caches:
+
+    - routes ``record()`` each point query; counts are kept per geohash tile
+      with exponential decay so the ranking follows current traffic
+    - every tick the configured locations plus the top-N tiles are refreshed
+      when their cache entries are missing or within the refresh margin of
+      expiry; refreshes replace entries in place, so readers keep getting the
+      old value meanwhile (stale-while-revalidate)
+    - the first tick runs at startup, pre-warming the configured list; the
+      lifespan waits for it (up to PREFETCH_STARTUP_TIMEOUT_SECONDS) so those
+      locations are warm before the first request is served
+
+Environment Variables:
+    PREFETCH_ENABLED                 -> 0 disables the scheduler (default 1)
+    PREFETCH_LOCATIONS               -> "Name:lat:lon;..." warmed at startup and served by /api/tempo/latest
+    PREFETCH_TOP_N                   -> popular tiles refreshed per tick (default 20)
+    PREFETCH_INTERVAL_SECONDS        -> tick period (default 60)
+    PREFETCH_REFRESH_MARGIN_SECONDS  -> refresh entries expiring within this window (default 2 ticks)
+    PREFETCH_CONCURRENCY             -> concurrent refreshes per tick (default 4)
+    PREFETCH_STARTUP_TIMEOUT_SECONDS -> longest startup waits for the first tick (default 10)
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.openaq_service import DEFAULT_PARAMETERS, openaq_service
+from app.services.tempo_service import tempo_service
+from app.utils.geo import geohash_encode
+from app.utils.scheduler import PREFETCH, request_lane
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCATIONS = "New York:40.7128:-74.0060;Los Angeles:34.0522:-118.2437;Chicago:41.8781:-87.6298"
+# Widest radius of the aggregated route's adaptive station search (10 km doubled per step)
+STATION_RADIUS_KM = min(10 * 2 ** int(os.getenv("FUSION_EXPANSION_STEPS", 3)), 200)
+# Tracked tiles are capped; the least popular are dropped first
+MAX_TRACKED_TILES = 10_000
+# Distinct points remembered per tile (the most requested one is warmed)
+POINTS_PER_TILE = 4
+
+
+def parse_locations(spec: str) -> List[Dict[str, Any]]:
+    """"Name:lat:lon;..." -> [{"name", "lat", "lon"}]; malformed entries are skipped."""
+    locations = []
+    for entry in spec.split(";"):
+        parts = entry.strip().rsplit(":", 2)
+        if len(parts) != 3:
+            continue
+        try:
+            locations.append({"name": parts[0], "lat": float(parts[1]), "lon": float(parts[2])})
+        except ValueError:
+            continue
+    return locations
+
+
+class PrefetchService:
+    """Tracks tile popularity and refreshes hot cache entries before they expire."""
+
+    def __init__(self):
+        self.enabled = os.getenv("PREFETCH_ENABLED", "1") != "0"
+        self.locations = parse_locations(os.getenv("PREFETCH_LOCATIONS", DEFAULT_LOCATIONS))
+        self.top_n = int(os.getenv("PREFETCH_TOP_N", 20))
+        self.interval = float(os.getenv("PREFETCH_INTERVAL_SECONDS", 60))
+        self.margin = float(os.getenv("PREFETCH_REFRESH_MARGIN_SECONDS", 2 * self.interval))
+        self.concurrency = int(os.getenv("PREFETCH_CONCURRENCY", 4))
+        self.startup_timeout = float(os.getenv("PREFETCH_STARTUP_TIMEOUT_SECONDS", 10))
+        self.decay = 0.9  # per tick
+        self._scores: Dict[str, float] = {}
+        self._points: Dict[str, Counter] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.ticks = 0
+        self.refreshed = 0
+        self.failures = 0
+
+    # ---------- popularity ----------
+    def record(self, lat: float, lon: float) -> None:
+        """Count one query for the point's tile (cheap; called on the request path)."""
+        tile = geohash_encode(lat, lon, openaq_service.tile_precision)
+        self._scores[tile] = self._scores.get(tile, 0.0) + 1.0
+        points = self._points.setdefault(tile, Counter())
+        point = (round(lat, 3), round(lon, 3))  # TEMPO cache key granularity
+        if point in points or len(points) < POINTS_PER_TILE:
+            points[point] += 1
+
+    def top_points(self, n: Optional[int] = None) -> List[Tuple[float, float]]:
+        """Most requested point of each of the ``n`` hottest tiles."""
+        tiles = sorted(self._scores, key=self._scores.get, reverse=True)[: self.top_n if n is None else n]
+        return [self._points[t].most_common(1)[0][0] for t in tiles]
+
+    def _decay(self) -> None:
+        for tile in list(self._scores):
+            self._scores[tile] *= self.decay
+            if self._scores[tile] < 0.05:
+                self._scores.pop(tile)
+                self._points.pop(tile, None)
+        if len(self._scores) > MAX_TRACKED_TILES:
+            for tile in sorted(self._scores, key=self._scores.get)[: len(self._scores) - MAX_TRACKED_TILES]:
+                self._scores.pop(tile)
+                self._points.pop(tile, None)
+
+    # ---------- warming ----------
+    def _expiring(self, remaining: Optional[float]) -> bool:
+        return remaining is None or remaining <= self.margin
+
+    async def warm_point(self, lat: float, lon: float) -> int:
+        """Refresh the caches behind /api/airquality for one point; returns entries refreshed."""
+        refreshed = 0
+        if self._expiring(tempo_service.cache_ttl_remaining(lat, lon)):
+            await tempo_service.fetch_tempo_data(lat, lon, refresh=True)
+            refreshed += 1
+        # With a fresh local catalog station lookups need no cache
+        if not openaq_service.catalog_fresh and self._expiring(
+            openaq_service.tile_ttl_remaining(lat, lon, STATION_RADIUS_KM)
+        ):
+            await openaq_service.get_tile_stations(lat, lon, STATION_RADIUS_KM, list(DEFAULT_PARAMETERS), refresh=True)
+            refreshed += 1
+        return refreshed
+
+    async def tick(self) -> int:
+        """One pass over the configured locations and the hottest tiles."""
+        points = [(loc["lat"], loc["lon"]) for loc in self.locations]
+        points += [p for p in self.top_points() if p not in points]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def warm(point: Tuple[float, float]) -> int:
+            async with semaphore:
+                try:
+                    # Upstream calls queue behind interactive traffic
+                    with request_lane(PREFETCH):
+                        return await self.warm_point(*point)
+                except Exception:
+                    self.failures += 1
+                    logger.exception("Prefetch failed for %s", point)
+                    return 0
+
+        refreshed = sum(await asyncio.gather(*(warm(p) for p in points)))
+        self.refreshed += refreshed
+        self.ticks += 1
+        self._decay()
+        return refreshed
+
+    async def _loop(self, warmed: Optional[asyncio.Future] = None) -> None:
+        while True:
+            try:
+                await self.tick()
+            except Exception:  # pragma: no cover - keep the loop alive
+                logger.exception("Prefetch tick failed")
+            if warmed is not None and not warmed.done():
+                warmed.set_result(None)
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        """Start the loop and wait (bounded) for the first tick to finish."""
+        if self.enabled and self._task is None:
+            warmed = asyncio.get_running_loop().create_future()
+            self._task = asyncio.create_task(self._loop(warmed))
+            done, _ = await asyncio.wait({warmed, self._task}, timeout=self.startup_timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:  # slow upstreams: keep warming in the background
+                logger.warning("Prefetch warm-up still running after %.0fs; serving requests", self.startup_timeout)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "running": self._task is not None and not self._task.done(),
+            "trackedTiles": len(self._scores),
+            "locations": len(self.locations),
+            "ticks": self.ticks,
+            "refreshed": self.refreshed,
+            "failures": self.failures,
+        }
+
+
+prefetch_service = PrefetchService()
@@ -0,0 +1,179 @@
+"""Local Station Catalog
+
+In-memory catalog of OpenAQ station metadata + last values, indexed with a
+haversine BallTree so nearest-station and radius lookups are answered locally
+instead of with a /locations round trip per request.
+
+Each refresh builds a new immutable ``CatalogSnapshot`` (NumPy coordinate and
+value arrays + tree) off the event loop and swaps it in with a single
+reference assignment, so readers always see a complete catalog.
+
+Station records use the same shape as ``OpenAQService`` responses (stationId,
+name, lat, lon, measurements, country, city, sources).
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sklearn.neighbors import BallTree
+
+from app.utils.geo import EARTH_RADIUS_KM
+
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+
+# Column order of the last-value matrix
+CATALOG_PARAMETERS: Tuple[str, ...] = ("pm25", "pm10", "o3", "no2", "so2", "co", "bc")
+_PARAM_INDEX = {p: i for i, p in enumerate(CATALOG_PARAMETERS)}
+
+
+class CatalogSnapshot:
+    """Immutable station arrays + BallTree built for one catalog refresh."""
+
+    def __init__(self, stations: Sequence[Dict[str, Any]], version: int = 0):
+        self.stations = [s for s in stations if s.get("lat") is not None and s.get("lon") is not None]
+        self.version = version
+        self.built_at = time.time()
+        n = len(self.stations)
+        self.lat = np.array([s["lat"] for s in self.stations], dtype=float)
+        self.lon = np.array([s["lon"] for s in self.stations], dtype=float)
+        # (stations x parameters) last values, NaN where not measured
+        self.values = np.full((n, len(CATALOG_PARAMETERS)), np.nan)
+        for i, s in enumerate(self.stations):
+            for m in s.get("measurements", []):
+                col = _PARAM_INDEX.get(m.get("parameter"))
+                if col is not None and isinstance(m.get("value"), (int, float)):
+                    self.values[i, col] = m["value"]
+        self._tree = BallTree(np.radians(np.column_stack([self.lat, self.lon])), metric="haversine") if n else None
+
+    def __len__(self) -> int:
+        return len(self.stations)
+
+    def _point(self, lat: float, lon: float) -> np.ndarray:
+        return np.radians([[lat, lon]])
+
+    def _param_mask(self, parameters: Optional[Sequence[str]]) -> Optional[np.ndarray]:
+        cols = [_PARAM_INDEX[p] for p in parameters or () if p in _PARAM_INDEX]
+        if not cols:
+            return None
+        return ~np.isnan(self.values[:, cols]).all(axis=1)
+
+    def query_nearest(self, lat: float, lon: float, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Indices and distances (km) of the ``k`` nearest stations."""
+        if self._tree is None:
+            return np.empty(0, dtype=int), np.empty(0)
+        dist, idx = self._tree.query(self._point(lat, lon), k=min(k, len(self)))
+        return idx[0], dist[0] * EARTH_RADIUS_KM
+
+    def query_radius(self, lat: float, lon: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Indices and distances (km) of stations within ``radius_km``, nearest first."""
+        if self._tree is None:
+            return np.empty(0, dtype=int), np.empty(0)
+        idx, dist = self._tree.query_radius(
+            self._point(lat, lon), r=radius_km / EARTH_RADIUS_KM, return_distance=True, sort_results=True
+        )
+        return idx[0], dist[0] * EARTH_RADIUS_KM
+
+    def nearby(
+        self,
+        lat: float,
+        lon: float,
+        radius_km: float,
+        limit: int,
+        parameters: Optional[Sequence[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Station records within ``radius_km`` (nearest first) measuring any of ``parameters``."""
+        idx, dist = self.query_radius(lat, lon, radius_km)
+        mask = self._param_mask(parameters)
+        if mask is not None:
+            keep = mask[idx]
+            idx, dist = idx[keep], dist[keep]
+        return [
+            {**self.stations[i], "distance": round(float(d), 2)}
+            for i, d in zip(idx[:limit], dist[:limit])
+        ]
+
+
+    def in_bbox(
+        self,
+        west: float,
+        south: float,
+        east: float,
+        north: float,
+        margin_km: float = 0.0,
+        parameters: Optional[Sequence[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Every station inside the box widened by ``margin_km`` (no count limit)."""
+        dlat = margin_km / KM_PER_DEGREE
+        widest = min(max(abs(south), abs(north)) + dlat, 89.0)
+        dlon = margin_km / (KM_PER_DEGREE * np.cos(np.radians(widest)))
+        mask = ((self.lat >= south - dlat) & (self.lat <= north + dlat)
+                & (self.lon >= west - dlon) & (self.lon <= east + dlon))
+        param_mask = self._param_mask(parameters)
+        if param_mask is not None:
+            mask &= param_mask
+        return [self.stations[i] for i in np.flatnonzero(mask)]
+
+
+class StationCatalog:
+    """Holder for the current snapshot; swapped atomically on refresh."""
+
+    def __init__(self):
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self.refreshed_at: Optional[float] = None
+
+    @property
+    def snapshot(self) -> Optional[CatalogSnapshot]:
+        return self._snapshot
+
+    @property
+    def ready(self) -> bool:
+        return self._snapshot is not None and len(self._snapshot) > 0
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version if self._snapshot is not None else 0
+
+    def age(self) -> Optional[float]:
+        """Seconds since the current snapshot was crawled (None before the first)."""
+        return time.time() - self.refreshed_at if self.refreshed_at is not None else None
+
+    def fresh(self, max_age: float) -> bool:
+        """Loaded and younger than ``max_age`` seconds (0 = never expires)."""
+        return self.ready and (max_age <= 0 or self.age() <= max_age)
+
+    def swap(self, stations: Sequence[Dict[str, Any]]) -> CatalogSnapshot:
+        snapshot = CatalogSnapshot(stations, version=self.version + 1)
+        self._snapshot = snapshot  # single reference assignment
+        self.refreshed_at = time.time()
+        return snapshot
+
+    def load_file(self, path: str) -> bool:
+        """Load stations saved by ``save_file`` (or a fixture); False if missing."""
+        if not os.path.exists(path):
+            return False
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        self.swap(payload.get("stations", []))
+        # Age counts from the crawl that produced the file, not from this load
+        self.refreshed_at = payload.get("savedAt") or self.refreshed_at
+        return True
+
+    def save_file(self, path: str) -> None:
+        if self._snapshot is None:
+            return
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"savedAt": self.refreshed_at, "stations": self._snapshot.stations}, f)
+        os.replace(tmp, path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "stations": len(self._snapshot) if self._snapshot is not None else 0,
+            "version": self.version,
+            "refreshedAt": self.refreshed_at,
+            "ageSeconds": round(self.age(), 1) if self.refreshed_at is not None else None,
+        }
@@ -0,0 +1,167 @@
+"""Swath Nearest-Pixel Index
+
+TEMPO L2 pixels lie on an irregular (mirror_step x xtrack) swath, so sampling
+a granule at arbitrary points needs a nearest-neighbour search over the pixel
+centres. ``SwathIndex`` holds a KD-tree over unit-sphere xyz coordinates
+(chord distance is monotonic in great-circle distance, so Euclidean queries
+give true nearest pixels without haversine costs or dateline issues). The
+search radius is bounded by the pixel footprint, so points outside the swath
+are rejected early instead of searching for a far-away neighbour.
+
+The index is built once per granule and persisted with joblib next to the
+file (``<granule>.kdtree.joblib``); it is rebuilt when the granule's size or
+mtime changes. Loaded indexes are kept in a small in-process LRU shared by
+the worker threads (guarded by a lock).
+
+Sampling modes:
+    nearest   value of the closest valid pixel
+    idw       inverse-distance weighted mean of the ``k`` closest pixels
+              (footprint-weighted; approximates bilinear interpolation on the
+              swath without needing its cell topology)
+Points farther than ``max_distance_km`` from every pixel are NaN.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import joblib
+import numpy as np
+from scipy.spatial import cKDTree
+
+from app.services.tempo_cube import GEOLOCATION, read_variable
+from app.utils.geo import EARTH_RADIUS_KM
+
+INDEX_SUFFIX = ".kdtree.joblib"
+INDEX_FORMAT = 1
+# TEMPO pixels are ~2 km x 4.75 km; anything farther is outside the swath
+DEFAULT_MAX_DISTANCE_KM = 10.0
+_LOADED_MAX = 8
+_loaded: "OrderedDict[str, SwathIndex]" = OrderedDict()
+_loaded_lock = threading.Lock()
+
+
+def to_unit_xyz(lat, lon) -> np.ndarray:
+    lat_r = np.radians(np.asarray(lat, dtype=float))
+    lon_r = np.radians(np.asarray(lon, dtype=float))
+    cos_lat = np.cos(lat_r)
+    return np.stack([cos_lat * np.cos(lon_r), cos_lat * np.sin(lon_r), np.sin(lat_r)], axis=-1)
+
+
+def _source_stamp(path: str) -> Tuple[int, float]:
+    st = os.stat(path)
+    return st.st_size, st.st_mtime
+
+
+class SwathIndex:
+    """KD-tree over the valid pixel centres of one swath."""
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, leaf_size: int = 16):
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        self.shape = lat.shape
+        valid = np.isfinite(lat) & np.isfinite(lon)
+        self.pixels = np.flatnonzero(valid)  # flat swath index of each tree point
+        self.tree = cKDTree(to_unit_xyz(lat.ravel()[self.pixels], lon.ravel()[self.pixels]), leafsize=leaf_size)
+        self.source: Optional[Tuple[int, float]] = None
+
+    def __len__(self) -> int:
+        return self.pixels.size
+
+    def query(self, lat, lon, k: int = 1,
+              max_distance_km: float = DEFAULT_MAX_DISTANCE_KM) -> Tuple[np.ndarray, np.ndarray]:
+        """(flat pixel indices, great-circle km) of the ``k`` nearest pixels; shapes (N, k).
+
+        Neighbours beyond ``max_distance_km`` come back with index -1 and inf km.
+        """
+        points = to_unit_xyz(np.atleast_1d(lat), np.atleast_1d(lon)).reshape(-1, 3)
+        bound = 2 * np.sin(max_distance_km / (2 * EARTH_RADIUS_KM))  # chord length
+        chord, idx = self.tree.query(points, k=min(k, len(self)), distance_upper_bound=bound * (1 + 1e-9))
+        chord, idx = chord.reshape(len(points), -1), idx.reshape(len(points), -1)
+        found = idx < len(self)
+        km = np.where(found, 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2, 1.0)), np.inf)
+        return np.where(found, self.pixels[np.minimum(idx, len(self) - 1)], -1), km
+
+    def sample(
+        self,
+        values: np.ndarray,
+        lat,
+        lon,
+        mode: str = "nearest",
+        k: int = 4,
+        power: float = 2.0,
+        max_distance_km: float = DEFAULT_MAX_DISTANCE_KM,
+    ) -> np.ndarray:
+        """Swath ``values`` at each point; NaN outside the swath or where pixels are NaN."""
+        if mode not in ("nearest", "idw"):
+            raise ValueError(f"unknown sampling mode {mode!r}")
+        flat = np.asarray(values, dtype=float).ravel()
+        idx, km = self.query(lat, lon, k=1 if mode == "nearest" else k, max_distance_km=max_distance_km)
+        picked = np.where(idx >= 0, flat[idx], np.nan)
+        usable = np.isfinite(picked)
+        if mode == "nearest":
+            out = np.where(usable[:, 0], picked[:, 0], np.nan)
+        else:
+            w = np.where(usable, 1.0 / np.maximum(km, 1e-3) ** power, 0.0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                out = np.where(w.sum(axis=1) > 0, (w * np.where(usable, picked, 0.0)).sum(axis=1) / w.sum(axis=1), np.nan)
+        return out.reshape(np.shape(lat)) if np.ndim(lat) else out
+
+    # ---------- persistence ----------
+    def save(self, path: str) -> None:
+        tmp = f"{path}.tmp"
+        joblib.dump({"format": INDEX_FORMAT, "source": self.source, "index": self}, tmp)
+        os.replace(tmp, path)
+
+    @classmethod
+    def for_granule(cls, granule: str) -> "SwathIndex":
+        """Index of a granule file: in-process LRU -> persisted file -> build (and persist)."""
+        stamp = _source_stamp(granule)
+        with _loaded_lock:
+            index = _loaded.get(granule)
+            if index is not None and index.source == stamp:
+                _loaded.move_to_end(granule)
+                return index
+
+        index_path = granule + INDEX_SUFFIX
+        index = None
+        if os.path.exists(index_path):
+            try:
+                payload = joblib.load(index_path)
+                if payload.get("format") == INDEX_FORMAT and tuple(payload.get("source") or ()) == stamp:
+                    index = payload["index"]
+            except Exception:
+                index = None  # corrupt or incompatible: rebuild
+        if index is None:
+            index = cls(read_variable(granule, GEOLOCATION[0]), read_variable(granule, GEOLOCATION[1]))
+            index.source = stamp
+            index.save(index_path)
+
+        with _loaded_lock:
+            _loaded[granule] = index
+            _loaded.move_to_end(granule)
+            while len(_loaded) > _LOADED_MAX:
+                _loaded.popitem(last=False)
+        return index
+
+
+def sample_granule(
+    granule: str,
+    variables: Dict[str, str],
+    lat,
+    lon,
+    mode: str = "nearest",
+    **options,
+) -> Dict[str, np.ndarray]:
+    """{name: values at the points} for ``{name: "<group>/<variable>"}`` present in one granule."""
+    index = SwathIndex.for_granule(granule)
+    out = {}
+    for name, variable in variables.items():
+        try:
+            values = read_variable(granule, variable)
+        except (KeyError, OSError):
+            continue
+        out[name] = index.sample(values, lat, lon, mode=mode, **options)
+    return out
@@ -0,0 +1,316 @@
+"""Local TEMPO Cube
+
+Regrids TEMPO L2 swath granules onto a fixed regular lat/lon grid and stores
+them as memory-mapped NumPy arrays, one file per (hour, variable), so point
+and bounding-box reads are array slices with no network access.
+
+Layout under the cube directory:
+    index.json                  grid definition + ingested slices / granules
+    <YYYYMMDDTHH>/<var>.npy     float32 mean of the pixels in each cell (NaN = none)
+    <YYYYMMDDTHH>/<var>.n.npy   uint16 pixel count per cell (for merging granules)
+
+Granules downloaded into the cube directory (``<cube>/granules/``) are
+tracked per slice and deleted with it, together with derived sidecar files
+(``<granule>.*``, e.g. swath indexes); once the cube holds ``max_slices``
+hours, granules older than the oldest retained hour are dropped instead of
+being ingested. Files outside the cube directory are never deleted.
+
+Each hourly slice is one chunk along time; spatially the OS pages in only the
+rows a query touches. Granules are opened lazily with xarray (h5netcdf) and
+only the geolocation, value and quality variables are read. Updates write new
+files and swap them in with ``os.replace`` before the index is rewritten, so
+readers never see a half-merged slice.
+
+Values stay in the product's native units (e.g. molecules/cm^2 columns).
+"""
+from __future__ import annotations
+
+import glob
+import json
+import os
+import shutil
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import xarray as xr
+
+
+@dataclass(frozen=True)
+class TempoProduct:
+    short_name: str        # Earthdata collection short name
+    variable: str          # "<group>/<variable>" inside the granule
+    unit: str
+    quality: Optional[str] = None  # "<group>/<flag>"; pixels with flag != 0 are dropped
+
+
+# Cube variable -> source product
+PRODUCTS: Dict[str, TempoProduct] = {
+    "no2": TempoProduct("TEMPO_NO2_L2", "product/vertical_column_troposphere", "molecules/cm^2",
+                        "product/main_data_quality_flag"),
+    "hcho": TempoProduct("TEMPO_HCHO_L2", "product/vertical_column", "molecules/cm^2",
+                         "product/main_data_quality_flag"),
+    "o3": TempoProduct("TEMPO_O3TOT_L2", "product/column_amount_o3", "DU", "product/quality_flag"),
+    "aerosolIndex": TempoProduct("TEMPO_O3TOT_L2", "product/uv_aerosol_index", "1", "product/quality_flag"),
+}
+GEOLOCATION = ("geolocation/latitude", "geolocation/longitude")
+
+
+@dataclass(frozen=True)
+class CubeGrid:
+    """Regular grid; row 0 is the southern edge, column 0 the western edge."""
+    lat_min: float = 14.0
+    lat_max: float = 64.0
+    lon_min: float = -140.0
+    lon_max: float = -50.0
+    res: float = 0.05
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return (int(round((self.lat_max - self.lat_min) / self.res)),
+                int(round((self.lon_max - self.lon_min) / self.res)))
+
+    def index(self, lat, lon) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(row, col, inside) for scalar or array coordinates."""
+        rows, cols = self.shape
+        r = np.floor((np.asarray(lat, dtype=float) - self.lat_min) / self.res)
+        c = np.floor((np.asarray(lon, dtype=float) - self.lon_min) / self.res)
+        inside = (r >= 0) & (r < rows) & (c >= 0) & (c < cols)
+        return np.where(inside, r, 0).astype(np.intp), np.where(inside, c, 0).astype(np.intp), inside
+
+    def centers(self) -> Tuple[np.ndarray, np.ndarray]:
+        rows, cols = self.shape
+        return (self.lat_min + (np.arange(rows) + 0.5) * self.res,
+                self.lon_min + (np.arange(cols) + 0.5) * self.res)
+
+
+def read_variable(path: str, name: str) -> np.ndarray:
+    group, variable = name.rsplit("/", 1)
+    with xr.open_dataset(path, group=group, engine="h5netcdf", mask_and_scale=True) as ds:
+        return np.asarray(ds[variable].values)
+
+
+def granule_time_key(path: str) -> str:
+    """Hour key (YYYYMMDDTHH) from the granule's time_coverage_start attribute."""
+    with xr.open_dataset(path, engine="h5netcdf") as ds:
+        start = ds.attrs.get("time_coverage_start")
+    if start:
+        return datetime.fromisoformat(str(start).replace("Z", "+00:00")).strftime("%Y%m%dT%H")
+    return datetime.utcfromtimestamp(os.path.getmtime(path)).strftime("%Y%m%dT%H")
+
+
+def regrid(path: str, product: TempoProduct, grid: CubeGrid) -> Tuple[np.ndarray, np.ndarray]:
+    """Bin-average one granule onto the grid -> (sum, count) arrays."""
+    lat = read_variable(path, GEOLOCATION[0])
+    lon = read_variable(path, GEOLOCATION[1])
+    values = read_variable(path, product.variable)
+    if lat.ndim == 1 and values.ndim == 2:  # regular (lat, lon) granule
+        lat, lon = np.meshgrid(lat, lon, indexing="ij")
+    valid = np.isfinite(values) & np.isfinite(lat) & np.isfinite(lon)
+    if product.quality:
+        try:
+            valid &= read_variable(path, product.quality) == 0
+        except (KeyError, OSError):
+            pass
+    row, col, inside = grid.index(lat[valid], lon[valid])
+    flat = (row * grid.shape[1] + col)[inside]
+    size = grid.shape[0] * grid.shape[1]
+    sums = np.bincount(flat, weights=values[valid][inside].astype(float), minlength=size)
+    counts = np.bincount(flat, minlength=size)
+    return sums.reshape(grid.shape), counts.reshape(grid.shape)
+
+
+class TEMPOCube:
+    """On-disk cube of regridded TEMPO hours; thread-safe writers, lock-free readers."""
+
+    def __init__(self, root: str, grid: Optional[CubeGrid] = None, max_slices: int = 48):
+        self.root = root
+        self.max_slices = max_slices
+        self._lock = threading.Lock()
+        self._arrays: Dict[Tuple[str, str], np.ndarray] = {}
+        os.makedirs(root, exist_ok=True)
+        index = self._load_index()
+        self.grid = CubeGrid(**index["grid"]) if index.get("grid") else (grid or CubeGrid())
+        self._index: Dict[str, Any] = {"grid": asdict(self.grid), "slices": index.get("slices", {})}
+
+    # ---------- index ----------
+    def _index_path(self) -> str:
+        return os.path.join(self.root, "index.json")
+
+    def _load_index(self) -> Dict[str, Any]:
+        try:
+            with open(self._index_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index: Dict[str, Any]) -> None:
+        tmp = f"{self._index_path()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp, self._index_path())
+
+    def slices(self) -> List[str]:
+        return sorted(self._index["slices"])
+
+    def latest(self, variable: Optional[str] = None, prefix: Optional[str] = None) -> Optional[str]:
+        """Newest hour key, optionally holding ``variable`` / starting with ``prefix`` (e.g. a YYYYMMDD day)."""
+        keys = [
+            k for k in self.slices()
+            if (variable is None or variable in self._index["slices"][k]["variables"])
+            and (prefix is None or k.startswith(prefix))
+        ]
+        return keys[-1] if keys else None
+
+    def has_granule(self, path: str) -> bool:
+        name = os.path.basename(path)
+        return any(name in s.get("granules", []) for s in self._index["slices"].values())
+
+    def granule_files(self, time_key: str) -> List[str]:
+        """Downloaded granule files still on disk for an hour (newest name first)."""
+        entry = self._index["slices"].get(time_key, {})
+        return sorted((p for p in entry.get("files", []) if os.path.exists(p)), reverse=True)
+
+    def retains(self, time_key: str) -> bool:
+        """Whether a granule for ``time_key`` would survive pruning."""
+        keys = self.slices()
+        return len(keys) < self.max_slices or time_key >= keys[-self.max_slices]
+
+    def _owns(self, path: str) -> bool:
+        root = os.path.abspath(self.root)
+        return os.path.commonpath([root, os.path.abspath(path)]) == root
+
+    def _remove_granule(self, path: str) -> None:
+        """Delete a downloaded granule and its sidecars (only files inside the cube)."""
+        if not self._owns(path):
+            return
+        for name in [path, *glob.glob(glob.escape(path) + ".*")]:
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+
+    # ---------- ingestion ----------
+    def ingest(self, path: str, variables: Optional[Iterable[str]] = None, time_key: Optional[str] = None) -> List[str]:
+        """Regrid one granule into its hourly slice; returns the variables written."""
+        time_key = time_key or granule_time_key(path)
+        if not self.retains(time_key):
+            self._remove_granule(path)  # would be pruned right away
+            return []
+        variables = list(variables or PRODUCTS)
+        results = {}
+        for var in variables:
+            try:
+                results[var] = regrid(path, PRODUCTS[var], self.grid)
+            except (KeyError, OSError):
+                continue  # variable not in this product's granule
+        if not results:
+            return []
+
+        with self._lock:
+            directory = os.path.join(self.root, time_key)
+            os.makedirs(directory, exist_ok=True)
+            index = json.loads(json.dumps(self._index))
+            entry = index["slices"].setdefault(time_key, {"variables": {}, "granules": []})
+            for var, (sums, counts) in results.items():
+                mean_path, count_path = self._paths(time_key, var)
+                if var in entry["variables"]:
+                    old_mean = np.load(mean_path)
+                    old_count = np.load(count_path).astype(np.int64)
+                    sums = sums + np.where(old_count > 0, old_mean * old_count, 0.0)
+                    counts = counts + old_count
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    mean = np.where(counts > 0, sums / counts, np.nan).astype(np.float32)
+                self._write(mean_path, mean)
+                self._write(count_path, np.minimum(counts, np.iinfo(np.uint16).max).astype(np.uint16))
+                entry["variables"][var] = {"unit": PRODUCTS[var].unit, "cells": int((counts > 0).sum())}
+                self._arrays.pop((time_key, var), None)
+            entry["granules"] = sorted(set(entry["granules"]) | {os.path.basename(path)})
+            if self._owns(path):
+                entry["files"] = sorted(set(entry.get("files", [])) | {os.path.abspath(path)})
+            entry["updatedAt"] = time.time()
+            self._prune(index)
+            self._save_index(index)
+            self._index = index
+        return list(results)
+
+    def _paths(self, time_key: str, var: str) -> Tuple[str, str]:
+        directory = os.path.join(self.root, time_key)
+        return os.path.join(directory, f"{var}.npy"), os.path.join(directory, f"{var}.n.npy")
+
+    @staticmethod
+    def _write(path: str, array: np.ndarray) -> None:
+        tmp = f"{path}.tmp.npy"
+        np.save(tmp, array)
+        os.replace(tmp, path)
+
+    def _prune(self, index: Dict[str, Any]) -> None:
+        for key in sorted(index["slices"])[:-self.max_slices or None]:
+            entry = index["slices"].pop(key)
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            for path in entry.get("files", []):
+                self._remove_granule(path)
+            for cached in [k for k in self._arrays if k[0] == key]:
+                self._arrays.pop(cached, None)
+
+    # ---------- reads ----------
+    def array(self, variable: str, time_key: Optional[str] = None) -> Optional[np.ndarray]:
+        """Read-only memmap of one variable for an hour (latest when omitted)."""
+        time_key = time_key or self.latest(variable)
+        if time_key is None or variable not in self._index["slices"].get(time_key, {}).get("variables", {}):
+            return None
+        key = (time_key, variable)
+        array = self._arrays.get(key)
+        if array is None:
+            array = np.load(self._paths(time_key, variable)[0], mmap_mode="r")
+            self._arrays[key] = array
+        return array
+
+    def point(self, lat: float, lon: float, variables: Optional[Iterable[str]] = None,
+              time_key: Optional[str] = None) -> Dict[str, float]:
+        """{variable: value} of the cell containing (lat, lon); cells without data are omitted."""
+        row, col, inside = self.grid.index(lat, lon)
+        if not inside:
+            return {}
+        out = {}
+        for var in variables or PRODUCTS:
+            array = self.array(var, time_key)
+            if array is not None:
+                value = float(array[row, col])
+                if not np.isnan(value):
+                    out[var] = value
+        return out
+
+    def points(self, lat: np.ndarray, lon: np.ndarray, variable: str,
+               time_key: Optional[str] = None) -> np.ndarray:
+        """Values for many points at once (NaN outside the grid or without data)."""
+        array = self.array(variable, time_key)
+        row, col, inside = self.grid.index(lat, lon)
+        if array is None:
+            return np.full(np.shape(row), np.nan)
+        return np.where(inside, array[row, col], np.nan)
+
+    def bbox(self, west: float, south: float, east: float, north: float, variable: str,
+             time_key: Optional[str] = None) -> Optional[Dict[str, np.ndarray]]:
+        """Sub-array covering a bounding box plus its cell-centre coordinates (rows south -> north)."""
+        array = self.array(variable, time_key)
+        if array is None:
+            return None
+        rows, cols = self.grid.shape
+        r0 = max(int(np.floor((south - self.grid.lat_min) / self.grid.res)), 0)
+        r1 = min(int(np.ceil((north - self.grid.lat_min) / self.grid.res)), rows)
+        c0 = max(int(np.floor((west - self.grid.lon_min) / self.grid.res)), 0)
+        c1 = min(int(np.ceil((east - self.grid.lon_min) / self.grid.res)), cols)
+        lat_c, lon_c = self.grid.centers()
+        return {"values": array[r0:r1, c0:c1], "lat": lat_c[r0:r1], "lon": lon_c[c0:c1]}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "slices": len(self._index["slices"]),
+            "latest": self.latest(),
+            "grid": self._index["grid"],
+            "openArrays": len(self._arrays),
+        }
@@ -9,36 +9,135 @@ NASA data.
 Environment Variables:
     USE_REAL_TEMPO=1                -> attempt real Earthdata access
     EARTHDATA_USERNAME / _PASSWORD  -> used by earthaccess (strategy="environment")
+    TEMPO_CACHE_MAX_ENTRIES         -> bound on cached locations (default 4096)
+    TEMPO_CACHE_MAX_BYTES           -> approximate cache byte budget (default 16 MiB)
+    TEMPO_CUBE_DIR                  -> local regridded granule cube (see tempo_cube.py; default data/tempo_cube)
+    TEMPO_CUBE_MAX_SLICES           -> hourly slices kept in the cube (default 48)
+    TEMPO_INGEST_INTERVAL_SECONDS   -> minimum gap between ingestion runs (default 3600)
+    TEMPO_STALE_SECONDS             -> how long expired responses may be served
+                                       (marked stale) while refreshing (default 1800)
 
-Datasets (indicative short names – adjust when final TEMPO products are confirmed):
-    TEMPO_L2_NO2, TEMPO_L2_O3, TEMPO_L2_HCHO, TEMPO_L2_AEROSOL (example names)
+Datasets (see PRODUCTS in tempo_cube.py):
+    TEMPO_NO2_L2, TEMPO_HCHO_L2, TEMPO_O3TOT_L2 (ozone column + UV aerosol index)
 
-If real retrieval fails for any reason, we transparently fall back to the
-synthetic deterministic model so the API remains responsive.
+In real mode requests read the local cube only; granules are searched,
+downloaded and regridded by a background task. Point requests are answered at
+native resolution from the slice's downloaded granules (nearest swath pixel,
+via the per-granule KD-tree built at ingest) and fall back to the regridded
+cell where no granule pixel covers the point. Points the cube does not cover
+(and anything that fails) fall back to the synthetic deterministic model so
+the API remains responsive.
 """
 import asyncio
+import logging
 from typing import Optional, Dict, List
-from datetime import datetime
+from datetime import datetime, timedelta
 import math
 import httpx
 import os
+import time
+
+import numpy as np
+
+from app.services.swath_index import SwathIndex, sample_granule
+from app.services.tempo_cube import PRODUCTS, TEMPOCube
+from app.utils.cache import build_cache
+from app.utils.http import close_client, http_client
+from app.utils.resilience import Upstream
 
 try:  # earthaccess may be heavy; import lazily
         import earthaccess  # type: ignore
 except Exception:  # pragma: no cover
         earthaccess = None  # Fallback if not available
 
+logger = logging.getLogger(__name__)
+
+# Parameter set requested when callers don't pass one
+DEFAULT_PARAMETERS = ["no2", "o3", "hcho", "pm", "aerosol"]
+
+# Synthetic field models: base + diurnal + latitude band + hash jitter (+ metro bias), floored
+SYNTHETIC_FIELDS: Dict[str, Dict] = {
+    "no2": dict(base=14.0, diurnal_amp=4.0, lat_center=30.0, lat_width=25.0, lat_scale=3.0,
+                hash_amp=2.5, phase=1.0, urban=True, floor=1.0),
+    "o3": dict(base=42.0, diurnal_amp=6.0, lat_center=25.0, lat_width=30.0, lat_scale=5.0,
+               hash_amp=3.5, phase=0.0, urban=False, floor=5.0),
+    "hcho": dict(base=1.6, diurnal_amp=0.6, lat_center=5.0, lat_width=25.0, lat_scale=1.2,
+                 hash_amp=0.5, phase=2.0, urban=False, floor=0.2),
+    "pm25": dict(base=10.0, diurnal_amp=2.0, lat_center=23.0, lat_width=40.0, lat_scale=2.5,
+                 hash_amp=5.0, phase=1.5, urban=True, floor=2.0),
+    "aerosolIndex": dict(base=0.7, diurnal_amp=0.15, lat_center=10.0, lat_width=35.0, lat_scale=0.25,
+                         hash_amp=0.25, phase=0.3, urban=False, floor=0.05),
+}
+
+# (lat, lon, additive bias) for known metro regions; first match within +-1 deg wins
+METROS = (
+    (40.7128, -74.0060, 6.0),   # NYC
+    (34.0522, -118.2437, 7.5),  # LA
+    (51.5074, -0.1278, 5.0),    # London
+    (28.6139, 77.2090, 5.5),    # Delhi
+    (35.6762, 139.6503, 5.0),   # Tokyo
+)
+_METRO_ARRAY = np.array(METROS)
+
+_MASK32 = 0xFFFFFFFF
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+
+def _splitmix64(x: int) -> int:
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+def _splitmix64_array(x: np.ndarray) -> np.ndarray:
+    """uint64 splitmix64; array arithmetic wraps modulo 2**64 like the masked scalar."""
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _stable_hash_array(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    mask = np.uint64(_MASK32)
+    qlat = np.rint(lat * 1e4).astype(np.int64).astype(np.uint64) & mask
+    qlon = np.rint(lon * 1e4).astype(np.int64).astype(np.uint64) & mask
+    h = _splitmix64_array((qlat << np.uint64(32)) | qlon)
+    return (h & mask).astype(float) / _MASK32
+
+
+def _urban_bias_array(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Metro bias per point: box test against every metro at once, first match wins."""
+    inside = (np.abs(lat[:, None] - _METRO_ARRAY[None, :, 0]) < 1) & (np.abs(lon[:, None] - _METRO_ARRAY[None, :, 1]) < 1)
+    first = np.argmax(inside, axis=1)
+    return np.where(inside.any(axis=1), _METRO_ARRAY[first, 2], 0.0)
+
+
 class TEMPOService:
     """Service for fetching NASA TEMPO satellite data"""
     
     def __init__(self):
         self.base_url = "https://asdc.larc.nasa.gov/data/TEMPO"  # informational
-        self.client = httpx.AsyncClient(timeout=30.0)
         self.use_real = os.getenv("USE_REAL_TEMPO") == "1" and earthaccess is not None
+        if os.getenv("USE_REAL_TEMPO") == "1" and earthaccess is None:
+            logger.warning("USE_REAL_TEMPO=1 but earthaccess is not installed; serving synthetic TEMPO data")
         self._logged_in = False
-        # Simple in-memory cache (lat,lon,date,paramset) -> data (times out quickly)
-        self._cache: Dict[str, Dict] = {}
-        self._cache_ttl_seconds = 300
+        self.cube_dir = os.getenv("TEMPO_CUBE_DIR") or "data/tempo_cube"
+        self.ingest_interval = float(os.getenv("TEMPO_INGEST_INTERVAL_SECONDS", 3600))
+        self._cube: Optional[TEMPOCube] = None
+        self._ingest_task: Optional[asyncio.Task] = None
+        self._last_ingest: Optional[float] = None
+        # Bounded LRU+TTL cache (lat,lon,date,paramset) -> data, single-flight on miss,
+        # shared across workers through Redis when REDIS_URL is configured
+        self._cache = build_cache(
+            "tempo",
+            ttl=300,
+            max_entries=int(os.getenv("TEMPO_CACHE_MAX_ENTRIES", 4096)),
+            max_bytes=int(os.getenv("TEMPO_CACHE_MAX_BYTES", 16 * 1024 * 1024)),
+            stale_ttl=float(os.getenv("TEMPO_STALE_SECONDS", 1800)),
+        )
+        # Earthdata search / download calls go through a circuit breaker
+        self.upstream = Upstream("earthdata", budgets={"search": 30.0, "download": 600.0})
 
     def _cache_key(self, lat: float, lon: float, date: Optional[str], params: List[str]):
         return f"{round(lat,3)}:{round(lon,3)}:{date or 'latest'}:{','.join(sorted(params))}"
@@ -60,6 +159,7 @@ class TEMPOService:
         lon: float,
         date: Optional[str] = None,
         parameters: List[str] = None,
+        refresh: bool = False,
     ) -> Dict:
         """
         Fetch TEMPO data for a specific location
@@ -70,82 +170,181 @@ class TEMPOService:
         - HCHO: Formaldehyde (ppb)
         - PM: Particulate Matter (μg/m³)
         - Aerosol: Aerosol Index
+
+        ``refresh=True`` reloads a cached entry in place (used by the prefetcher).
         """
         if parameters is None:
-            parameters = ["no2", "o3", "hcho", "pm", "aerosol"]
+            parameters = DEFAULT_PARAMETERS
 
-        # Check cache
+        # Concurrent misses for the same key share one fetch
         key = self._cache_key(lat, lon, date, parameters)
-        cached = self._cache.get(key)
-        if cached and (datetime.utcnow().timestamp() - cached["_cached_at"]) < self._cache_ttl_seconds:
-            return cached["data"]
-
-        if self.use_real:
-            try:  # pragma: no cover
-                await self._ensure_login()
-                # Build small bounding box around location (~0.25 deg box)
-                d = 0.125
-                bbox = (lon - d, lat - d, lon + d, lat + d)
-                # Example product short names (adjust to actual TEMPO collection IDs)
-                product_map = {
-                    "no2": "TEMPO_L2_NO2",
-                    "o3": "TEMPO_L2_O3",
-                    "hcho": "TEMPO_L2_HCHO",
-                    "aerosol": "TEMPO_L2_AEROSOL",
-                    # PM not directly; would be derived—keep synthetic for now
-                }
-                temporal = None
-                if date:
-                    temporal = (f"{date}T00:00:00", f"{date}T23:59:59")
-                # Search only for one representative product to reduce latency
-                search_short_name = product_map.get("no2")
-                if search_short_name and earthaccess:
-                    results = earthaccess.search_data(
-                        short_name=search_short_name,
-                        bounding_box=bbox,
-                        temporal=temporal,
-                        count=1,
-                    )
-                    # (Optional) Download & parse NetCDF/HDF dataset here; placeholder extraction
-                    # For MVP we only acknowledge successful search
-                    if results:
-                        # In a real implementation you'd open the granule with xarray & sample nearest pixel
-                        pass
-                # Fall through to build mixed response (real parsing TBD)
+        if refresh:
+            return await self._cache.refresh(key, lambda: self._fetch_uncached(lat, lon, date))
+        data, stale = await self._cache.get_or_load_stale(key, lambda: self._fetch_uncached(lat, lon, date))
+        return {**data, "stale": True} if stale else data
+
+    def cache_ttl_remaining(self, lat: float, lon: float, date: Optional[str] = None,
+                            parameters: Optional[List[str]] = None) -> Optional[float]:
+        """Seconds before the cached response for a point expires (None if not cached)."""
+        return self._cache.ttl_remaining(self._cache_key(lat, lon, date, parameters or DEFAULT_PARAMETERS))
+
+    async def _fetch_uncached(self, lat: float, lon: float, date: Optional[str]) -> Dict:
+        # Real mode reads the local cube (no network on the request path); granules
+        # are pulled into the cube by a background ingestion task
+        columns: Dict[str, float] = {}
+        native: Dict[str, float] = {}
+        slice_key = None
+        if self.use_real and self.cube is not None:
+            try:
+                self._schedule_ingest()
+                slice_key = self.cube.latest(prefix=date.replace("-", "") if date else None)
+                if slice_key:
+                    columns = self.cube.point(lat, lon, time_key=slice_key)
+                    native = await self._sample_native(slice_key, lat, lon) if columns else {}
+                    columns.update(native)
             except Exception:
-                # Revert to synthetic path if anything fails
-                self.use_real = False
+                logger.exception("TEMPO cube read failed")
 
         # Synthetic / fallback path (deterministic, location-specific)
-        await asyncio.sleep(0.05)
+        if not columns:
+            await asyncio.sleep(0.05)
+        hour = datetime.utcnow().hour
+        measurements = {
+            "no2": self._get_realistic_no2(lat, lon, hour),
+            "o3": self._get_realistic_o3(lat, lon, hour),
+            "hcho": self._get_realistic_hcho(lat, lon, hour),
+            "pm25": self._get_realistic_pm25(lat, lon, hour),
+            "aerosolIndex": self._get_realistic_aerosol(lat, lon, hour),
+        }
         data = {
             "location": {"lat": lat, "lon": lon},
             "timestamp": date or datetime.utcnow().isoformat(),
-            "measurements": {
-                "no2": self._get_realistic_no2(lat, lon),
-                "o3": self._get_realistic_o3(lat, lon),
-                "hcho": self._get_realistic_hcho(lat, lon),
-                "pm25": self._get_realistic_pm25(lat, lon),
-                "aerosolIndex": self._get_realistic_aerosol(lat, lon),
-            },
-            "quality": "mixed" if not self.use_real else "provisional",
-            "source": "NASA TEMPO (synthetic fallback)" if not self.use_real else "NASA TEMPO (Search OK, sampled synthetic)",
+            "measurements": measurements,
+            "quality": "mixed",
+            "source": "NASA TEMPO (synthetic fallback)",
             "satellite": "TEMPO",
-            "resolution": "~5km (synthetic)" if not self.use_real else "2.1 km x 4.7 km",
+            "resolution": "~5km (synthetic)",
         }
-
-        self._cache[key] = {"_cached_at": datetime.utcnow().timestamp(), "data": data}
+        if columns:
+            # Column densities are not surface concentrations; only the unitless
+            # aerosol index replaces its synthetic counterpart
+            if "aerosolIndex" in columns:
+                measurements["aerosolIndex"] = round(columns["aerosolIndex"], 2)
+            data.update({
+                "columns": {
+                    var: {"value": value, "unit": PRODUCTS[var].unit} for var, value in columns.items()
+                },
+                "cubeSlice": slice_key,
+                "quality": "provisional",
+                "source": "NASA TEMPO L2 (local cube) + synthetic surface estimates",
+                "resolution": "native swath pixel" if native else f"{self.cube.grid.res} deg regridded",
+            })
         return data
-    
+
+    async def _sample_native(self, time_key: str, lat: float, lon: float) -> Dict[str, float]:
+        """Nearest-pixel values from the hour's granules; the first granule covering the point wins."""
+        out: Dict[str, float] = {}
+        for granule in self.cube.granule_files(time_key):
+            try:
+                sampled = await self.sample_swath(granule, np.array([lat]), np.array([lon]))
+            except Exception as e:  # pruned meanwhile or unreadable: keep the regridded values
+                logger.debug("Swath sample of %s failed: %s", granule, e)
+                continue
+            for var, values in sampled.items():
+                if var not in out and np.isfinite(values[0]):
+                    out[var] = float(values[0])
+        return out
+
+    @property
+    def cube(self) -> Optional[TEMPOCube]:
+        """Local regridded cube, opened on first use."""
+        if self._cube is None and self.cube_dir:
+            self._cube = TEMPOCube(self.cube_dir, max_slices=int(os.getenv("TEMPO_CUBE_MAX_SLICES", 48)))
+        return self._cube
+
+    def data_version(self) -> str:
+        """Changes whenever new observations land (latest ingested cube hour)."""
+        cube = self.cube if self.use_real else None
+        return (cube.latest() or "") if cube is not None else ""
+
+    def _schedule_ingest(self) -> None:
+        """Start a background ingestion run at most once per ingest interval."""
+        if earthaccess is None or (self._ingest_task is not None and not self._ingest_task.done()):
+            return
+        if self._last_ingest is not None and time.monotonic() - self._last_ingest < self.ingest_interval:
+            return
+        self._last_ingest = time.monotonic()
+        self._ingest_task = asyncio.create_task(self._ingest_safely())
+
+    async def _ingest_safely(self) -> None:
+        try:
+            count = await self.ingest_recent()
+            logger.info("TEMPO ingestion added %d granules", count)
+        except Exception:
+            logger.exception("TEMPO ingestion failed")
+
+    async def ingest_recent(self, hours: int = 3) -> int:  # pragma: no cover (network side-effect)
+        """Search, download and regrid the last ``hours`` of granules over the cube grid.
+
+        The window never exceeds the cube's retention (``max_slices`` hours), so
+        granules whose slice was already pruned are not downloaded again.
+        """
+        await self._ensure_login()
+        if not self._logged_in:
+            return 0
+        grid = self.cube.grid
+        hours = min(hours, self.cube.max_slices)
+        end = datetime.utcnow()
+        temporal = ((end - timedelta(hours=hours)).isoformat(), end.isoformat())
+        granule_dir = os.path.join(self.cube.root, "granules")
+        os.makedirs(granule_dir, exist_ok=True)
+        products: Dict[str, List[str]] = {}
+        for var, product in PRODUCTS.items():
+            products.setdefault(product.short_name, []).append(var)
+        count = 0
+        for short_name, variables in products.items():
+            results = await self.upstream.call("search", lambda: asyncio.to_thread(
+                earthaccess.search_data,
+                short_name=short_name,
+                bounding_box=(grid.lon_min, grid.lat_min, grid.lon_max, grid.lat_max),
+                temporal=temporal,
+            ))
+            if not results:
+                continue
+            paths = await self.upstream.call(
+                "download", lambda: asyncio.to_thread(earthaccess.download, results, granule_dir)
+            )
+            count += await self.ingest_files([str(p) for p in paths], variables)
+        return count
+
+    async def ingest_files(self, paths: List[str], variables: Optional[List[str]] = None) -> int:
+        """Regrid local granule files into the cube off the event loop; returns granules added."""
+        count = 0
+        for path in paths:
+            if self.cube.has_granule(path):
+                continue
+            if await asyncio.to_thread(self.cube.ingest, path, variables):
+                # Build the granule's pixel index now so later point samples skip it
+                await asyncio.to_thread(SwathIndex.for_granule, path)
+                count += 1
+        return count
+
+    async def sample_swath(self, granule: str, lat, lon, mode: str = "nearest") -> Dict[str, np.ndarray]:
+        """Native-resolution values of a downloaded granule at many points (see swath_index.py)."""
+        variables = {var: product.variable for var, product in PRODUCTS.items()}
+        return await asyncio.to_thread(sample_granule, granule, variables, lat, lon, mode)
+
     # ---------- Internal modulation helpers ----------
+    # Scalar path (one point) and array path (sample_grid) share the same
+    # operations in the same order so both give identical values.
     def _stable_hash(self, lat: float, lon: float) -> float:
-        """Stable fractional hash in [0,1) for a lat/lon pair."""
-        h = hash((round(lat, 4), round(lon, 4))) & 0xFFFFFFFF
-        return (h / 0xFFFFFFFF)
+        """Stable fractional hash in [0,1) for a lat/lon pair (same in every process)."""
+        key = ((int(round(lat * 1e4)) & _MASK32) << 32) | (int(round(lon * 1e4)) & _MASK32)
+        return (_splitmix64(key) & _MASK32) / _MASK32
 
-    def _diurnal(self, amplitude: float = 1.0, phase_shift: float = 0.0) -> float:
+    def _diurnal(self, amplitude: float = 1.0, phase_shift: float = 0.0, hour: Optional[int] = None) -> float:
         """Smooth diurnal cycle (0..amplitude) based on UTC hour."""
-        hour = datetime.utcnow().hour + phase_shift
+        hour = (datetime.utcnow().hour if hour is None else hour) + phase_shift
         return (math.sin((hour / 24.0) * 2 * math.pi) * 0.5 + 0.5) * amplitude
 
     def _lat_band(self, lat: float, center: float, width: float, scale: float) -> float:
@@ -155,14 +354,7 @@ class TEMPOService:
 
     def _urban_bias(self, lat: float, lon: float) -> float:
         """Additive bias for a few known metro regions (simplified)."""
-        metros = [
-            (40.7128, -74.0060, 6.0),   # NYC
-            (34.0522, -118.2437, 7.5),  # LA
-            (51.5074, -0.1278, 5.0),    # London
-            (28.6139, 77.2090, 5.5),    # Delhi
-            (35.6762, 139.6503, 5.0),   # Tokyo
-        ]
-        for mlat, mlon, bias in metros:
+        for mlat, mlon, bias in METROS:
             if abs(lat - mlat) < 1 and abs(lon - mlon) < 1:
                 return bias
         return 0.0
@@ -170,97 +362,95 @@ class TEMPOService:
     def _apply_formula(self, base: float, lat: float, lon: float, *,
                         diurnal_amp: float, lat_center: float, lat_width: float,
                         lat_scale: float, hash_amp: float, phase: float = 0.0,
-                        urban: bool = False) -> float:
+                        urban: bool = False, hour: Optional[int] = None) -> float:
         frac = self._stable_hash(lat, lon)
-        diurnal = self._diurnal(diurnal_amp, phase)
+        diurnal = self._diurnal(diurnal_amp, phase, hour)
         lat_mod = self._lat_band(lat, lat_center, lat_width, lat_scale)
         hash_mod = (frac - 0.5) * 2 * hash_amp  # symmetric around 0
         urban_bias = self._urban_bias(lat, lon) if urban else 0.0
         return base + diurnal + lat_mod + hash_mod + urban_bias
 
-    def _get_realistic_no2(self, lat: float, lon: float) -> float:
+    def _realistic(self, field: str, lat: float, lon: float, hour: Optional[int] = None) -> float:
+        spec = dict(SYNTHETIC_FIELDS[field])
+        floor = spec.pop("floor")
+        val = self._apply_formula(lat=lat, lon=lon, hour=hour, **spec)
+        return round(max(val, floor) * 100) / 100
+
+    def _get_realistic_no2(self, lat: float, lon: float, hour: Optional[int] = None) -> float:
         """Deterministic NO2 with diurnal + latitude + urban modulation."""
-        val = self._apply_formula(
-            base=14.0,
-            lat=lat,
-            lon=lon,
-            diurnal_amp=4.0,
-            lat_center=30.0,
-            lat_width=25.0,
-            lat_scale=3.0,
-            hash_amp=2.5,
-            phase=1.0,
-            urban=True,
-        )
-        return round(max(val, 1.0), 2)
-    
-    def _get_realistic_o3(self, lat: float, lon: float) -> float:
+        return self._realistic("no2", lat, lon, hour)
+
+    def _get_realistic_o3(self, lat: float, lon: float, hour: Optional[int] = None) -> float:
         """Deterministic O3 with subtropical enhancement and broad diurnal."""
-        val = self._apply_formula(
-            base=42.0,
-            lat=lat,
-            lon=lon,
-            diurnal_amp=6.0,
-            lat_center=25.0,
-            lat_width=30.0,
-            lat_scale=5.0,
-            hash_amp=3.5,
-            phase=0.0,
-            urban=False,
-        )
-        return round(max(val, 5.0), 2)
-    
-    def _get_realistic_hcho(self, lat: float, lon: float) -> float:
+        return self._realistic("o3", lat, lon, hour)
+
+    def _get_realistic_hcho(self, lat: float, lon: float, hour: Optional[int] = None) -> float:
         """Formaldehyde higher in tropical latitudes; mild day modulation."""
-        val = self._apply_formula(
-            base=1.6,
-            lat=lat,
-            lon=lon,
-            diurnal_amp=0.6,
-            lat_center=5.0,
-            lat_width=25.0,
-            lat_scale=1.2,
-            hash_amp=0.5,
-            phase=2.0,
-            urban=False,
-        )
-        return round(max(val, 0.2), 2)
-    
-    def _get_realistic_pm25(self, lat: float, lon: float) -> float:
+        return self._realistic("hcho", lat, lon, hour)
+
+    def _get_realistic_pm25(self, lat: float, lon: float, hour: Optional[int] = None) -> float:
         """PM2.5 with modest urban + weak diurnal + hash variability."""
-        val = self._apply_formula(
-            base=10.0,
-            lat=lat,
-            lon=lon,
-            diurnal_amp=2.0,
-            lat_center=23.0,
-            lat_width=40.0,
-            lat_scale=2.5,
-            hash_amp=5.0,
-            phase=1.5,
-            urban=True,
-        )
-        return round(max(val, 2.0), 2)
-    
-    def _get_realistic_aerosol(self, lat: float, lon: float) -> float:
+        return self._realistic("pm25", lat, lon, hour)
+
+    def _get_realistic_aerosol(self, lat: float, lon: float, hour: Optional[int] = None) -> float:
         """Aerosol index with slight tropical + hash modulation."""
-        val = self._apply_formula(
-            base=0.7,
-            lat=lat,
-            lon=lon,
-            diurnal_amp=0.15,
-            lat_center=10.0,
-            lat_width=35.0,
-            lat_scale=0.25,
-            hash_amp=0.25,
-            phase=0.3,
-            urban=False,
-        )
-        return round(max(val, 0.05), 2)
-    
+        return self._realistic("aerosolIndex", lat, lon, hour)
+
+    def sample_grid(self, lat: np.ndarray, lon: np.ndarray, hour: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """All synthetic TEMPO fields at every (lat, lon) in one array pass.
+
+        The hash and metro bias are computed once and shared by the five
+        fields; the diurnal term is computed once per field for the whole grid.
+        Values equal the scalar ``_get_realistic_*`` results.
+        """
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        hour = datetime.utcnow().hour if hour is None else hour
+        flat_lat, flat_lon = np.atleast_1d(lat.ravel()), np.atleast_1d(lon.ravel())
+        frac = _stable_hash_array(flat_lat, flat_lon)
+        urban_bias = _urban_bias_array(flat_lat, flat_lon)
+        # exp via math on the distinct latitudes (grid rows), matching the scalar path bit for bit
+        uniq_lat, lat_idx = np.unique(flat_lat, return_inverse=True)
+
+        fields = {}
+        for name, spec in SYNTHETIC_FIELDS.items():
+            diurnal = self._diurnal(spec["diurnal_amp"], spec["phase"], hour)
+            lat_mod = np.array([
+                self._lat_band(v, spec["lat_center"], spec["lat_width"], spec["lat_scale"]) for v in uniq_lat.tolist()
+            ])[lat_idx]
+            hash_mod = (frac - 0.5) * 2 * spec["hash_amp"]
+            val = spec["base"] + diurnal + lat_mod + hash_mod
+            if spec["urban"]:
+                val = val + urban_bias
+            fields[name] = (np.rint(np.maximum(val, spec["floor"]) * 100) / 100).reshape(lat.shape)
+        return fields
+
+    async def sample_points(self, lat: np.ndarray, lon: np.ndarray) -> List[Dict[str, float]]:
+        """Measurements for many points, as ``fetch_tempo_data(lat[i], lon[i])`` reports them.
+
+        Synthetic mode scores every point in one ``sample_grid`` pass; with the
+        real cube each point goes through the (cached) single-point path so
+        cube and swath reads match it exactly.
+        """
+        lat = np.atleast_1d(np.asarray(lat, dtype=float))
+        lon = np.atleast_1d(np.asarray(lon, dtype=float))
+        if not (self.use_real and self.cube is not None):
+            fields = self.sample_grid(lat, lon)
+            columns = {name: values.tolist() for name, values in fields.items()}
+            return [dict(zip(columns, row)) for row in zip(*columns.values())]
+        results = await asyncio.gather(*(
+            self.fetch_tempo_data(a, b) for a, b in zip(lat.tolist(), lon.tolist())
+        ))
+        return [(r or {}).get("measurements", {}) for r in results]
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared pooled client, created on first use inside the event loop"""
+        return http_client("tempo", timeout=30.0)
+
     async def close(self):
         """Close the HTTP client"""
-        await self.client.aclose()
+        await close_client("tempo")
 
 # Singleton instance
 tempo_service = TEMPOService()
@@ -0,0 +1,189 @@
+"""Local Time-Series Store
+
+Hourly observations per series (a ground station or a TEMPO tile) kept on
+disk as columnar NumPy segments, one memory-mapped file per (series, UTC day),
+so range scans over weeks of data are a few array slices with no upstream
+calls.
+
+Layout under the store directory:
+    <series>/<YYYYMMDD>.npy     float32 (24 hours x PARAMETERS), NaN = no observation
+
+Segments only grow: observations fill the slot of their hour (a later value
+for the same hour, e.g. an updated ``lastValue``, replaces it) and past days
+are never rewritten, only dropped whole by ``prune``. A new segment is
+written to a temporary file and moved into place with ``os.replace``, so
+readers never see a partial file; existing segments are updated in place
+through a shared mapping.
+
+Rolling aggregates follow the AQI conventions: 8-hour O3 and 24-hour PM2.5
+means, each reported only when at least 75% of the window's hours are present.
+"""
+from __future__ import annotations
+
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Column order of every segment
+PARAMETERS: Tuple[str, ...] = ("pm25", "pm10", "o3", "no2", "so2", "co", "bc", "hcho", "aerosolIndex")
+_PARAM_INDEX = {p: i for i, p in enumerate(PARAMETERS)}
+# Name -> (parameter, window hours)
+AGGREGATES: Dict[str, Tuple[str, int]] = {"o3_8h": ("o3", 8), "pm25_24h": ("pm25", 24)}
+MIN_COVERAGE = 0.75
+_SERIES_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+Record = Tuple[str, datetime, Dict[str, float]]  # (series, observed at, parameter -> value)
+
+
+def _hour(ts: datetime) -> datetime:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+class TimeSeriesStore:
+    def __init__(self, root: str, max_open: int = 256):
+        self.root = root
+        self.max_open = max_open
+        os.makedirs(root, exist_ok=True)
+        self._open: "OrderedDict[str, np.memmap]" = OrderedDict()  # read-only segment maps (LRU)
+        self._lock = threading.Lock()  # guards _open and segment writes
+        self.appended = 0
+
+    # ---------- paths ----------
+    def _segment_path(self, series: str, day: datetime) -> str:
+        if not _SERIES_RE.match(series):
+            raise ValueError(f"invalid series name {series!r}")
+        return os.path.join(self.root, series, f"{day:%Y%m%d}.npy")
+
+    def series(self) -> List[str]:
+        return sorted(d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d)))
+
+    # ---------- writes ----------
+    def append(self, records: Iterable[Record]) -> int:
+        """Write observations; returns the number of values stored.
+
+        Records are grouped per segment so each file is opened once per call.
+        Unknown parameters and non-finite values are skipped.
+        """
+        grouped: Dict[Tuple[str, datetime], List[Tuple[int, int, float]]] = {}
+        for series, ts, values in records:
+            hour = _hour(ts)
+            day = hour.replace(hour=0)
+            for name, value in values.items():
+                col = _PARAM_INDEX.get(name)
+                if col is None or value is None or not np.isfinite(value):
+                    continue
+                grouped.setdefault((series, day), []).append((hour.hour, col, float(value)))
+        stored = 0
+        with self._lock:
+            for (series, day), cells in grouped.items():
+                path = self._segment_path(series, day)
+                segment = self._writable(path)
+                rows, cols, vals = zip(*cells)
+                segment[list(rows), list(cols)] = vals
+                segment.flush()
+                del segment
+                stored += len(cells)
+        self.appended += stored
+        return stored
+
+    def _writable(self, path: str) -> np.memmap:
+        if os.path.exists(path):
+            return np.lib.format.open_memmap(path, mode="r+")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        segment = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(24, len(PARAMETERS)))
+        segment[:] = np.nan
+        segment.flush()
+        os.replace(tmp, path)
+        return np.lib.format.open_memmap(path, mode="r+")
+
+    # ---------- reads ----------
+    def _segment(self, series: str, day: datetime) -> Optional[np.ndarray]:
+        path = self._segment_path(series, day)
+        with self._lock:
+            segment = self._open.get(path)
+            if segment is not None:
+                self._open.move_to_end(path)
+                return segment
+            if not os.path.exists(path):
+                return None
+            segment = np.load(path, mmap_mode="r")
+            self._open[path] = segment
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+            return segment
+
+    def scan(self, series: str, start: datetime, end: datetime,
+             parameters: Optional[Sequence[str]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(hour timestamps, hours x parameters values) for ``start <= t < end``.
+
+        Every hour in the range gets a row; hours without data are NaN.
+        """
+        start, end = _hour(start), _hour(end)
+        hours = max(int((end - start).total_seconds() // 3600), 0)
+        cols = [_PARAM_INDEX[p] for p in parameters] if parameters else list(range(len(PARAMETERS)))
+        out = np.full((hours, len(cols)), np.nan, dtype=np.float32)
+        day = start.replace(hour=0)
+        while day < end:
+            segment = self._segment(series, day)
+            if segment is not None:
+                first = max(int((start - day).total_seconds() // 3600), 0)
+                last = min(int((end - day).total_seconds() // 3600), 24)
+                offset = int((day - start).total_seconds() // 3600)
+                out[offset + first:offset + last] = segment[first:last][:, cols]
+            day += timedelta(days=1)
+        times = np.datetime64(start.replace(tzinfo=None), "h") + np.arange(hours)
+        return times, out
+
+    def rolling_mean(self, series: str, parameter: str, window: int, start: datetime, end: datetime,
+                     min_coverage: float = MIN_COVERAGE) -> Tuple[np.ndarray, np.ndarray]:
+        """Trailing ``window``-hour means ending at each hour in [start, end).
+
+        Hours whose window has fewer than ``min_coverage * window`` observations are NaN.
+        """
+        start = _hour(start)
+        times, values = self.scan(series, start - timedelta(hours=window - 1), end, [parameter])
+        values = values[:, 0].astype(float)
+        present = ~np.isnan(values)
+        sums = np.concatenate([[0.0], np.cumsum(np.where(present, values, 0.0))])
+        counts = np.concatenate([[0], np.cumsum(present)])
+        window_sums = sums[window:] - sums[:-window]
+        window_counts = counts[window:] - counts[:-window]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = window_sums / window_counts
+        means[window_counts < min_coverage * window] = np.nan
+        return times[window - 1:], means
+
+    # ---------- retention ----------
+    def prune(self, keep_days: int, now: Optional[datetime] = None) -> int:
+        """Delete segments older than ``keep_days`` (and emptied series); returns files removed."""
+        cutoff = f"{_hour(now or datetime.now(timezone.utc)) - timedelta(days=keep_days):%Y%m%d}"
+        removed = 0
+        with self._lock:
+            for series in self.series():
+                folder = os.path.join(self.root, series)
+                for name in os.listdir(folder):
+                    if name.endswith(".npy") and name[:-4] < cutoff:
+                        path = os.path.join(folder, name)
+                        self._open.pop(path, None)
+                        os.remove(path)
+                        removed += 1
+                if not os.listdir(folder):
+                    shutil.rmtree(folder, ignore_errors=True)
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "root": self.root,
+            "series": len(self.series()),
+            "openSegments": len(self._open),
+            "appended": self.appended,
+        }
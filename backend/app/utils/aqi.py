@@ -1,12 +1,24 @@
 """AQI Calculation Utilities
 
 Implements US EPA AQI breakpoint-based subindex calculation for common pollutants.
-Currently supports PM2.5 (24h), O3 (8h), NO2 (1h approximate), and can be extended.
+Pollutants are declared in a data-driven registry (``POLLUTANTS``): each entry
+lists its breakpoints, units, averaging period and truncation rule. At import
+time every entry is compiled into slope/intercept tables, so a subindex is one
+bisect plus one multiply-add. Adding a pollutant is a new registry entry.
 
 Returns both overall AQI and dominant pollutant.
+
+``compute_aqi_array`` is the vectorized counterpart for batch / grid workloads:
+it scores NumPy arrays with ``np.searchsorted`` over the same compiled tables
+and returns exactly the values ``compute_aqi`` would.
 """
 from __future__ import annotations
-from typing import Dict, Optional, Tuple
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from math import floor, isfinite
+
+import numpy as np
 
 # Breakpoints: (C_low, C_high, I_low, I_high)
 PM25_BREAKPOINTS = [
@@ -19,6 +31,16 @@ PM25_BREAKPOINTS = [
     (350.5, 500.4, 401, 500),
 ]
 
+PM10_BREAKPOINTS = [
+    (0, 54, 0, 50),
+    (55, 154, 51, 100),
+    (155, 254, 101, 150),
+    (255, 354, 151, 200),
+    (355, 424, 201, 300),
+    (425, 504, 301, 400),
+    (505, 604, 401, 500),
+]
+
 O3_8H_BREAKPOINTS_PPb = [  # Using ppb for simplicity
     (0, 54, 0, 50),
     (55, 70, 51, 100),
@@ -27,6 +49,14 @@ O3_8H_BREAKPOINTS_PPb = [  # Using ppb for simplicity
     (106, 200, 201, 300),  # Extended
 ]
 
+O3_1H_BREAKPOINTS_PPb = [  # 1h ozone only defines AQI >= 101
+    (125, 164, 101, 150),
+    (165, 204, 151, 200),
+    (205, 404, 201, 300),
+    (405, 504, 301, 400),
+    (505, 604, 401, 500),
+]
+
 NO2_1H_BREAKPOINTS_PPb = [
     (0, 53, 0, 50),
     (54, 100, 51, 100),
@@ -35,42 +65,158 @@ NO2_1H_BREAKPOINTS_PPb = [
     (650, 1249, 201, 300),
 ]
 
-def _calc_subindex(conc: float, breakpoints) -> Optional[float]:
-    for c_low, c_high, i_low, i_high in breakpoints:
-        if c_low <= conc <= c_high:
-            return ( (i_high - i_low) / (c_high - c_low) ) * (conc - c_low) + i_low
-    return None
+SO2_1H_BREAKPOINTS_PPb = [
+    (0, 35, 0, 50),
+    (36, 75, 51, 100),
+    (76, 185, 101, 150),
+    (186, 304, 151, 200),
+    (305, 604, 201, 300),
+    (605, 804, 301, 400),
+    (805, 1004, 401, 500),
+]
+
+CO_8H_BREAKPOINTS_PPM = [
+    (0.0, 4.4, 0, 50),
+    (4.5, 9.4, 51, 100),
+    (9.5, 12.4, 101, 150),
+    (12.5, 15.4, 151, 200),
+    (15.5, 30.4, 201, 300),
+    (30.5, 40.4, 301, 400),
+    (40.5, 50.4, 401, 500),
+]
+
+
+@dataclass(frozen=True)
+class Pollutant:
+    """Registry entry: how one pollutant key maps to an AQI subindex."""
+    code: str                 # key in the pollutants dict
+    name: str
+    unit: str                 # "ug/m3", "ppb" or "ppm"
+    averaging: str            # averaging period the breakpoints assume
+    decimals: int             # concentrations are truncated to this many decimals
+    breakpoints: Tuple[Tuple[float, float, int, int], ...]
+    molecular_weight: Optional[float] = None  # g/mol, for mass <-> mixing-ratio units
+
+
+# Registry order is also the tie-break order for the dominant pollutant
+POLLUTANTS: Dict[str, Pollutant] = {p.code: p for p in (
+    Pollutant("pm25", "PM2.5", "ug/m3", "24h", 1, tuple(PM25_BREAKPOINTS)),
+    Pollutant("pm10", "PM10", "ug/m3", "24h", 0, tuple(PM10_BREAKPOINTS)),
+    Pollutant("o3", "Ozone (8h)", "ppb", "8h", 0, tuple(O3_8H_BREAKPOINTS_PPb), 48.00),
+    Pollutant("o3_1h", "Ozone (1h)", "ppb", "1h", 0, tuple(O3_1H_BREAKPOINTS_PPb), 48.00),
+    Pollutant("no2", "Nitrogen Dioxide", "ppb", "1h", 0, tuple(NO2_1H_BREAKPOINTS_PPb), 46.01),
+    Pollutant("so2", "Sulfur Dioxide", "ppb", "1h", 0, tuple(SO2_1H_BREAKPOINTS_PPb), 64.07),
+    Pollutant("co", "Carbon Monoxide", "ppm", "8h", 1, tuple(CO_8H_BREAKPOINTS_PPM), 28.01),
+)}
+
+# Array codes: dominant pollutant -> index into POLLUTANT_CODES, category -> index
+# into AQI_CATEGORIES; -1 means no valid subindex ("Unknown")
+POLLUTANT_CODES = tuple(POLLUTANTS)
+AQI_CATEGORIES = (
+    "Good",
+    "Moderate",
+    "Unhealthy for Sensitive Groups",
+    "Unhealthy",
+    "Very Unhealthy",
+    "Hazardous",
+)
+_CATEGORY_UPPER = np.array([50, 100, 150, 200, 300])
+
+# Nudge before truncating so e.g. 0.29 * 100 (= 28.999...) truncates to 29
+_TRUNC_EPS = 1e-9
+
+# Molar volume (L/mol) at 25 °C, 1 atm: ppb = ug/m3 * 24.45 / MW
+_MOLAR_VOLUME = 24.45
+_UNIT_ALIASES = {
+    "µg/m³": "ug/m3", "ug/m³": "ug/m3", "µg/m3": "ug/m3", "ug/m3": "ug/m3",
+    "mg/m³": "mg/m3", "mg/m3": "mg/m3", "ppb": "ppb", "ppm": "ppm",
+}
+
+
+@dataclass(frozen=True)
+class _CompiledPollutant:
+    """Slope/intercept tables for one registry entry (lists for bisect, arrays for NumPy)."""
+    scale: float
+    c_low: List[float]
+    c_high: List[float]
+    slope: List[float]
+    intercept: List[float]
+    arrays: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+def _compile(p: Pollutant) -> _CompiledPollutant:
+    c_low = [float(b[0]) for b in p.breakpoints]
+    c_high = [float(b[1]) for b in p.breakpoints]
+    slope = [(i_high - i_low) / (ch - cl) for cl, ch, i_low, i_high in p.breakpoints]
+    intercept = [b[2] - m * cl for b, m, cl in zip(p.breakpoints, slope, c_low)]
+    return _CompiledPollutant(
+        scale=float(10 ** p.decimals),
+        c_low=c_low,
+        c_high=c_high,
+        slope=slope,
+        intercept=intercept,
+        arrays=tuple(np.array(v) for v in (c_low, c_high, slope, intercept)),
+    )
+
+
+_COMPILED: Dict[str, _CompiledPollutant] = {code: _compile(p) for code, p in POLLUTANTS.items()}
+_RANK = {code: i for i, code in enumerate(POLLUTANT_CODES)}
+
+
+def convert_units(value: float, unit: Optional[str], code: str) -> Optional[float]:
+    """Convert a reading to the registry unit for ``code`` (None if impossible)."""
+    p = POLLUTANTS[code]
+    src = _UNIT_ALIASES.get((unit or p.unit).strip().lower(), None)
+    if src is None:
+        return None
+    if src == p.unit:
+        return value
+    # Normalize to ppb or ug/m3 first
+    if src == "mg/m3":
+        value, src = value * 1000.0, "ug/m3"
+    if src == "ppm":
+        value, src = value * 1000.0, "ppb"
+    if src == p.unit:
+        return value
+    if p.molecular_weight is None:
+        return None
+    if src == "ug/m3":  # -> ppb
+        value = value * _MOLAR_VOLUME / p.molecular_weight
+    elif p.unit == "ug/m3":  # ppb -> ug/m3
+        value = value * p.molecular_weight / _MOLAR_VOLUME
+    return value / 1000.0 if p.unit == "ppm" else value
+
 
 def compute_aqi(pollutants: Dict[str, float]) -> Dict[str, Optional[str] | int | Dict[str, float]]:
     """Compute AQI and dominant pollutant.
 
-    pollutants keys expected (optional): pm25 (µg/m3), o3 (ppb), no2 (ppb)
+    pollutants keys (optional): any registry code, e.g. pm25/pm10 (µg/m3),
+    o3/o3_1h/no2/so2 (ppb), co (ppm)
     """
     subindices: Dict[str, float] = {}
+    dominant, best, best_rank = None, -1.0, 0
+
+    for code, conc in pollutants.items():
+        table = _COMPILED.get(code)
+        if table is None or conc is None or not isfinite(conc):
+            continue
+        # Truncate, bisect to the breakpoint band, then one multiply-add
+        scale = table.scale
+        conc = floor(conc * scale + _TRUNC_EPS) / scale
+        i = bisect_right(table.c_low, conc) - 1
+        if i < 0 or conc > table.c_high[i]:
+            continue
+        si = table.slope[i] * conc + table.intercept[i]
+        subindices[code] = si
+        # Ties go to the earlier registry entry (same as compute_aqi_array)
+        rank = _RANK[code]
+        if si > best or (si == best and rank < best_rank):
+            dominant, best, best_rank = code, si, rank
 
-    pm25 = pollutants.get("pm25")
-    if pm25 is not None:
-        si = _calc_subindex(pm25, PM25_BREAKPOINTS)
-        if si is not None:
-            subindices["pm25"] = si
-
-    o3 = pollutants.get("o3")
-    if o3 is not None:
-        si = _calc_subindex(o3, O3_8H_BREAKPOINTS_PPb)
-        if si is not None:
-            subindices["o3"] = si
-
-    no2 = pollutants.get("no2")
-    if no2 is not None:
-        si = _calc_subindex(no2, NO2_1H_BREAKPOINTS_PPb)
-        if si is not None:
-            subindices["no2"] = si
-
-    if not subindices:
+    if dominant is None:
         return {"value": 0, "dominant": None, "category": "Unknown", "subindices": {}}
 
-    dominant, value = max(subindices.items(), key=lambda kv: kv[1])
-    aqi_value = round(value)
+    aqi_value = round(best)
     category = _aqi_category(aqi_value)
     return {"value": aqi_value, "dominant": dominant, "category": category, "subindices": {k: round(v, 1) for k, v in subindices.items()}}
 
@@ -86,3 +232,80 @@ def _aqi_category(aqi: int) -> str:
     if aqi <= 300:
         return "Very Unhealthy"
     return "Hazardous"
+
+
+def aqi_category_index(aqi) -> np.ndarray:
+    """Index into AQI_CATEGORIES for AQI value(s) (same bands as compute_aqi)."""
+    return np.searchsorted(_CATEGORY_UPPER, aqi, side="left")
+
+
+def _subindex_array(conc: np.ndarray, table: _CompiledPollutant) -> np.ndarray:
+    """Vectorized subindex (see compute_aqi); NaN where no breakpoint matches."""
+    c_low, c_high, slope, intercept = table.arrays
+    with np.errstate(invalid="ignore"):
+        conc = np.floor(conc * table.scale + _TRUNC_EPS) / table.scale
+    idx = np.searchsorted(c_low, conc, side="right") - 1
+    safe = np.clip(idx, 0, len(c_low) - 1)
+    valid = (idx >= 0) & (conc <= c_high[safe])  # NaN compares False
+    with np.errstate(invalid="ignore"):
+        si = slope[safe] * conc + intercept[safe]
+    return np.where(valid, si, np.nan)
+
+
+def compute_aqi_array(pm25=None, o3=None, no2=None, **others) -> Dict[str, np.ndarray]:
+    """Vectorized compute_aqi over broadcastable concentration arrays.
+
+    Accepts any registry code as a keyword (pm10=..., so2=..., co=...).
+    Missing pollutants may be passed as None; NaN marks a missing value.
+    Returns arrays: ``value`` (int, 0 when unknown), ``dominant`` (index into
+    POLLUTANT_CODES), ``category`` (index into AQI_CATEGORIES) - both -1 when
+    no subindex is valid - and ``subindices`` (..., len(POLLUTANT_CODES)).
+    """
+    unknown = set(others) - set(POLLUTANTS)
+    if unknown:
+        raise TypeError(f"Unknown pollutant(s): {', '.join(sorted(unknown))}")
+    given = {"pm25": pm25, "o3": o3, "no2": no2, **others}
+    inputs = [np.nan if given.get(code) is None else given[code] for code in POLLUTANT_CODES]
+    arrays = np.broadcast_arrays(*(np.asarray(c, dtype=float) for c in inputs))
+    sub = np.stack([
+        _subindex_array(conc, _COMPILED[code]) for code, conc in zip(POLLUTANT_CODES, arrays)
+    ], axis=-1)
+
+    known = ~np.isnan(sub).all(axis=-1)
+    # argmax returns the first maximum, matching max() over registry order in compute_aqi
+    dominant = np.argmax(np.where(np.isnan(sub), -np.inf, sub), axis=-1)
+    best = np.take_along_axis(sub, dominant[..., None], axis=-1)[..., 0]
+    value = np.where(known, np.rint(np.where(known, best, 0.0)), 0).astype(np.int64)
+    category = np.searchsorted(_CATEGORY_UPPER, value, side="left")
+    return {
+        "value": value,
+        "dominant": np.where(known, dominant, -1).astype(np.int8),
+        "category": np.where(known, category, -1).astype(np.int8),
+        "subindices": sub,
+    }
+
+
+def compute_aqi_many(pollutants: Sequence[Dict[str, float]]) -> List[Dict[str, Any]]:
+    """compute_aqi for many pollutant dicts with one vectorized pass."""
+    if not pollutants:
+        return []
+    columns = {
+        code: np.array([np.nan if p.get(code) is None else p[code] for p in pollutants], dtype=float)
+        for code in POLLUTANT_CODES
+    }
+    arr = compute_aqi_array(**columns)
+    results = []
+    for i in range(len(pollutants)):
+        if arr["dominant"][i] < 0:
+            results.append({"value": 0, "dominant": None, "category": "Unknown", "subindices": {}})
+            continue
+        row = arr["subindices"][i]
+        results.append({
+            "value": int(arr["value"][i]),
+            "dominant": POLLUTANT_CODES[arr["dominant"][i]],
+            "category": AQI_CATEGORIES[arr["category"][i]],
+            "subindices": {
+                code: round(float(v), 1) for code, v in zip(POLLUTANT_CODES, row) if not np.isnan(v)
+            },
+        })
+    return results
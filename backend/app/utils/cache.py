@@ -0,0 +1,552 @@
+"""Async Cache Layer
+
+Bounded LRU + TTL cache used in front of upstream services (TEMPO, OpenAQ),
+optionally backed by a shared Redis tier so all uvicorn workers reuse each
+other's upstream results.
+
+Features:
+    - max entry count and approximate byte budget, least-recently-used eviction
+    - per-entry TTL expiry (expired entries are dropped on access / purge)
+    - single-flight loading: concurrent misses for one key share a single
+      loader call instead of each hitting the upstream
+    - background refresh of a live entry (readers keep the old value meanwhile)
+    - optional stale window: expired entries are kept for ``stale_ttl`` more
+      seconds and served, marked stale, while a background reload runs or
+      when the upstream is failing
+    - hit / miss / eviction / coalesced-wait counters for sizing
+
+Two-tier layout (``TieredCache``):
+    L1  AsyncTTLCache in process memory
+    L2  CacheBackend shared across workers (RedisCacheBackend when REDIS_URL is
+        set, MemoryCacheBackend as a stub for tests / single-process runs)
+An L1 miss goes to L2 before the loader; single-flight covers both tiers.
+
+Environment Variables:
+    REDIS_URL                 -> enable the shared L2 tier (e.g. redis://redis:6379)
+    REDIS_MAX_CONNECTIONS     -> connection pool size (default 20)
+    CACHE_KEY_PREFIX          -> namespace for L2 keys (default "skycast:v1")
+
+Every named cache registers itself so its counters can be reported by the
+``/metrics`` endpoint via ``cache_stats()``.
+"""
+from __future__ import annotations
+
+import abc
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+try:
+    import redis.asyncio as aioredis  # type: ignore
+except Exception:  # pragma: no cover
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+_REGISTRY: "weakref.WeakValueDictionary[str, Any]" = weakref.WeakValueDictionary()
+
+# Payloads at least this large are zlib-compressed before going to L2
+_COMPRESS_THRESHOLD = 1024
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate deep size (bytes) of a JSON-like value."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += estimate_size(k) + estimate_size(v)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for v in value:
+            size += estimate_size(v)
+    return size
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Counters for every live named cache."""
+    return {name: cache.stats() for name, cache in sorted(_REGISTRY.items())}
+
+
+class AsyncTTLCache:
+    """Bounded LRU cache with TTL expiry and single-flight async loading."""
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float = 300.0,
+        max_entries: int = 1024,
+        max_bytes: int = 16 * 1024 * 1024,
+        clock: Callable[[], float] = time.monotonic,
+        stale_ttl: float = 0.0,
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._clock = clock
+        # key -> (value, expires_at, size)
+        self._data: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+        _REGISTRY[name] = self
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: str) -> bool:
+        return self._lookup(key) is not _MISSING
+
+    # ---------- Synchronous API ----------
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._lookup(key)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        size = estimate_size(value)
+        self._remove(key)
+        if size > self.max_bytes:
+            return  # would evict everything else; don't cache
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (value, expires_at, size)
+        self._bytes += size
+        while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, _, old_size) = self._data.popitem(last=False)
+            self._bytes -= old_size
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        self._remove(key)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._bytes = 0
+
+    def ttl_remaining(self, key: str) -> Optional[float]:
+        """Seconds until ``key`` expires (None if absent or expired)."""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        remaining = entry[1] - self._clock()
+        return remaining if remaining > 0 else None
+
+    def peek(self, key: str) -> Optional[Tuple[Any, bool]]:
+        """(value, stale) for a fresh or stale-window entry, None if absent; no counters."""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at, _ = entry
+        now = self._clock()
+        if expires_at > now:
+            return value, False
+        if now < expires_at + self.stale_ttl:
+            return value, True
+        return None
+
+    def purge_expired(self) -> int:
+        """Drop all entries past their TTL and stale window; returns how many were removed."""
+        now = self._clock()
+        expired = [k for k, (_, exp, _) in self._data.items() if exp + self.stale_ttl <= now]
+        for k in expired:
+            self._remove(k)
+        self.expirations += len(expired)
+        return len(expired)
+
+    # ---------- Async single-flight API ----------
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+        should_cache: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """Return cached value or run ``loader`` once for all concurrent callers.
+
+        The loader runs in its own task so a cancelled caller (e.g. one that hit
+        its deadline) neither cancels the fetch nor the other waiters.
+        ``should_cache`` can veto storing a result (e.g. error payloads).
+        """
+        value = self._lookup(key)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+
+        if key in self._inflight:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+        return await asyncio.shield(self._start_load(key, loader, ttl, should_cache))
+
+    async def get_or_load_stale(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+        should_cache: Optional[Callable[[Any], bool]] = None,
+    ) -> Tuple[Any, bool]:
+        """Like ``get_or_load`` but returns (value, stale).
+
+        An entry in its stale window is returned at once (stale=True) while a
+        single background reload replaces it; a failing reload leaves the stale
+        value in place until the window ends.
+        """
+        found = self.peek(key)
+        if found is not None and found[1]:
+            self.stale_hits += 1
+            self._start_load(key, loader, ttl, should_cache)
+            return found[0], True
+        return await self.get_or_load(key, loader, ttl, should_cache), False
+
+    async def refresh(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+        should_cache: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """Reload ``key`` even if cached (stale-while-revalidate).
+
+        Readers keep getting the current value until the new one is stored;
+        joins a load already in flight for the key instead of starting another.
+        """
+        return await asyncio.shield(self._start_load(key, loader, ttl, should_cache))
+
+    def _start_load(self, key, loader, ttl, should_cache) -> asyncio.Future:
+        """The in-flight load for ``key``, started if there is none."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, loader, ttl, should_cache))
+            # Retrieve exceptions even if every waiter was cancelled
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[key] = task
+        return task
+
+    async def _load(self, key, loader, ttl, should_cache) -> Any:
+        try:
+            value = await loader()
+            if should_cache is None or should_cache(value):
+                self.set(key, value, ttl)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "maxEntries": self.max_entries,
+            "maxBytes": self.max_bytes,
+            "ttlSeconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "coalesced": self.coalesced,
+            "staleHits": self.stale_hits,
+            "inflight": len(self._inflight),
+        }
+
+    # ---------- Internal helpers ----------
+    def _lookup(self, key: str) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        value, expires_at, _ = entry
+        now = self._clock()
+        if expires_at <= now:
+            if now < expires_at + self.stale_ttl:
+                return _MISSING  # kept for get_or_load_stale until the window ends
+            self._remove(key)
+            self.expirations += 1
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def _remove(self, key: str) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+
+# ---------- Shared (L2) tier ----------
+def dumps(value: Any) -> bytes:
+    """Compact serialization: minified JSON, zlib-compressed when large."""
+    raw = json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+    if len(raw) >= _COMPRESS_THRESHOLD:
+        return b"Z" + zlib.compress(raw, 6)
+    return b"J" + raw
+
+
+def loads(data: bytes) -> Any:
+    tag, body = data[:1], data[1:]
+    if tag == b"Z":
+        body = zlib.decompress(body)
+    return json.loads(body)
+
+
+class CacheBackend(abc.ABC):
+    """Interface for shared cache tiers (values are serialized bytes)."""
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        """Return (data, seconds_to_live) or None."""
+
+    @abc.abstractmethod
+    async def set(self, key: str, data: bytes, ttl: float) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Dict-backed stand-in for Redis (tests, single-process deployments)."""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._data: Dict[str, Tuple[bytes, float]] = {}
+
+    async def get(self, key: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        data, expires_at = entry
+        remaining = expires_at - self._clock()
+        if remaining <= 0:
+            del self._data[key]
+            return None
+        return data, remaining
+
+    async def set(self, key: str, data: bytes, ttl: float) -> None:
+        self._data[key] = (data, self._clock() + ttl)
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+
+class RedisCacheBackend(CacheBackend):
+    """Redis tier using the asyncio client over a bounded connection pool.
+
+    Redis problems never fail a request: errors are logged and the tier is
+    skipped for ``cooldown`` seconds so callers fall back to L1 + upstream.
+    """
+
+    def __init__(self, url: str, max_connections: int = 20, timeout: float = 0.25,
+                 cooldown: float = 30.0):
+        pool = aioredis.ConnectionPool.from_url(
+            url,
+            max_connections=max_connections,
+            socket_timeout=timeout,
+            socket_connect_timeout=timeout,
+        )
+        self._redis = aioredis.Redis(connection_pool=pool)
+        self._cooldown = cooldown
+        self._disabled_until = 0.0
+        self.errors = 0
+
+    def _available(self) -> bool:
+        return time.monotonic() >= self._disabled_until
+
+    def _failed(self, exc: Exception) -> None:
+        self.errors += 1
+        self._disabled_until = time.monotonic() + self._cooldown
+        logger.warning("Redis cache unavailable, bypassing for %ss: %s", self._cooldown, exc)
+
+    async def get(self, key: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        if not self._available():
+            return None
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                data, pttl = await pipe.get(key).pttl(key).execute()
+        except Exception as e:
+            self._failed(e)
+            return None
+        if data is None:
+            return None
+        return data, (pttl / 1000.0 if pttl and pttl > 0 else None)
+
+    async def set(self, key: str, data: bytes, ttl: float) -> None:
+        if not self._available():
+            return
+        try:
+            await self._redis.set(key, data, px=max(int(ttl * 1000), 1))
+        except Exception as e:
+            self._failed(e)
+
+    async def delete(self, key: str) -> None:
+        if not self._available():
+            return
+        try:
+            await self._redis.delete(key)
+        except Exception as e:
+            self._failed(e)
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+_shared_backend: Optional[CacheBackend] = None
+
+
+def shared_backend() -> Optional[CacheBackend]:
+    """Process-wide L2 backend built from REDIS_URL (None when not configured)."""
+    global _shared_backend
+    if _shared_backend is None:
+        url = os.getenv("REDIS_URL")
+        if url and aioredis is not None:
+            _shared_backend = RedisCacheBackend(
+                url, max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", 20))
+            )
+    return _shared_backend
+
+
+async def close_shared_backend() -> None:
+    global _shared_backend
+    if _shared_backend is not None:
+        await _shared_backend.close()
+        _shared_backend = None
+
+
+class TieredCache:
+    """In-process L1 in front of an optional shared L2 backend."""
+
+    def __init__(self, l1: AsyncTTLCache, backend: Optional[CacheBackend] = None,
+                 prefix: Optional[str] = None):
+        self.l1 = l1
+        self.backend = backend
+        self.prefix = f"{prefix or os.getenv('CACHE_KEY_PREFIX', 'skycast:v1')}:{l1.name}"
+        self.l2_hits = 0
+        self.l2_misses = 0
+        _REGISTRY[l1.name] = self
+
+    @property
+    def name(self) -> str:
+        return self.l1.name
+
+    def _l2_key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+        should_cache: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        if self.backend is None:
+            return await self.l1.get_or_load(key, loader, ttl, should_cache)
+
+        ttl = self.l1.ttl if ttl is None else ttl
+        l1_ttl: Dict[str, float] = {}
+
+        async def load_through() -> Any:
+            hit = await self.backend.get(self._l2_key(key))
+            if hit is not None:
+                data, remaining = hit
+                self.l2_hits += 1
+                if remaining is not None:
+                    # Don't let L1 outlive the shared entry
+                    l1_ttl["ttl"] = min(ttl, remaining)
+                return loads(data)
+            self.l2_misses += 1
+            value = await loader()
+            if should_cache is None or should_cache(value):
+                await self.backend.set(self._l2_key(key), dumps(value), ttl)
+            return value
+
+        async def load_and_time() -> Any:
+            value = await load_through()
+            if "ttl" in l1_ttl and (should_cache is None or should_cache(value)):
+                self.l1.set(key, value, l1_ttl["ttl"])
+            return value
+
+        def l1_should_cache(value: Any) -> bool:
+            # L2 hits were already stored above with the shorter remaining TTL
+            return "ttl" not in l1_ttl and (should_cache is None or should_cache(value))
+
+        return await self.l1.get_or_load(key, load_and_time, ttl, l1_should_cache)
+
+    async def refresh(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+        should_cache: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """Reload ``key`` from the loader (skipping L2) and write both tiers."""
+        if self.backend is None:
+            return await self.l1.refresh(key, loader, ttl, should_cache)
+        ttl = self.l1.ttl if ttl is None else ttl
+
+        async def load_and_share() -> Any:
+            value = await loader()
+            if should_cache is None or should_cache(value):
+                await self.backend.set(self._l2_key(key), dumps(value), ttl)
+            return value
+
+        return await self.l1.refresh(key, load_and_share, ttl, should_cache)
+
+    def ttl_remaining(self, key: str) -> Optional[float]:
+        return self.l1.ttl_remaining(key)
+
+    async def get_or_load_stale(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+        should_cache: Optional[Callable[[Any], bool]] = None,
+    ) -> Tuple[Any, bool]:
+        """(value, stale); stale L1 entries are served while ``refresh`` runs in the background."""
+        found = self.l1.peek(key)
+        if found is not None and found[1]:
+            self.l1.stale_hits += 1
+            task = asyncio.ensure_future(self.refresh(key, loader, ttl, should_cache))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            return found[0], True
+        return await self.get_or_load(key, loader, ttl, should_cache), False
+
+    async def delete(self, key: str) -> None:
+        self.l1.delete(key)
+        if self.backend is not None:
+            await self.backend.delete(self._l2_key(key))
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.l1.stats()
+        stats["l2"] = None if self.backend is None else {
+            "backend": type(self.backend).__name__,
+            "hits": self.l2_hits,
+            "misses": self.l2_misses,
+            "errors": getattr(self.backend, "errors", 0),
+        }
+        return stats
+
+
+def build_cache(name: str, ttl: float, max_entries: int = 1024,
+                max_bytes: int = 16 * 1024 * 1024, stale_ttl: float = 0.0) -> TieredCache:
+    """L1 cache wired to the process-wide shared backend (if configured)."""
+    l1 = AsyncTTLCache(name, ttl=ttl, max_entries=max_entries, max_bytes=max_bytes, stale_ttl=stale_ttl)
+    return TieredCache(l1, shared_backend())
@@ -0,0 +1,144 @@
+"""Inverse-Distance-Weighting Fusion
+
+Packs ground-station measurements into a dense (stations x parameters) matrix
+(NaN = no valid reading) and estimates every parameter at one or many query
+points in a single vectorized pass.
+
+    weight = 1 / (d + eps) ** power      d in km, d == 0 treated as min_distance
+
+Optional cutoffs drop stations beyond ``max_distance_km`` or outside the
+``k_nearest`` stations of each point. Where cutoffs leave no valid station for
+a parameter, the nearest valid station's value is used instead.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.utils.aqi import convert_units
+
+
+@dataclass
+class StationMatrix:
+    parameters: Tuple[str, ...]
+    values: np.ndarray        # (S, P) float, NaN where missing / invalid
+    lat: np.ndarray           # (S,)
+    lon: np.ndarray           # (S,)
+    distances: np.ndarray     # (S,) km as reported on the station records (NaN if absent)
+
+    def __len__(self) -> int:
+        return self.values.shape[0]
+
+
+def pack_measurements(stations: Sequence[Dict[str, Any]], parameters: Sequence[str]) -> StationMatrix:
+    """Dense station x parameter matrix; readings are converted to AQI registry units.
+
+    Multiple readings of one parameter at a station are averaged.
+    """
+    parameters = tuple(parameters)
+    col = {p: i for i, p in enumerate(parameters)}
+    sums = np.zeros((len(stations), len(parameters)))
+    counts = np.zeros((len(stations), len(parameters)))
+    for i, s in enumerate(stations):
+        for m in s.get("measurements", []):
+            j = col.get(m.get("parameter"))
+            value = m.get("value")
+            if j is None or not isinstance(value, (int, float)) or not np.isfinite(value):
+                continue
+            value = convert_units(value, m.get("unit"), parameters[j])
+            if value is not None:
+                sums[i, j] += value
+                counts[i, j] += 1
+    with np.errstate(invalid="ignore", divide="ignore"):
+        values = np.where(counts > 0, sums / counts, np.nan)
+
+    def column(key: str) -> np.ndarray:
+        return np.array([np.nan if s.get(key) is None else s[key] for s in stations], dtype=float)
+
+    return StationMatrix(parameters, values, column("lat"), column("lon"), column("distance"))
+
+
+def idw_estimate(
+    values: np.ndarray,
+    distances: np.ndarray,
+    membership: Optional[np.ndarray] = None,
+    *,
+    power: float = 1.0,
+    eps: float = 0.01,
+    min_distance: float = 0.1,
+    max_distance_km: Optional[float] = None,
+    k_nearest: Optional[int] = None,
+    fallback: bool = True,
+) -> np.ndarray:
+    """IDW estimates for every parameter at every query point.
+
+    values:      (S, P) station values, NaN = missing
+    distances:   (S,) for one point or (N, S) for N points, km
+    membership:  optional (N, S) bool - which stations each point may use
+    Returns (P,) or (N, P) estimates; NaN where no station has a value.
+    """
+    single = np.ndim(distances) == 1
+    d = np.atleast_2d(np.asarray(distances, dtype=float))
+    n_points, n_stations = d.shape
+    if n_stations == 0:
+        est = np.full((n_points, values.shape[1]), np.nan)
+        return est[0] if single else est
+
+    member = np.ones(d.shape, dtype=bool) if membership is None else np.atleast_2d(membership).copy()
+    d = np.where(np.isnan(d) | (d <= 0), min_distance, d)  # unknown / zero distance
+
+    active = member.copy()
+    if max_distance_km is not None:
+        active &= d <= max_distance_km
+    if k_nearest is not None and k_nearest < n_stations:
+        ranked = np.argsort(np.where(member, d, np.inf), axis=1, kind="stable")
+        nearest = np.zeros_like(active)
+        np.put_along_axis(nearest, ranked[:, :k_nearest], True, axis=1)
+        active &= nearest
+
+    valid = ~np.isnan(values)                        # (S, P)
+    w = np.where(active, 1.0 / (d + eps) ** power, 0.0)  # (N, S)
+    num = w @ np.where(valid, values, 0.0)           # (N, P)
+    den = w @ valid                                  # (N, P)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        est = np.where(den > 0, num / den, np.nan)
+
+    if fallback:
+        missing = np.isnan(est)
+        if missing.any():
+            # Nearest valid member station, ignoring distance / k cutoffs
+            d_valid = np.where(valid[None, :, :] & member[:, :, None], d[:, :, None], np.inf)  # (N, S, P)
+            nearest = np.argmin(d_valid, axis=1)                                              # (N, P)
+            found = np.isfinite(np.take_along_axis(d_valid, nearest[:, None, :], axis=1)[:, 0, :])
+            fill = values[nearest, np.arange(values.shape[1])[None, :]]
+            est = np.where(missing & found, fill, est)
+
+    return est[0] if single else est
+
+
+def estimates_to_dict(parameters: Sequence[str], estimates: np.ndarray, decimals: int = 2) -> Dict[str, float]:
+    """{parameter: rounded estimate} for the non-NaN entries of one point."""
+    return {p: round(float(v), decimals) for p, v in zip(parameters, estimates) if not np.isnan(v)}
+
+
+def station_key(station: Dict[str, Any]) -> Any:
+    return station.get("stationId") or (station.get("name"), station.get("lat"), station.get("lon"))
+
+
+def union_stations(groups: Sequence[Sequence[Dict[str, Any]]]) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+    """Unique stations across groups plus an (N groups, S stations) membership mask."""
+    index: Dict[Any, int] = {}
+    stations: List[Dict[str, Any]] = []
+    for group in groups:
+        for s in group:
+            key = station_key(s)
+            if key not in index:
+                index[key] = len(stations)
+                stations.append(s)
+    membership = np.zeros((len(groups), len(stations)), dtype=bool)
+    for n, group in enumerate(groups):
+        for s in group:
+            membership[n, index[station_key(s)]] = True
+    return stations, membership
@@ -0,0 +1,110 @@
+"""Geospatial Helpers
+
+Great-circle distances (scalar or NumPy arrays) and geohash tiles used to
+quantize arbitrary lat/lon queries onto a shared cache grid.
+
+Geohash precision -> approximate cell size:
+    4 -> 39 km x 19.5 km
+    5 -> 4.9 km x 4.9 km
+    6 -> 1.2 km x 0.61 km
+"""
+from __future__ import annotations
+
+import math
+from typing import Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_BASE32_INDEX = {c: i for i, c in enumerate(_BASE32)}
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; accepts scalars or broadcastable arrays."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def geohash_encode(lat: float, lon: float, precision: int = 5) -> str:
+    """Encode a point as a geohash string of ``precision`` characters."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # geohash interleaves starting with longitude
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                bits = (bits << 1) | 1
+                lon_lo = mid
+            else:
+                bits <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_lo = mid
+            else:
+                bits <<= 1
+                lat_hi = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def geohash_bbox(geohash: str) -> Tuple[float, float, float, float]:
+    """(min_lat, min_lon, max_lat, max_lon) of a geohash cell."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    even = True
+    for c in geohash:
+        value = _BASE32_INDEX[c]
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                if bit:
+                    lon_lo = mid
+                else:
+                    lon_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return lat_lo, lon_lo, lat_hi, lon_hi
+
+
+def geohash_center(geohash: str) -> Tuple[float, float]:
+    min_lat, min_lon, max_lat, max_lon = geohash_bbox(geohash)
+    return (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+
+
+def geohash_reach_km(geohash: str) -> float:
+    """Distance from the cell centre to its farthest corner (km)."""
+    min_lat, min_lon, max_lat, max_lon = geohash_bbox(geohash)
+    c_lat, c_lon = geohash_center(geohash)
+    return float(max(
+        haversine_km(c_lat, c_lon, min_lat, max_lon),
+        haversine_km(c_lat, c_lon, max_lat, max_lon),
+    ))
+
+
+def bucket_radius(radius_km: float, buckets=(10, 25, 50, 100, 200)) -> int:
+    """Round a search radius up to a shared bucket so nearby radii reuse tiles."""
+    for b in buckets:
+        if radius_km <= b:
+            return b
+    return int(math.ceil(radius_km))
@@ -0,0 +1,191 @@
+"""Shared HTTP Clients
+
+One ``httpx.AsyncClient`` per upstream, created lazily on first use (inside
+the running event loop) with explicit pool limits and keep-alive expiry, and
+closed from the FastAPI lifespan. Connections are reused across requests, so
+steady-state calls skip TCP/TLS setup.
+
+Each client's transport caps concurrent requests per host with a semaphore
+(queued callers wait instead of opening ever more sockets) and counts
+connection setups so pool reuse is visible in ``/metrics``. HTTP/2 is
+negotiated via ALPN when the ``h2`` package is installed; servers without
+HTTP/2 keep using HTTP/1.1.
+
+Environment Variables:
+    HTTP_MAX_CONNECTIONS       -> pool size per client (default 100)
+    HTTP_MAX_KEEPALIVE         -> idle connections kept open per client (default 20)
+    HTTP_KEEPALIVE_EXPIRY      -> seconds an idle connection is kept (default 30)
+    HTTP_PER_HOST_CONCURRENCY  -> concurrent requests per upstream host (default 20)
+    HTTP2                      -> 0 disables HTTP/2 (default on when h2 is installed)
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (enables httpx HTTP/2 support)
+    HTTP2_AVAILABLE = True
+except ImportError:  # pragma: no cover
+    HTTP2_AVAILABLE = False
+
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 20))
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30))
+PER_HOST_CONCURRENCY = int(os.getenv("HTTP_PER_HOST_CONCURRENCY", 20))
+HTTP2_ENABLED = HTTP2_AVAILABLE and os.getenv("HTTP2", "1") != "0"
+
+_clients: Dict[str, Tuple[httpx.AsyncClient, "PooledTransport"]] = {}
+
+
+def _connection_pool(transport: httpx.AsyncBaseTransport) -> Optional[Any]:
+    """httpcore pool behind an AsyncHTTPTransport, or None if its internals changed."""
+    pool = getattr(transport, "_pool", None)
+    return pool if callable(getattr(pool, "create_connection", None)) else None
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body that frees the per-host slot once it is read to the end or closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        finally:
+            self._release()
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class PooledTransport(httpx.AsyncBaseTransport):
+    """AsyncHTTPTransport with per-host concurrency caps and pool counters.
+
+    A request holds its host slot until the response body has been read or
+    the response is closed; bodies that are already in memory release it
+    immediately.
+    """
+
+    def __init__(self, per_host: int = PER_HOST_CONCURRENCY,
+                 inner: Optional[httpx.AsyncBaseTransport] = None, **transport_options):
+        self._inner = inner or httpx.AsyncHTTPTransport(**transport_options)
+        self.per_host = per_host
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.requests = 0
+        self.waited = 0
+        self.in_flight = 0
+        # None when the pool cannot be observed (e.g. a changed httpcore)
+        self.connections_opened: Optional[int] = None
+        self._pool = _connection_pool(self._inner)
+        if self._pool is not None:
+            # httpcore keeps no counter of its own; count connection setups
+            create = self._pool.create_connection
+            self.connections_opened = 0
+
+            def counting_create(origin):
+                self.connections_opened += 1
+                return create(origin)
+
+            self._pool.create_connection = counting_create
+
+    def _semaphore(self, host: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(self.per_host)
+        return semaphore
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        semaphore = self._semaphore(request.url.host)
+        if semaphore.locked():
+            self.waited += 1
+        await semaphore.acquire()
+        self.requests += 1
+        self.in_flight += 1
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self.in_flight -= 1
+                semaphore.release()
+
+        try:
+            response = await self._inner.handle_async_request(request)
+        except BaseException:
+            release()
+            raise
+        if isinstance(response.stream, httpx.ByteStream):
+            release()  # body already in memory; no connection is held
+        else:
+            response.stream = _ReleasingStream(response.stream, release)
+        return response
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+    def _pool_counts(self) -> Tuple[Optional[int], Optional[int]]:
+        """(connections, idle) of the pool, or (None, None) when not observable."""
+        try:
+            connections = list(self._pool.connections)
+            return len(connections), sum(1 for c in connections if c.is_idle())
+        except (AttributeError, TypeError):
+            return None, None
+
+    def stats(self) -> Dict[str, Any]:
+        connections, idle = self._pool_counts()
+        opened = self.connections_opened
+        return {
+            "requests": self.requests,
+            "inFlight": self.in_flight,
+            "waitedForHostSlot": self.waited,
+            "connectionsOpened": opened,
+            "connections": connections,
+            "idle": idle,
+            "active": None if connections is None else connections - idle,
+            "reuseRatio": round(1 - opened / self.requests, 4) if opened is not None and self.requests else None,
+        }
+
+
+def http_client(name: str, base_url: str = "", timeout: float = 15.0,
+                headers: Optional[Dict[str, str]] = None) -> httpx.AsyncClient:
+    """Shared client for ``name``, created on first use (or after it was closed)."""
+    entry = _clients.get(name)
+    if entry is None or entry[0].is_closed:
+        limits = httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+        transport = PooledTransport(limits=limits, http2=HTTP2_ENABLED)
+        client = httpx.AsyncClient(base_url=base_url, timeout=timeout, headers=headers, transport=transport)
+        entry = _clients[name] = (client, transport)
+    return entry[0]
+
+
+def http_stats() -> Dict[str, Dict[str, Any]]:
+    stats = {}
+    for name, (client, transport) in sorted(_clients.items()):
+        stats[name] = {**transport.stats(), "closed": client.is_closed, "http2": HTTP2_ENABLED}
+    return stats
+
+
+async def close_client(name: str) -> None:
+    entry = _clients.pop(name, None)
+    if entry is not None:
+        await entry[0].aclose()
+
+
+async def close_http_clients() -> None:
+    for name in list(_clients):
+        await close_client(name)
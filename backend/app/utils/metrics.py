@@ -0,0 +1,61 @@
+"""Runtime Histograms
+
+Fixed-bucket histograms for latency / size distributions reported in
+``/metrics`` (cumulative bucket counts, like Prometheus, plus approximate
+percentiles). Observations are O(log buckets) and allocation free.
+"""
+from __future__ import annotations
+
+import weakref
+from bisect import bisect_left
+from typing import Any, Dict, Sequence
+
+_HISTOGRAMS: "weakref.WeakValueDictionary[str, Histogram]" = weakref.WeakValueDictionary()
+
+
+def histogram_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: h.stats() for name, h in sorted(_HISTOGRAMS.items())}
+
+
+class Histogram:
+    def __init__(self, name: str, buckets: Sequence[float]):
+        self.name = name
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot: above the top bucket
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        _HISTOGRAMS[name] = self
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th percentile (0 when empty)."""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self._counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def stats(self) -> Dict[str, Any]:
+        cumulative, running = {}, 0
+        for bound, count in zip(self.buckets, self._counts):
+            running += count
+            cumulative[f"le_{bound:g}"] = running
+        cumulative["le_inf"] = self.count
+        return {
+            "count": self.count,
+            "mean": round(self.sum / self.count, 3) if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "max": round(self.max, 3),
+            "buckets": cumulative,
+        }
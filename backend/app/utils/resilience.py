@@ -0,0 +1,183 @@
+"""Upstream Resilience
+
+Circuit breaker + per-endpoint latency budgets shared by the services that
+call external APIs (OpenAQ, Earthdata).
+
+    closed     calls pass; consecutive failures are counted
+    open       after ``failure_threshold`` failures calls fail immediately
+               (no upstream round trip) for ``reset_timeout`` seconds
+    half-open  then up to ``half_open_max`` probe calls are let through; a
+               success closes the circuit, a failure re-opens it
+
+Each call runs under its endpoint's latency budget; exceeding it counts as a
+failure. Timeouts, transport errors, 5xx and 429 responses are failures; other
+HTTP errors mean the upstream is up and leave the breaker alone.
+
+Rejections raise ``UpstreamUnavailable`` (an ``httpx.TransportError``), so the
+services' existing ``except httpx.HTTPError`` fallbacks handle them unchanged.
+Stale cached values are served meanwhile by the caches (see
+``AsyncTTLCache.get_or_load_stale``).
+
+Environment Variables:
+    CIRCUIT_FAILURE_THRESHOLD   -> consecutive failures that open a circuit (default 5)
+    CIRCUIT_RESET_SECONDS       -> open time before a half-open probe (default 30)
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+_UPSTREAMS: "weakref.WeakValueDictionary[str, Upstream]" = weakref.WeakValueDictionary()
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class UpstreamUnavailable(httpx.TransportError):
+    """Call rejected by an open circuit or abandoned at its latency budget."""
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    pass
+
+
+class BudgetExceeded(UpstreamUnavailable):
+    pass
+
+
+def upstream_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: upstream.stats() for name, upstream in sorted(_UPSTREAMS.items())}
+
+
+def is_failure(exc: BaseException) -> bool:
+    """Whether an exception says the upstream is unhealthy."""
+    if isinstance(exc, (asyncio.TimeoutError, httpx.TransportError)):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    return False
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        failure_threshold: Optional[int] = None,
+        reset_timeout: Optional[float] = None,
+        half_open_max: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold or int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+        self.reset_timeout = reset_timeout if reset_timeout is not None else float(os.getenv("CIRCUIT_RESET_SECONDS", 30))
+        self.half_open_max = half_open_max
+        self._clock = clock
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def allow(self) -> bool:
+        """Reserve a call slot; False means fail fast."""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and self._probes < self.half_open_max:
+            self._probes += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def release(self) -> None:
+        """Give back a probe slot of a call that ended without a verdict."""
+        self._probes = max(self._probes - 1, 0)
+
+    def record_success(self) -> None:
+        self._state = CLOSED
+        self._failures = 0
+        self._probes = 0
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != OPEN:
+                self.opened += 1
+            self._state = OPEN
+            self._opened_at = self._clock()
+            self._probes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutiveFailures": self._failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class Upstream:
+    """Named upstream: one circuit breaker + latency budget per endpoint."""
+
+    def __init__(
+        self,
+        name: str,
+        budgets: Optional[Dict[str, float]] = None,
+        default_budget: float = 10.0,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.name = name
+        self.budgets = dict(budgets or {})
+        self.default_budget = default_budget
+        self.breaker = breaker or CircuitBreaker()
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        _UPSTREAMS[name] = self
+
+    def budget(self, endpoint: str) -> float:
+        return self.budgets.get(endpoint, self.default_budget)
+
+    async def call(self, endpoint: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} circuit open")
+        self.calls += 1
+        try:
+            result = await asyncio.wait_for(fn(), self.budget(endpoint))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.failures += 1
+            self.breaker.record_failure()
+            raise BudgetExceeded(f"{self.name} {endpoint} exceeded {self.budget(endpoint)}s budget") from None
+        except BaseException as exc:
+            if isinstance(exc, Exception) and is_failure(exc):
+                self.failures += 1
+                self.breaker.record_failure()
+            elif isinstance(exc, Exception):
+                self.breaker.record_success()
+            else:  # cancelled: neither success nor failure
+                self.breaker.release()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.breaker.stats(),
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "budgets": self.budgets,
+        }
@@ -0,0 +1,79 @@
+"""Fast JSON Responses
+
+``FastJSONResponse`` serializes with orjson (C, writes UTF-8 bytes directly,
+handles datetimes and NumPy values) and falls back to the standard library
+encoder when orjson is not installed. It is the app's default response
+class; hot routes return it directly so FastAPI skips the
+``jsonable_encoder`` pass over the response dict.
+
+Response compression is handled by ``GZipMiddleware`` (see main.py).
+
+Environment Variables:
+    GZIP_MIN_SIZE  -> responses smaller than this many bytes are sent uncompressed (default 1024)
+    GZIP_LEVEL     -> gzip compression level 1-9 (default 5)
+"""
+from __future__ import annotations
+
+import json
+import os
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 5))
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    """Compact JSON bytes; NaN and infinity are written as null."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(_finite(obj), default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _finite(obj: Any) -> Any:
+    if isinstance(obj, float):
+        return obj if obj == obj and obj not in (float("inf"), float("-inf")) else None
+    if isinstance(obj, dict):
+        return {k: _finite(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(v) for v in obj]
+    return obj
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def parse_fields(fields: Optional[str]) -> Optional[set]:
+    """"a,b,c" -> {"a", "b", "c"}; None when no projection was requested."""
+    if not fields:
+        return None
+    return {f.strip() for f in fields.split(",") if f.strip()} or None
+
+
+def project(data: Dict[str, Any], fields: Optional[Iterable[str]]) -> Dict[str, Any]:
+    """Keep only the requested top-level keys (all keys when ``fields`` is None)."""
+    if fields is None:
+        return data
+    return {k: v for k, v in data.items() if k in fields}
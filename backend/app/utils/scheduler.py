@@ -0,0 +1,255 @@
+"""Upstream Request Scheduler
+
+Token-bucket rate limiter with priority lanes in front of a rate-limited
+upstream (OpenAQ). Every upstream request takes one token; tokens refill at
+the upstream's quota rate up to a burst size.
+
+Lanes, highest priority first:
+    interactive   user-facing lookups (default for request handlers)
+    batch         multi-point jobs and catalog crawls
+    prefetch      background cache warming
+
+Waiters are served strictly by lane, FIFO within a lane. Lower lanes also
+leave a reserve of tokens in the bucket, so background work only spends
+quota the interactive path is not using. Each lane has a bounded queue and a
+maximum wait: callers are rejected up front (``RateLimited``) when the queue
+is full or the estimated wait exceeds the lane's budget, instead of queueing
+work that would time out anyway.
+
+A 429 response with ``Retry-After`` pauses the whole scheduler until the
+upstream accepts requests again (``retry_after``).
+
+The lane is taken from a context variable, so routes and background tasks
+set it once (``with request_lane(BATCH): ...``) and every upstream call made
+underneath, including tasks they spawn, is scheduled in that lane.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Deque, Dict, Iterator, Optional
+
+from app.utils.resilience import UpstreamUnavailable
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PREFETCH = "prefetch"
+LANES = (INTERACTIVE, BATCH, PREFETCH)  # priority order
+
+# Longest pause honoured from a single Retry-After header
+MAX_RETRY_AFTER_S = 300.0
+
+_lane: ContextVar[str] = ContextVar("request_lane", default=INTERACTIVE)
+_SCHEDULERS: "weakref.WeakValueDictionary[str, RequestScheduler]" = weakref.WeakValueDictionary()
+
+
+class RateLimited(UpstreamUnavailable):
+    """Request rejected by the scheduler (queue full or wait over budget)."""
+
+
+def current_lane() -> str:
+    return _lane.get()
+
+
+@contextmanager
+def request_lane(lane: str) -> Iterator[None]:
+    """Schedule upstream calls made in this context in ``lane``."""
+    if lane not in LANES:
+        raise ValueError(f"unknown lane {lane!r}")
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP-date)."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def scheduler_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: scheduler.stats() for name, scheduler in sorted(_SCHEDULERS.items())}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def tokens(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def take(self, n: float = 1.0) -> None:
+        self._refill()
+        self._tokens -= n
+
+    def drain(self) -> None:
+        self._refill()
+        self._tokens = min(self._tokens, 0.0)
+
+    def wait_time(self, needed: float) -> float:
+        """Seconds until the bucket holds ``needed`` tokens."""
+        return max(needed - self.tokens, 0.0) / self.rate
+
+
+class RequestScheduler:
+    """Priority-lane admission for one upstream's request quota."""
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: float,
+        queue_limit: int = 64,
+        max_wait: Optional[Dict[str, float]] = None,
+        reserve: Optional[Dict[str, float]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst, clock)
+        self.queue_limit = queue_limit
+        self.max_wait = {INTERACTIVE: 2.0, BATCH: 30.0, PREFETCH: 30.0, **(max_wait or {})}
+        # Tokens a lane must leave in the bucket (headroom for higher lanes)
+        self.reserve = {INTERACTIVE: 0.0, BATCH: 0.2 * burst, PREFETCH: 0.4 * burst, **(reserve or {})}
+        self._clock = clock
+        self._queues: Dict[str, Deque[asyncio.Future]] = {lane: deque() for lane in LANES}
+        self._blocked_until = 0.0
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.granted = {lane: 0 for lane in LANES}
+        self.rejected = {lane: 0 for lane in LANES}
+        self.throttled = 0
+        _SCHEDULERS[name] = self
+
+    # ---------- admission ----------
+    def _waiting(self, upto: str) -> int:
+        """Waiters in ``upto`` and every higher-priority lane."""
+        return sum(len(self._queues[lane]) for lane in LANES[: LANES.index(upto) + 1])
+
+    def _delay(self, lane: str, position: int = 1) -> float:
+        """Estimated seconds until the ``position``-th waiter of ``lane`` gets a token."""
+        blocked = max(self._blocked_until - self._clock(), 0.0)
+        ahead = self._waiting(lane) - len(self._queues[lane]) + position
+        return max(blocked, self.bucket.wait_time(ahead + self.reserve[lane]))
+
+    def _grantable(self, lane: str) -> bool:
+        return self._clock() >= self._blocked_until and self.bucket.tokens >= 1 + self.reserve[lane]
+
+    async def acquire(self, lane: Optional[str] = None) -> None:
+        """Wait for a request slot in ``lane`` (context lane by default).
+
+        Raises ``RateLimited`` when the lane's queue is full or the wait would
+        exceed its budget.
+        """
+        lane = lane or current_lane()
+        if not self._waiting(lane) and self._grantable(lane):
+            self.bucket.take()
+            self.granted[lane] += 1
+            return
+
+        queue = self._queues[lane]
+        if len(queue) >= self.queue_limit:
+            self.rejected[lane] += 1
+            raise RateLimited(f"{self.name} {lane} queue full")
+        delay = self._delay(lane, len(queue) + 1)
+        if delay > self.max_wait[lane]:
+            self.rejected[lane] += 1
+            raise RateLimited(f"{self.name} {lane} wait {delay:.1f}s exceeds budget")
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        self._kick()
+        try:
+            await asyncio.wait_for(waiter, self.max_wait[lane])
+        except asyncio.TimeoutError:
+            self.rejected[lane] += 1
+            raise RateLimited(f"{self.name} {lane} wait exceeded budget") from None
+        finally:
+            if not waiter.done() or waiter.cancelled():
+                try:
+                    queue.remove(waiter)
+                except ValueError:
+                    pass
+
+    def retry_after(self, seconds: Optional[float]) -> None:
+        """Upstream answered 429: pause all lanes and empty the bucket."""
+        pause = min(seconds if seconds is not None else 1.0 / self.bucket.rate, MAX_RETRY_AFTER_S)
+        self._blocked_until = max(self._blocked_until, self._clock() + pause)
+        self.bucket.drain()
+        self.throttled += 1
+
+    # ---------- dispatch ----------
+    def _kick(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._dispatcher is None or self._dispatcher.done() or self._dispatcher.get_loop() is not loop:
+            self._wake = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch())
+        else:
+            self._wake.set()
+
+    def _head(self) -> Optional[str]:
+        for lane in LANES:
+            queue = self._queues[lane]
+            while queue and queue[0].done():  # timed out or cancelled
+                queue.popleft()
+            if queue:
+                return lane
+        return None
+
+    async def _dispatch(self) -> None:
+        while True:
+            lane = self._head()
+            if lane is None:
+                return
+            if self._grantable(lane):
+                self.bucket.take()
+                self.granted[lane] += 1
+                self._queues[lane].popleft().set_result(None)
+                continue
+            self._wake.clear()
+            try:
+                # Woken early when a higher-priority waiter arrives
+                await asyncio.wait_for(self._wake.wait(), max(self._delay(lane), 0.001))
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tokens": round(self.bucket.tokens, 2),
+            "ratePerSecond": self.bucket.rate,
+            "burst": self.bucket.capacity,
+            "pausedFor": round(max(self._blocked_until - self._clock(), 0.0), 2),
+            "queued": {lane: len(q) for lane, q in self._queues.items()},
+            "granted": dict(self.granted),
+            "rejected": dict(self.rejected),
+            "throttled": self.throttled,
+        }
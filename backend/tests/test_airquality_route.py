@@ -0,0 +1,161 @@
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routes import airquality
+from app.services.openaq_service import openaq_service
+from app.services.tempo_service import tempo_service
+
+TEMPO = {"measurements": {"no2": 20.0, "o3": 40.0, "pm25": 12.0, "hcho": 1.5, "aerosolIndex": 0.7}}
+GROUND = {
+    "stations": [{
+        "stationId": 1, "name": "A", "lat": 40.7, "lon": -74.0, "distance": 2.0,
+        "measurements": [{"parameter": "pm25", "value": 30.0}],
+    }],
+    "summary": {},
+}
+
+
+def patch_sources(monkeypatch, tempo_delay=0.0, ground_delay=0.0):
+    async def fake_tempo(lat, lon, *args, **kwargs):
+        await asyncio.sleep(tempo_delay)
+        return TEMPO
+
+    async def fake_ground(lat, lon, radius, *args, **kwargs):
+        await asyncio.sleep(ground_delay)
+        return GROUND, radius, 1
+
+    monkeypatch.setattr(tempo_service, "fetch_tempo_data", fake_tempo)
+    monkeypatch.setattr(openaq_service, "get_nearby_stations_adaptive", fake_ground)
+
+
+def test_sources_fetched_concurrently(monkeypatch):
+    patch_sources(monkeypatch, tempo_delay=0.3, ground_delay=0.3)
+    client = TestClient(app)
+    start = time.perf_counter()
+    resp = client.get("/api/airquality/?lat=40.7&lon=-74.0")
+    elapsed = time.perf_counter() - start
+    assert resp.status_code == 200
+    assert elapsed < 0.55  # bounded by the slowest source, not the sum
+    fusion = resp.json()["data"]["fusion"]
+    assert fusion["missingSources"] == []
+    assert resp.json()["data"]["pollutants"]["pm25"] == 30.0
+
+
+def test_late_source_is_marked_missing(monkeypatch):
+    patch_sources(monkeypatch, tempo_delay=1.0)
+    monkeypatch.setattr(airquality, "TEMPO_DEADLINE_S", 0.1)
+    client = TestClient(app)
+    start = time.perf_counter()
+    resp = client.get("/api/airquality/?lat=40.7&lon=-74.0")
+    assert time.perf_counter() - start < 0.8
+    data = resp.json()["data"]
+    assert resp.status_code == 200
+    assert data["fusion"]["missingSources"] == ["tempo"]
+    assert data["fusion"]["sourceStatus"] == {"tempo": "timeout", "openaq": "ok"}
+    assert data["pollutants"]["pm25"] == 30.0
+    assert data["sources"]["tempo"] is None
+
+
+def test_failed_source_does_not_fail_request(monkeypatch):
+    patch_sources(monkeypatch)
+
+    async def broken(*args, **kwargs):
+        raise RuntimeError("upstream exploded")
+
+    monkeypatch.setattr(openaq_service, "get_nearby_stations_adaptive", broken)
+    resp = TestClient(app).get("/api/airquality/?lat=40.7&lon=-74.0")
+    assert resp.status_code == 200
+    fusion = resp.json()["data"]["fusion"]
+    assert fusion["sourceStatus"]["openaq"] == "error"
+    assert fusion["stationsUsed"] == 0
+
+
+def test_batch_dedupes_by_tile_and_preserves_order(monkeypatch):
+    patch_sources(monkeypatch)
+    tempo_calls = []
+
+    async def counting_tempo(lat, lon):
+        tempo_calls.append(len(lat))
+        return [TEMPO["measurements"]] * len(lat)
+
+    monkeypatch.setattr(tempo_service, "sample_points", counting_tempo)
+    points = [{"lat": 40.7128 + i * 0.001, "lon": -74.0060} for i in range(5)]
+    points.append({"lat": 34.0522, "lon": -118.2437})
+    resp = TestClient(app).post("/api/airquality/batch", json={"points": points})
+    body = resp.json()
+    assert resp.status_code == 200
+    assert body["count"] == 6
+    assert body["tiles"] == 2
+    assert sorted(tempo_calls) == [1, 5]  # one call per tile, every point sampled
+    assert [r["index"] for r in body["results"]] == list(range(6))
+    assert body["results"][0]["aqi"]["dominant"] == "pm25"
+
+
+def test_batch_points_in_one_tile_match_single_point_endpoint(monkeypatch):
+    async def no_stations(lat, lon, radius, *args, **kwargs):
+        return {"stations": []}, radius, 1
+
+    monkeypatch.setattr(openaq_service, "get_nearby_stations_adaptive", no_stations)
+    client = TestClient(app)
+    points = [{"lat": 40.7128, "lon": -74.0060}, {"lat": 40.7301, "lon": -74.0190}]
+    batch = client.post("/api/airquality/batch", json={"points": points}).json()
+    assert batch["tiles"] == 1
+    for point, result in zip(points, batch["results"]):
+        single = client.get("/api/airquality/", params=point).json()["data"]
+        assert result["pollutants"] == single["pollutants"]
+    assert batch["results"][0]["pollutants"] != batch["results"][1]["pollutants"]
+
+
+def test_batch_ndjson_stream(monkeypatch):
+    import json
+
+    patch_sources(monkeypatch)
+    points = [{"lat": 40.7, "lon": -74.0}, {"lat": 51.5, "lon": -0.1}]
+    resp = TestClient(app).post("/api/airquality/batch?stream=true", json={"points": points})
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert sorted(r["index"] for r in lines) == [0, 1]
+
+
+def test_batch_rejects_empty_and_invalid_points():
+    client = TestClient(app)
+    assert client.post("/api/airquality/batch", json={"points": []}).status_code == 422
+    assert client.post("/api/airquality/batch", json={"points": [{"lat": 95, "lon": 0}]}).status_code == 422
+
+
+def test_stale_sources_reported(monkeypatch):
+    async def stale_tempo(lat, lon, *args, **kwargs):
+        return {**TEMPO, "stale": True}
+
+    async def fresh_ground(lat, lon, radius, *args, **kwargs):
+        return GROUND, radius, 1
+
+    monkeypatch.setattr(tempo_service, "fetch_tempo_data", stale_tempo)
+    monkeypatch.setattr(openaq_service, "get_nearby_stations_adaptive", fresh_ground)
+    resp = TestClient(app).get("/api/airquality/?lat=40.7&lon=-74.0")
+    assert resp.json()["data"]["fusion"]["staleSources"] == ["tempo"]
+
+
+def test_projection_and_compression(monkeypatch):
+    patch_sources(monkeypatch)
+    many = {**GROUND, "stations": [{**GROUND["stations"][0], "stationId": i, "distance": 2.0 + i} for i in range(30)]}
+
+    async def many_stations(lat, lon, radius, *args, **kwargs):
+        return many, radius, 1
+
+    monkeypatch.setattr(openaq_service, "get_nearby_stations_adaptive", many_stations)
+    client = TestClient(app)
+    full = client.get("/api/airquality/?lat=40.7&lon=-74.0")
+    assert "sources" in full.json()["data"]
+    assert full.headers["content-encoding"] == "gzip"  # TestClient sends Accept-Encoding: gzip
+
+    slim = client.get("/api/airquality/?lat=40.7&lon=-74.0&include_sources=false")
+    assert "sources" not in slim.json()["data"]
+    assert slim.json()["data"]["pollutants"] == full.json()["data"]["pollutants"]
+
+    picked = client.get("/api/airquality/?lat=40.7&lon=-74.0&fields=aqi,location")
+    assert set(picked.json()["data"]) == {"aqi", "location"}
+    assert "content-encoding" not in picked.headers  # below GZIP_MIN_SIZE
@@ -1,5 +1,7 @@
 import math
 
+import numpy as np
+
 from app.utils.aqi import compute_aqi
 
 
@@ -35,3 +37,70 @@ def test_dominant_pollutant_selection():
 def test_category_progression_unhealthy():
     r = compute_aqi({"pm25": 80.0})  # within 151-200 range
     assert r["category"] in {"Unhealthy", "Unhealthy for Sensitive Groups"}  # ensure not lower tiers
+
+
+def _sample_concentrations(rng, n, breakpoints):
+    # Mix of uniform values, exact breakpoint edges, gaps between bands, and invalid inputs
+    upper = breakpoints[-1][1] * 1.05
+    edges = [c for b in breakpoints for c in (b[0], b[1], b[1] + 0.05)]
+    values = np.concatenate([
+        rng.uniform(-5, upper, n),
+        np.round(rng.uniform(0, upper, n), 1),
+        rng.choice(edges, n),
+        [np.nan, np.inf, -1.0],
+    ])
+    rng.shuffle(values)
+    # Each pollutant independently missing ~20% of the time
+    values[rng.random(values.size) < 0.2] = np.nan
+    return values
+
+
+def test_compute_aqi_array_matches_scalar():
+    from app.utils.aqi import AQI_CATEGORIES, POLLUTANT_CODES, POLLUTANTS, compute_aqi_array
+
+    rng = np.random.default_rng(1234)
+    columns = {code: _sample_concentrations(rng, 1500, POLLUTANTS[code].breakpoints) for code in POLLUTANT_CODES}
+
+    result = compute_aqi_array(**columns)
+    for i in range(columns["pm25"].size):
+        pollutants = {code: float(col[i]) for code, col in columns.items() if not np.isnan(col[i])}
+        expected = compute_aqi(pollutants)
+        assert result["value"][i] == expected["value"]
+        dominant = result["dominant"][i]
+        assert (POLLUTANT_CODES[dominant] if dominant >= 0 else None) == expected["dominant"]
+        category = result["category"][i]
+        assert (AQI_CATEGORIES[category] if category >= 0 else "Unknown") == expected["category"]
+
+
+def test_compute_aqi_many_matches_scalar_dicts():
+    from app.utils.aqi import compute_aqi_many
+
+    batch = [{}, {"pm25": 12.0}, {"pm25": 15.0, "no2": 180}, {"o3": 60, "pm25": None},
+             {"pm10": 160, "so2": 80, "co": 10.2, "o3_1h": 130}]
+    assert compute_aqi_many(batch) == [compute_aqi(p) for p in batch]
+
+
+def test_registry_pollutants():
+    r = compute_aqi({"pm10": 154})
+    assert (r["value"], r["dominant"]) == (100, "pm10")
+    assert compute_aqi({"so2": 80})["category"] == "Unhealthy for Sensitive Groups"
+    assert compute_aqi({"co": 9.4})["value"] == 100
+    # 1h ozone only defines AQI >= 101
+    assert compute_aqi({"o3_1h": 100})["dominant"] is None
+    assert compute_aqi({"o3_1h": 125})["value"] == 101
+
+
+def test_truncation_closes_breakpoint_gaps():
+    # 12.05 falls between the 12.0 and 12.1 bands; EPA truncation maps it to 12.0
+    assert compute_aqi({"pm25": 12.05})["value"] == 50
+    assert compute_aqi({"no2": 53.7})["value"] == 50
+
+
+def test_convert_units():
+    from app.utils.aqi import convert_units
+
+    assert convert_units(0.035, "ppm", "o3") == 35.0
+    assert math.isclose(convert_units(94.1, "µg/m³", "no2"), 50.0, rel_tol=1e-3)
+    assert math.isclose(convert_units(1145, "µg/m³", "co"), 1.0, rel_tol=1e-3)
+    assert convert_units(10, "ppb", "pm25") is None
+    assert convert_units(10, None, "pm25") == 10
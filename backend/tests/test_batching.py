@@ -0,0 +1,71 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.utils.batching import MicroBatcher
+from app.utils.metrics import Histogram
+
+
+def make_batcher(calls, max_rows=512, max_wait_ms=20):
+    async def double(key, X):
+        calls.append((key, len(X)))
+        return X[:, 0] * 2
+
+    return MicroBatcher("test-batcher", double, max_rows=max_rows, max_wait_ms=max_wait_ms)
+
+
+def test_concurrent_requests_share_one_call():
+    calls = []
+    batcher = make_batcher(calls)
+
+    async def main():
+        matrices = [np.full((3, 2), i, dtype=float) for i in range(10)]
+        return matrices, await asyncio.gather(*(batcher.submit("m1", X) for X in matrices))
+
+    matrices, results = asyncio.run(main())
+    assert calls == [("m1", 30)]
+    for X, out in zip(matrices, results):
+        assert out.tolist() == (X[:, 0] * 2).tolist()
+    stats = batcher.stats()
+    assert stats["batchRows"]["count"] == 1 and stats["batchRequests"]["max"] == 10
+    assert stats["queueDelayMs"]["count"] == 10
+
+
+def test_max_rows_flushes_early_and_keys_stay_separate():
+    calls = []
+    batcher = make_batcher(calls, max_rows=4, max_wait_ms=1000)
+
+    async def main():
+        return await asyncio.wait_for(asyncio.gather(
+            batcher.submit("a", np.ones((2, 1))),
+            batcher.submit("b", np.ones((4, 1))),
+            batcher.submit("a", np.ones((2, 1))),
+        ), 1)
+
+    asyncio.run(main())
+    assert sorted(calls) == [("a", 4), ("b", 4)]
+
+
+def test_errors_reach_every_waiter():
+    async def broken(key, X):
+        raise RuntimeError("model exploded")
+
+    batcher = MicroBatcher("test-broken", broken, max_wait_ms=1)
+
+    async def main():
+        return await asyncio.gather(*(batcher.submit("m", np.ones((1, 1))) for _ in range(3)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_histogram_buckets_and_percentiles():
+    h = Histogram("test-hist", (1, 5, 10))
+    for v in (0.5, 2, 3, 7, 50):
+        h.observe(v)
+    stats = h.stats()
+    assert stats["buckets"] == {"le_1": 1, "le_5": 3, "le_10": 4, "le_inf": 5}
+    assert stats["p50"] == 5 and stats["p95"] == 50 and stats["max"] == 50
+    assert stats["mean"] == pytest.approx(12.5)
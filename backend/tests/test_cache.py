@@ -0,0 +1,160 @@
+import asyncio
+
+import pytest
+
+from app.utils.cache import AsyncTTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_expiry():
+    clock = FakeClock()
+    cache = AsyncTTLCache("test-ttl", ttl=10, clock=clock)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    clock.now = 11
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+    assert len(cache) == 0
+
+
+def test_lru_eviction_by_count():
+    cache = AsyncTTLCache("test-lru", max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # a becomes most recent
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert "a" in cache and "c" in cache
+    assert cache.evictions == 1
+
+
+def test_byte_budget_eviction():
+    cache = AsyncTTLCache("test-bytes", max_bytes=2000)
+    for i in range(20):
+        cache.set(str(i), "x" * 200)
+    assert cache.stats()["bytes"] <= 2000
+    assert cache.evictions > 0
+    assert "19" in cache
+
+
+def test_single_flight_coalesces_concurrent_misses():
+    cache = AsyncTTLCache("test-flight")
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"v": 42}
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_load("k", loader) for _ in range(200)))
+
+    results = asyncio.run(run())
+    assert calls == 1
+    assert all(r == {"v": 42} for r in results)
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["coalesced"] == 199
+
+
+def test_should_cache_veto_and_loader_errors_not_cached():
+    cache = AsyncTTLCache("test-veto")
+
+    async def run():
+        await cache.get_or_load("err", lambda: asyncio.sleep(0, {"error": "x"}),
+                                should_cache=lambda v: "error" not in v)
+        assert "err" not in cache
+
+        async def boom():
+            raise RuntimeError("upstream down")
+
+        try:
+            await cache.get_or_load("boom", boom)
+        except RuntimeError:
+            pass
+        assert "boom" not in cache
+
+    asyncio.run(run())
+
+
+def test_serialization_roundtrip_compresses_large_payloads():
+    from app.utils.cache import dumps, loads
+
+    small = {"a": 1}
+    large = {"stations": [{"name": "station", "value": i} for i in range(200)]}
+    assert dumps(small)[:1] == b"J"
+    assert dumps(large)[:1] == b"Z"
+    assert loads(dumps(small)) == small
+    assert loads(dumps(large)) == large
+
+
+def test_tiered_cache_shares_l2_between_workers():
+    from app.utils.cache import MemoryCacheBackend, TieredCache
+
+    backend = MemoryCacheBackend()
+    # The same named cache in two worker processes shares one L2 namespace
+    worker_a = TieredCache(AsyncTTLCache("test-tier"), backend, prefix="t")
+    worker_b = TieredCache(AsyncTTLCache("test-tier"), backend, prefix="t")
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        return {"no2": 14.2}
+
+    async def run():
+        a = await worker_a.get_or_load("k", loader)
+        b = await worker_b.get_or_load("k", loader)
+        return a, b
+
+    a, b = asyncio.run(run())
+    assert a == b == {"no2": 14.2}
+    assert calls == 1
+    assert worker_b.l2_hits == 1
+    assert "k" in worker_b.l1
+
+
+def test_refresh_serves_old_value_until_reloaded():
+    cache = AsyncTTLCache("test-refresh", ttl=60)
+    release = None
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        cache.set("k", "old")
+
+        async def slow_loader():
+            await release.wait()
+            return "new"
+
+        refresh = asyncio.create_task(cache.refresh("k", slow_loader))
+        await asyncio.sleep(0)
+        during = await cache.get_or_load("k", slow_loader)  # hit, not a second load
+        joined = asyncio.create_task(cache.refresh("k", slow_loader))
+        await asyncio.sleep(0)
+        release.set()
+        return during, await refresh, await joined
+
+    during, refreshed, joined = asyncio.run(run())
+    assert (during, refreshed, joined) == ("old", "new", "new")
+    assert cache.get("k") == "new"
+    assert cache.ttl_remaining("k") > 59
+
+
+def test_cache_backend_is_abstract():
+    from app.utils.cache import CacheBackend
+
+    class Partial(CacheBackend):
+        async def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
@@ -0,0 +1,180 @@
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sklearn.linear_model import Ridge
+
+from app.main import app
+from app.services import forecast_service as forecast_module
+from app.services.forecast_service import (
+    FEATURES,
+    ForecastService,
+    build_features,
+    forecast_service,
+    load_model,
+    save_model,
+)
+from app.services.tempo_service import tempo_service
+
+NOW = datetime(2026, 10, 17, 22, 30, tzinfo=timezone.utc)
+CURRENT = {"pm25": 20.0, "o3": 40.0, "no2": 15.0, "aqi_now": 68}
+TRAIN_FEATURES = ("horizon", "hour_sin", "hour_cos", "aqi_now")
+
+
+def train_tiny_model(path, version="test-1"):
+    """Ridge on synthetic data: AQI drifts up 0.5/hour with a diurnal swing."""
+    rng = np.random.default_rng(0)
+    start = datetime(2026, 10, 1, tzinfo=timezone.utc)
+    X = np.vstack([build_features(40.0, -74.0, start.replace(hour=h), 24, {"aqi_now": a})
+                   for h in range(24) for a in rng.uniform(20, 150, 4)])
+    cols = [FEATURES.index(f) for f in TRAIN_FEATURES]
+    y = X[:, FEATURES.index("aqi_now")] + 0.5 * X[:, 0] + 5 * X[:, FEATURES.index("hour_sin")]
+    model = Ridge(alpha=1e-6).fit(X[:, cols], y)
+    save_model(str(path), model, version, {"mae": 0.1, "rmse": 0.2, "r2": 0.99},
+               name="Ridge", features=TRAIN_FEATURES, fill={"aqi_now": 50.0})
+
+
+def patch_tempo(monkeypatch):
+    async def fake_tempo(lat, lon, *args, **kwargs):
+        return {"measurements": {"pm25": 20.0, "o3": 40.0, "no2": 15.0}}
+
+    monkeypatch.setattr(tempo_service, "fetch_tempo_data", fake_tempo)
+
+
+def test_features_cover_every_horizon_in_one_matrix():
+    X = build_features(40.0, -74.0, NOW.replace(minute=0), 6, CURRENT)
+    assert X.shape == (6, len(FEATURES))
+    assert X[:, 0].tolist() == [1, 2, 3, 4, 5, 6]
+    hour = np.degrees(np.arctan2(X[:, 1], X[:, 2])) % 360 / 15
+    assert np.allclose(hour, [23, 0, 1, 2, 3, 4])
+    assert (X[:, FEATURES.index("aqi_now")] == 68).all()
+
+
+def test_artifact_is_memory_mapped_and_fills_missing_inputs(tmp_path):
+    path = tmp_path / "forecast.joblib"
+    train_tiny_model(path)
+    model = load_model(str(path))
+    assert isinstance(model.estimator.coef_, np.memmap)
+    assert model.version == "test-1" and model.features == TRAIN_FEATURES
+    X = build_features(40.0, -74.0, NOW, 3, {})  # no current conditions
+    filled = build_features(40.0, -74.0, NOW, 3, {"aqi_now": 50.0})
+    assert np.allclose(model.predict(X), model.predict(filled))
+
+
+def test_forecast_runs_one_predict_off_the_event_loop(tmp_path, monkeypatch):
+    patch_tempo(monkeypatch)
+    train_tiny_model(tmp_path / "forecast.joblib")
+    service = ForecastService(model_dir=str(tmp_path))
+    assert service.load()
+    calls = []
+    predict = service.model.predict
+
+    def recording_predict(X):
+        calls.append((X.shape, threading.current_thread().name))
+        return predict(X)
+
+    service.model.predict = recording_predict
+    data = asyncio.run(service.forecast(40.0, -74.0, 24, now=NOW))
+    assert len(calls) == 1 and calls[0][0] == (24, len(FEATURES))
+    assert calls[0][1].startswith("forecast")
+    predictions = data["predictions"]
+    assert [p["hour"] for p in predictions] == list(range(1, 25))
+    assert predictions[0]["timestamp"] == "2026-10-17T23:00:00Z"
+    assert predictions[-1]["aqi"] > predictions[0]["aqi"]  # learned upward drift
+    assert data["model"] == "Ridge (test-1)" and data["accuracy"]["r2"] == 0.99
+    asyncio.run(service.close())
+
+
+def test_route_serves_baseline_without_artifact(tmp_path, monkeypatch):
+    patch_tempo(monkeypatch)
+    monkeypatch.setattr(forecast_service, "model", forecast_module.PersistenceModel())
+    resp = TestClient(app).get("/api/forecast/?lat=40.7&lon=-74.0&hours=6")
+    assert resp.status_code == 200
+    data = resp.json()["data"]
+    assert len(data["predictions"]) == 6
+    assert {p["aqi"] for p in data["predictions"]} == {data["predictions"][0]["aqi"]}
+    assert data["model"] == "Persistence baseline (baseline)"
+    assert TestClient(app).get("/api/forecast/?lat=40.7&lon=-74.0&hours=0").status_code == 422
+
+
+def test_cached_runs_serve_shorter_horizons_and_follow_model_version(tmp_path, monkeypatch):
+    patch_tempo(monkeypatch)
+    service = ForecastService(model_dir=str(tmp_path))
+    runs = []
+    forecast = service.forecast
+
+    async def counting_forecast(lat, lon, hours, now=None, model=None):
+        runs.append(hours)
+        return await forecast(lat, lon, hours, now, model)
+
+    service.forecast = counting_forecast
+
+    async def main():
+        day, day_etag = await service.forecast_cached(40.7128, -74.0060, 24, now=NOW)
+        six, six_etag = await service.forecast_cached(40.7130, -74.0061, 6, now=NOW)  # same tile
+        train_tiny_model(tmp_path / "forecast.joblib", version="test-2")
+        service.load()
+        swapped, swapped_etag = await service.forecast_cached(40.7128, -74.0060, 6, now=NOW)
+        return day, day_etag, six, six_etag, swapped, swapped_etag
+
+    day, day_etag, six, six_etag, swapped, swapped_etag = asyncio.run(main())
+    assert runs == [24, 24]  # the 6h request reused the 24h run; the new model recomputed
+    assert six["predictions"] == day["predictions"][:6]
+    assert six["location"] == {"lat": 40.7130, "lon": -74.0061, "name": "40.713, -74.006"}
+    assert len({day_etag, six_etag, swapped_etag}) == 3
+    assert swapped["model"] == "Ridge (test-2)"
+
+
+def test_route_etag_allows_conditional_polling(monkeypatch):
+    patch_tempo(monkeypatch)
+    monkeypatch.setattr(forecast_service, "model", forecast_module.PersistenceModel())
+    client = TestClient(app)
+    first = client.get("/api/forecast/?lat=40.7&lon=-74.0&hours=12")
+    etag = first.headers["etag"]
+    assert "max-age" in first.headers["cache-control"]
+    again = client.get("/api/forecast/?lat=40.7&lon=-74.0&hours=12", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    post = client.post("/api/forecast/", json={"lat": 40.7, "lon": -74.0, "hours": 12})
+    assert post.headers["etag"] == etag and post.json() == first.json()
+
+
+def test_registry_swaps_to_newer_artifact_after_in_flight_requests(tmp_path, monkeypatch):
+    train_tiny_model(tmp_path / "forecast-v1.joblib", version="v1")
+    service = ForecastService(model_dir=str(tmp_path))
+    assert service.load() and service.model.version == "v1"
+    assert not service.load()  # unchanged directory: nothing to do
+
+    async def main():
+        gate = asyncio.Event()
+
+        async def slow_conditions(lat, lon):
+            await gate.wait()
+            return dict(CURRENT)
+
+        service.current_conditions = slow_conditions
+        in_flight = asyncio.create_task(service.forecast(40.0, -74.0, 6, now=NOW))
+        await asyncio.sleep(0)
+        train_tiny_model(tmp_path / "forecast-v2.joblib", version="v2")
+        os.utime(tmp_path / "forecast-v2.joblib", ns=(time.time_ns() + 10**9,) * 2)
+        assert await asyncio.to_thread(service.load)
+        gate.set()
+        old = await in_flight
+        new = await service.forecast(40.0, -74.0, 6, now=NOW)
+        return old, new
+
+    old, new = asyncio.run(main())
+    assert old["modelVersion"] == "v1" and new["modelVersion"] == "v2"
+    assert service.registry.swaps == 2 and service.registry.warmup_ms is not None
+
+    broken = tmp_path / "forecast-v3.joblib"
+    broken.write_bytes(b"not a model")
+    os.utime(broken, ns=(time.time_ns() + 2 * 10**9,) * 2)
+    with pytest.raises(Exception):
+        service.load()
+    assert service.model.version == "v2" and "forecast-v3" in service.registry.last_error
+    assert not service.load()  # not retried until the file changes
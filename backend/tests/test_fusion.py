@@ -0,0 +1,79 @@
+import math
+
+import numpy as np
+
+from app.utils.fusion import idw_estimate, pack_measurements, union_stations
+
+
+def _station(i, distance, **values):
+    return {
+        "stationId": i, "lat": 40.0 + i * 0.01, "lon": -74.0, "distance": distance,
+        "measurements": [{"parameter": k, "value": v, "unit": None} for k, v in values.items()],
+    }
+
+
+def _reference_idw(stations, param):
+    # Original per-measurement loop from routes/airquality.py
+    values = []
+    for s in stations:
+        dist = s.get("distance") or 0.1
+        for m in s["measurements"]:
+            if m["parameter"] == param and isinstance(m["value"], (int, float)) and math.isfinite(m["value"]):
+                values.append((m["value"], dist))
+    if not values:
+        return None
+    return sum(v / (d + 0.01) for v, d in values) / sum(1 / (d + 0.01) for _, d in values)
+
+
+def test_matches_reference_loop():
+    rng = np.random.default_rng(7)
+    for _ in range(50):
+        stations = []
+        for i in range(rng.integers(1, 12)):
+            values = {p: float(rng.uniform(1, 200)) for p in ("pm25", "o3", "no2") if rng.random() < 0.7}
+            stations.append(_station(i, float(rng.choice([0.0, rng.uniform(0.1, 80)])), **values))
+        matrix = pack_measurements(stations, ("pm25", "o3", "no2"))
+        est = idw_estimate(matrix.values, matrix.distances)
+        for j, param in enumerate(("pm25", "o3", "no2")):
+            expected = _reference_idw(stations, param)
+            if expected is None:
+                assert np.isnan(est[j])
+            else:
+                assert math.isclose(est[j], expected, rel_tol=1e-12)
+
+
+def test_unit_conversion_and_invalid_values():
+    stations = [{
+        "stationId": 1, "lat": 0, "lon": 0, "distance": 1.0,
+        "measurements": [
+            {"parameter": "o3", "value": 0.04, "unit": "ppm"},
+            {"parameter": "pm25", "value": float("nan"), "unit": "µg/m³"},
+        ],
+    }]
+    matrix = pack_measurements(stations, ("pm25", "o3"))
+    assert np.isnan(matrix.values[0, 0])
+    assert matrix.values[0, 1] == 40.0
+
+
+def test_cutoffs_and_nearest_fallback():
+    values = np.array([[10.0], [20.0], [30.0]])
+    distances = np.array([1.0, 2.0, 50.0])
+    near_two = idw_estimate(values, distances, k_nearest=2)
+    assert near_two[0] < idw_estimate(values, distances)[0]
+    # Every station beyond max distance -> nearest valid station's value
+    assert idw_estimate(values, distances + 100, max_distance_km=10)[0] == 10.0
+    assert np.isnan(idw_estimate(values, distances + 100, max_distance_km=10, fallback=False)[0])
+    # Higher power concentrates weight on the nearest station
+    assert idw_estimate(values, distances, power=3)[0] < idw_estimate(values, distances, power=1)[0]
+
+
+def test_batch_membership():
+    a = [_station(1, 1.0, pm25=10.0)]
+    b = [_station(1, 1.0, pm25=10.0), _station(2, 1.0, pm25=30.0)]
+    stations, membership = union_stations([a, b, []])
+    assert len(stations) == 2
+    matrix = pack_measurements(stations, ("pm25",))
+    est = idw_estimate(matrix.values, np.ones((3, 2)), membership)
+    assert est[0, 0] == 10.0
+    assert est[1, 0] == 20.0
+    assert np.isnan(est[2, 0])
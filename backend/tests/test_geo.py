@@ -0,0 +1,33 @@
+import math
+
+import numpy as np
+
+from app.utils.geo import bucket_radius, geohash_bbox, geohash_encode, geohash_reach_km, haversine_km
+
+
+def test_geohash_known_value():
+    # Reference value from the geohash spec examples
+    assert geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+
+def test_geohash_bbox_contains_point():
+    lat, lon = 40.7128, -74.0060
+    min_lat, min_lon, max_lat, max_lon = geohash_bbox(geohash_encode(lat, lon, 5))
+    assert min_lat <= lat <= max_lat
+    assert min_lon <= lon <= max_lon
+    assert 2.0 < geohash_reach_km(geohash_encode(lat, lon, 5)) < 4.0
+
+
+def test_haversine_scalar_and_vector():
+    # NYC -> LA ~3936 km
+    d = haversine_km(40.7128, -74.0060, 34.0522, -118.2437)
+    assert math.isclose(float(d), 3936, rel_tol=0.01)
+    arr = haversine_km(0.0, 0.0, np.array([0.0, 1.0]), np.array([1.0, 0.0]))
+    assert arr.shape == (2,)
+    assert math.isclose(arr[0], arr[1], rel_tol=1e-9)
+
+
+def test_bucket_radius():
+    assert bucket_radius(3) == 10
+    assert bucket_radius(20) == 25
+    assert bucket_radius(200) == 200
@@ -0,0 +1,101 @@
+import asyncio
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routes import airquality
+from app.services.grid_service import decode_grid, grid_service, mercator_tile_bounds
+from app.services.openaq_service import openaq_service
+from app.services.station_catalog import StationCatalog
+from app.services.tempo_service import tempo_service
+
+GROUND = {
+    "stations": [{
+        "stationId": 1, "name": "A", "lat": 40.75, "lon": -73.95, "distance": 2.0,
+        "measurements": [{"parameter": "pm25", "value": 80.0}],
+    }],
+    "summary": {},
+}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def fake_nearby(lat, lon, radius_km, parameters=None, limit=100):
+        return GROUND
+
+    monkeypatch.setattr(openaq_service, "get_nearby_stations", fake_nearby)
+    grid_service._cache.clear()
+    return TestClient(app)
+
+
+def test_grid_binary_layout_and_fusion(client):
+    resp = client.get("/api/airquality/grid?bbox=-74.5,40.5,-73.5,41.0&res=0.1&bands=aqi,pm25,no2")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/octet-stream"
+    bands, meta = decode_grid(resp.content)
+    assert (meta["width"], meta["height"]) == (10, 5)
+    assert list(bands) == ["aqi", "pm25", "no2"]
+    assert meta["bbox"] == (-74.5, 40.5, -73.5, 41.0)
+    pm25 = bands["pm25"]
+    # Row 2 (40.75N, north -> south), column 5 (-73.95E) holds the station
+    assert pm25[2, 5] == pytest.approx(80.0)
+    # West edge is beyond the ground radius: satellite value
+    tempo = tempo_service.sample_grid(np.array([40.95]), np.array([-74.45]))
+    assert pm25[0, 0] == pytest.approx(tempo["pm25"][0], abs=1e-4)
+    assert np.all(bands["aqi"] > 0)
+    assert bands["aqi"][2, 5] >= 160  # 80 ug/m3 PM2.5 -> unhealthy
+
+
+def test_grid_etag_not_modified(client):
+    url = "/api/airquality/grid?bbox=-1,51,0,52&res=0.25"
+    first = client.get(url)
+    etag = first.headers["etag"]
+    assert etag.startswith('"') and not etag.startswith("W/")
+    again = client.get(url, headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.content == b""
+    assert client.get(url, headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_grid_rejects_bad_requests(client):
+    assert client.get("/api/airquality/grid?bbox=1,2,3").status_code == 400
+    assert client.get("/api/airquality/grid?bbox=10,0,0,10").status_code == 400
+    assert client.get("/api/airquality/grid?bbox=0,0,10,10&bands=nope").status_code == 400
+    assert client.get("/api/airquality/grid?bbox=-180,-90,180,90&res=0.01").status_code == 400
+
+
+def test_tile_endpoint(client, monkeypatch):
+    monkeypatch.setattr(airquality, "TILE_SIZE", 16)
+    resp = client.get("/api/airquality/tiles/6/18/24?bands=aqi,o3")
+    assert resp.status_code == 200
+    bands, meta = decode_grid(resp.content)
+    assert (meta["width"], meta["height"], meta["projection"]) == (16, 16, 1)
+    assert meta["bbox"] == pytest.approx(mercator_tile_bounds(6, 18, 24))
+    assert np.isfinite(bands["o3"]).all()
+    assert client.get("/api/airquality/tiles/2/4/0").status_code == 400
+
+
+def test_mercator_tile_bounds():
+    west, south, east, north = mercator_tile_bounds(0, 0, 0)
+    assert (west, east) == (-180.0, 180.0)
+    assert north == pytest.approx(85.0511, abs=1e-4)
+    assert south == pytest.approx(-85.0511, abs=1e-4)
+
+
+def test_catalog_supplies_every_station_in_a_wide_box(client, monkeypatch):
+    # 300 stations spread over ~1000 km: far more than one 100-station, 200 km lookup
+    stations = [
+        {"stationId": i, "lat": 35.0 + (i % 20) * 0.4, "lon": -85.0 + (i // 20) * 0.7,
+         "measurements": [{"parameter": "pm25", "value": 80.0}]}
+        for i in range(300)
+    ]
+    catalog = StationCatalog()
+    catalog.swap(stations)
+    monkeypatch.setattr(openaq_service, "catalog", catalog)
+    matrix = asyncio.run(grid_service._stations((-85.5, 34.5, -74.0, 43.5)))
+    assert len(matrix.lat) == 300
+    # Without a catalog such a box is not fused from a centre lookup
+    monkeypatch.setattr(openaq_service, "catalog", StationCatalog())
+    assert len(asyncio.run(grid_service._stations((-85.5, 34.5, -74.0, 43.5))).lat) == 0
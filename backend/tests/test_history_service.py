@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routes import history as history_route
+from app.services.history_service import HistoryService, station_records
+from app.services.openaq_service import openaq_service
+from app.services.prefetch_service import prefetch_service
+from app.services.station_catalog import StationCatalog
+from app.services.tempo_service import tempo_service
+
+NOW = datetime(2026, 10, 17, 12, 30, tzinfo=timezone.utc)
+
+
+def station(station_id, hours_ago, pm25):
+    ts = (NOW - timedelta(hours=hours_ago)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return {
+        "stationId": station_id, "name": f"S{station_id}", "lat": 40.7, "lon": -74.0,
+        "measurements": [
+            {"parameter": "pm25", "value": pm25, "unit": "µg/m³", "lastUpdated": ts},
+            {"parameter": "o3", "value": 0.03, "unit": "ppm", "lastUpdated": ts},
+        ],
+    }
+
+
+def test_station_records_group_parameters_by_observation_time():
+    records = station_records([station(7, 1, 12.0), {"name": "no id", "measurements": []}])
+    assert records == [("station-7", NOW - timedelta(hours=1), {"pm25": 12.0, "o3": 0.03})]
+
+
+def test_ingest_records_each_catalog_version_once_and_tempo_tiles(tmp_path, monkeypatch):
+    service = HistoryService(root=str(tmp_path))
+    catalog = StationCatalog()
+    monkeypatch.setattr(openaq_service, "catalog", catalog)
+    monkeypatch.setattr(prefetch_service, "locations", [{"name": "NYC", "lat": 40.7128, "lon": -74.0060}])
+    monkeypatch.setattr(prefetch_service, "_scores", {})
+
+    async def fake_tempo(lat, lon, *args, **kwargs):
+        return {"measurements": {"no2": 20.0, "o3": 40.0}}
+
+    monkeypatch.setattr(tempo_service, "fetch_tempo_data", fake_tempo)
+
+    async def main():
+        catalog.swap([station(1, 2, 10.0), station(2, 2, 30.0)])
+        first = await service.ingest_stations()
+        again = await service.ingest_stations()  # same catalog version
+        tiles = await service.ingest_tiles(now=NOW)
+        return first, again, tiles
+
+    assert asyncio.run(main()) == (4, 0, 2)
+    data = service.query("station-2", NOW - timedelta(hours=3), NOW, ["pm25"])
+    assert data["timestamps"] == ["2026-10-17T09:00:00Z", "2026-10-17T10:00:00Z", "2026-10-17T11:00:00Z"]
+    assert data["values"]["pm25"][1] == 30.0
+    assert sorted(service.store.series()) == ["station-1", "station-2", "tile-dr5re"]
+
+
+def test_route_serves_history_with_rolling_aggregates(tmp_path, monkeypatch):
+    service = HistoryService(root=str(tmp_path))
+    start = NOW.replace(hour=0, minute=0)
+    service.store.append(("station-9", start + timedelta(hours=h), {"pm25": 10.0 + h % 2, "o3": 40.0})
+                         for h in range(30))
+    monkeypatch.setattr(history_route, "history_service", service)
+    client = TestClient(app)
+    resp = client.get("/api/history/station/9", params={
+        "start": "2026-10-17T00:00:00", "end": "2026-10-18T06:00:00", "parameters": "pm25,o3",
+    })
+    assert resp.status_code == 200
+    data = resp.json()["data"]
+    assert len(data["timestamps"]) == 30 and data["values"]["o3"][0] == 40.0
+    assert data["aggregates"]["o3_8h"][:5] == [None] * 5 and data["aggregates"]["o3_8h"][7] == 40.0
+    assert data["aggregates"]["pm25_24h"][23] == 10.5
+    too_long = client.get("/api/history/station/9", params={"start": "2026-01-01T00:00:00Z"})
+    assert too_long.status_code == 400
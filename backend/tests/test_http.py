@@ -0,0 +1,115 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+from app.utils import http
+from app.utils.http import PooledTransport, close_client, http_client, http_stats
+
+# A leaked host slot shows up as a hang; fail fast instead
+TIMEOUT = 5
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, TIMEOUT))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_per_host_concurrency_is_capped():
+    active = {"now": 0, "max": 0}
+
+    async def handler(request):
+        active["now"] += 1
+        active["max"] = max(active["max"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+        return httpx.Response(200, json={"host": request.url.host})
+
+    async def main():
+        transport = PooledTransport(per_host=2, inner=httpx.MockTransport(handler))
+        async with httpx.AsyncClient(transport=transport) as client:
+            urls = [f"http://{host}.test/x" for host in ("a", "b") for _ in range(5)]
+            responses = await asyncio.gather(*(client.get(u) for u in urls))
+        return transport, responses
+
+    transport, responses = run(main())
+    assert all(r.status_code == 200 for r in responses)
+    assert active["max"] == 4  # two per host
+    assert transport.in_flight == 0 and transport.requests == 10
+    assert transport.waited > 0
+
+
+def test_sequential_requests_release_host_slots():
+    async def handler(request):
+        return httpx.Response(200, json={"ok": True})
+
+    async def main():
+        transport = PooledTransport(per_host=1, inner=httpx.MockTransport(handler))
+        async with httpx.AsyncClient(transport=transport) as client:
+            for _ in range(3):
+                assert (await client.get("http://a.test/x")).status_code == 200
+            async with client.stream("GET", "http://a.test/x") as response:
+                await response.aread()
+            await client.get("http://a.test/x")
+        return transport
+
+    transport = run(main())
+    assert transport.requests == 5 and transport.in_flight == 0
+
+
+def test_pool_hook_is_installed():
+    transport = PooledTransport()
+    assert transport.connections_opened == 0
+    assert transport.stats()["connections"] == 0
+
+
+def test_shared_client_reuses_connections_and_reports_pool():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    async def main():
+        client = http_client("pool-test", base_url=base_url)
+        assert http_client("pool-test") is client
+        for _ in range(5):
+            assert (await client.get("/")).json() == {"ok": True}
+        stats = http_stats()["pool-test"]
+        await close_client("pool-test")
+        return stats
+
+    try:
+        stats = run(main())
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert stats["requests"] == 5 and stats["connectionsOpened"] == 1
+    assert stats["connections"] == 1 and stats["idle"] == 1 and stats["inFlight"] == 0
+    assert stats["reuseRatio"] == 0.8
+    assert "pool-test" not in http.http_stats()
+
+
+def test_closed_client_is_recreated():
+    async def main():
+        first = http_client("recreate-test")
+        await first.aclose()
+        second = http_client("recreate-test")
+        await close_client("recreate-test")
+        return first, second
+
+    first, second = run(main())
+    assert first is not second and second.is_closed
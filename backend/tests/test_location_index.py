@@ -0,0 +1,91 @@
+import asyncio
+import json
+import os
+
+import httpx
+
+from app.services.location_index import LocationIndex
+from app.services.openaq_service import OpenAQService
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "stations.json")
+
+
+def fixture_stations():
+    with open(FIXTURE, "r", encoding="utf-8") as f:
+        return json.load(f)["stations"]
+
+
+def names(results):
+    return [r["name"] for r in results]
+
+
+def test_prefix_word_and_substring_ranking():
+    index = LocationIndex.build(fixture_stations())
+    assert len(index) == 9  # station without coordinates skipped
+    assert names(index.search("Manh")) == ["Manhattan - Broadway"]
+    assert names(index.search("greenpoint")) == ["Brooklyn - Greenpoint"]
+    # City words match too; name prefixes rank ahead of word prefixes
+    assert names(index.search("new")) == ["Newark Firehouse", "Manhattan - Broadway",
+                                          "Brooklyn - Greenpoint", "Queens College"]
+    assert names(index.search("ondon mary")) == ["London Marylebone Road"]
+    assert names(index.search("mary london")) == ["London Marylebone Road"]  # any word order
+    assert names(index.search("london pasadena")) == []
+    assert names(index.search("arylebone")) == ["London Marylebone Road"]
+    assert names(index.search("los ang")) == ["Los Angeles - N. Main St"]
+
+
+def test_country_filter_limit_and_accents():
+    stations = fixture_stations()
+    stations += [{**stations[0], "stationId": 999}]  # duplicate name + country
+    stations += [{"stationId": 500, "name": "São Paulo - Centro", "country": "BR", "lat": -23.5, "lon": -46.6}]
+    index = LocationIndex.build(stations)
+    assert names(index.search("sao p")) == ["São Paulo - Centro"]
+    assert names(index.search(country="pk")) == ["Lahore - Punjab EPA", "Karachi - Clifton"]
+    assert len(index.search(country="US", limit=3)) == 3
+    assert index.search("manhattan", country="ZZ") == []
+    assert [r["id"] for r in index.search("manhattan")] == [101]
+
+
+def test_index_round_trips_through_disk(tmp_path):
+    index = LocationIndex.build(fixture_stations())
+    path = str(tmp_path / "locations.npz")
+    index.save(path)
+    loaded = LocationIndex.load(path)
+    for query, country in (("new", None), ("lah", "PK"), (None, "GB"), ("road", None)):
+        assert loaded.search(query, country) == index.search(query, country)
+
+
+def test_service_searches_locally_once_catalog_is_loaded(tmp_path):
+    def no_network(request):
+        raise AssertionError("upstream should not be called")
+
+    service = OpenAQService()
+    service._client = httpx.AsyncClient(base_url="https://openaq.test", transport=httpx.MockTransport(no_network))
+    service.catalog_path = FIXTURE
+    service.location_index_path = str(tmp_path / "locations.npz")
+
+    async def run():
+        await service.start_catalog()
+        return await service.search_cities("karachi", "PK", 5)
+
+    assert names(asyncio.run(run())) == ["Karachi - Clifton"]
+    assert os.path.exists(service.location_index_path)
+
+
+def test_upstream_search_applies_limit_after_dedup():
+    duplicate = {"name": "Station A", "country": "US", "coordinates": {"latitude": 1.0, "longitude": 2.0}}
+    requested = []
+
+    def handler(request):
+        requested.append(int(request.url.params["limit"]))
+        results = [duplicate] * 4 + [
+            {"name": f"Station {i}", "country": "US", "coordinates": {"latitude": 1.0, "longitude": 2.0}}
+            for i in range(5)
+        ]
+        return httpx.Response(200, json={"results": results})
+
+    service = OpenAQService()
+    service._client = httpx.AsyncClient(base_url="https://openaq.test", transport=httpx.MockTransport(handler))
+    results = asyncio.run(service.search_cities("station", limit=3))
+    assert names(results) == ["Station A", "Station 0", "Station 1"]
+    assert requested[0] > 3
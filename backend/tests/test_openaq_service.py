@@ -0,0 +1,119 @@
+import asyncio
+
+import httpx
+
+from app.services.openaq_service import OpenAQService
+
+
+def _location(i, lat, lon, pm25=10.0):
+    return {
+        "id": i,
+        "name": f"Station {i}",
+        "coordinates": {"latitude": lat, "longitude": lon},
+        "country": "US",
+        "city": "New York",
+        "parameters": [{"parameter": "pm25", "lastValue": pm25, "unit": "µg/m³", "lastUpdated": "2025-10-04T12:00:00Z"}],
+    }
+
+
+LOCATIONS = [
+    _location(1, 40.7130, -74.0050, 12.0),
+    _location(2, 40.7300, -73.9900, 20.0),
+    _location(3, 40.9000, -73.8000, 30.0),
+]
+
+
+def make_service(handler=None):
+    calls = []
+
+    def default_handler(request):
+        calls.append(request)
+        return httpx.Response(200, json={"results": LOCATIONS})
+
+    service = OpenAQService()
+    service._client = httpx.AsyncClient(
+        base_url="https://openaq.test", transport=httpx.MockTransport(handler or default_handler)
+    )
+    return service, calls
+
+
+def test_nearby_queries_in_one_tile_share_upstream_call():
+    service, calls = make_service()
+
+    async def run():
+        return [
+            await service.get_nearby_stations(40.7128 + i * 0.0005, -74.0060, 10, None, 5)
+            for i in range(20)
+        ]
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    # Distances are computed for each exact query point
+    assert results[0]["stations"][0]["distance"] != results[-1]["stations"][0]["distance"]
+
+
+def test_local_radius_filter_and_ordering():
+    service, _ = make_service()
+    data = asyncio.run(service.get_nearby_stations(40.7128, -74.0060, 10, None, 5))
+    ids = [s["stationId"] for s in data["stations"]]
+    assert ids == [1, 2]  # station 3 is ~25 km away
+    assert data["summary"]["pm25"]["count"] == 2
+    assert data["summary"]["pm25"]["avg"] == 16.0
+
+
+def test_upstream_error_is_not_cached():
+    calls = []
+
+    def failing(request):
+        calls.append(request)
+        return httpx.Response(503)
+
+    service, _ = make_service(failing)
+    first = asyncio.run(service.get_nearby_stations(40.7128, -74.0060))
+    second = asyncio.run(service.get_nearby_stations(40.7128, -74.0060))
+    assert first["stations"] == [] and "error" in first
+    assert "error" in second
+    assert len(calls) == 2
+
+
+def test_adaptive_search_uses_single_wide_lookup():
+    service, calls = make_service()
+    # Nearest station (~25 km) is outside 10 and 20 km, inside 40 km
+    ground, radius_used, attempts = asyncio.run(
+        service.get_nearby_stations_adaptive(40.7128, -74.2800, 10, 10, 3)
+    )
+    assert len(calls) == 1
+    assert radius_used == 40
+    assert attempts == 3
+    assert all(s["distance"] <= 40 for s in ground["stations"])
+
+
+def test_adaptive_search_reports_all_attempts_when_empty():
+    service, calls = make_service(lambda request: httpx.Response(200, json={"results": []}))
+    ground, radius_used, attempts = asyncio.run(
+        service.get_nearby_stations_adaptive(0.0, 0.0, 10, 10, 3)
+    )
+    assert ground["stations"] == []
+    assert (radius_used, attempts) == (80, 4)
+
+
+def test_catalog_crawl_failures_do_not_open_interactive_circuit():
+    def handler(request):
+        if request.url.params.get("limit") == "1000":  # catalog page
+            return httpx.Response(503)
+        return httpx.Response(200, json={"results": LOCATIONS})
+
+    service, _ = make_service(handler)
+
+    async def run():
+        for _ in range(service.catalog_upstream.breaker.failure_threshold):
+            try:
+                await service.refresh_catalog()
+            except httpx.HTTPError:
+                pass
+        return await service.get_nearby_stations(40.7128, -74.0060)
+
+    data = asyncio.run(run())
+    assert service.catalog_upstream.breaker.state == "open"
+    assert service.upstream.breaker.state == "closed"
+    assert [s["stationId"] for s in data["stations"]] == [1, 2]
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import prefetch_service as prefetch_module
+from app.services.openaq_service import openaq_service
+from app.services.prefetch_service import PrefetchService, parse_locations
+from app.services.tempo_service import tempo_service
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Count upstream loads behind the TEMPO and station caches."""
+    calls = {"tempo": 0, "stations": 0}
+
+    async def fake_tempo(lat, lon, date):
+        calls["tempo"] += 1
+        return {"location": {"lat": lat, "lon": lon}, "measurements": {"no2": 10.0 + calls["tempo"]}}
+
+    async def fake_stations(lat, lon, radius_km, param_set, limit):
+        calls["stations"] += 1
+        return {"stations": [{"stationId": 1, "lat": lat, "lon": lon, "measurements": []}]}
+
+    monkeypatch.setattr(tempo_service, "_fetch_uncached", fake_tempo)
+    monkeypatch.setattr(openaq_service, "_fetch_stations", fake_stations)
+    tempo_service._cache.l1.clear()
+    openaq_service._stations_cache.l1.clear()
+    return calls
+
+
+def test_parse_locations_skips_malformed_entries():
+    assert parse_locations("A:1.5:-2;bad;B:x:3;C D:4:5") == [
+        {"name": "A", "lat": 1.5, "lon": -2.0},
+        {"name": "C D", "lat": 4.0, "lon": 5.0},
+    ]
+
+
+def test_popularity_ranking_and_decay():
+    service = PrefetchService()
+    for _ in range(3):
+        service.record(51.5074, -0.1278)
+    service.record(48.8566, 2.3522)
+    service.record(51.50741, -0.12779)  # same tile and rounded point
+    assert service.top_points(2) == [(51.507, -0.128), (48.857, 2.352)]
+    service.decay = 0.01
+    service._decay()
+    assert service.top_points() == []
+
+
+def test_tick_warms_locations_and_refreshes_before_expiry(upstream):
+    service = PrefetchService()
+    service.locations = [{"name": "NYC", "lat": 40.7128, "lon": -74.006}]
+    service.record(34.0522, -118.2437)
+    service.margin = 10
+
+    assert asyncio.run(service.tick()) == 4  # TEMPO + station tile for both points
+    assert upstream == {"tempo": 2, "stations": 2}
+    # Fresh entries (TTL well beyond the margin) are left alone
+    assert asyncio.run(service.tick()) == 0
+    # Entries about to expire are reloaded in place
+    service.margin = 10_000
+    assert asyncio.run(service.tick()) == 4
+    assert upstream == {"tempo": 4, "stations": 4}
+    assert service.stats()["refreshed"] == 8
+
+
+def test_latest_served_from_warm_cache(upstream, monkeypatch):
+    service = PrefetchService()
+    monkeypatch.setattr(prefetch_module.prefetch_service, "locations", service.locations)
+    asyncio.run(service.tick())
+    warmed = upstream["tempo"]
+    resp = TestClient(app).get("/api/tempo/latest")
+    assert resp.status_code == 200
+    assert [r["location"] for r in resp.json()["data"]] == ["New York", "Los Angeles", "Chicago"]
+    assert upstream["tempo"] == warmed  # no upstream call on the request path
+
+
+def test_start_waits_for_first_tick_within_timeout(monkeypatch):
+    service = PrefetchService()
+    service.locations = [{"name": "NYC", "lat": 40.7128, "lon": -74.006}]
+    delay = {"s": 0.0}
+
+    async def warm_point(lat, lon):
+        await asyncio.sleep(delay["s"])
+        return 1
+
+    monkeypatch.setattr(service, "warm_point", warm_point)
+
+    async def run():
+        await service.start()
+        warm = service.ticks
+        await service.stop()
+        delay["s"] = 5.0
+        service.startup_timeout = 0.05
+        await service.start()  # gives up waiting; warming continues in the background
+        slow = service.ticks
+        await service.stop()
+        return warm, slow
+
+    assert asyncio.run(asyncio.wait_for(run(), 2)) == (1, 1)
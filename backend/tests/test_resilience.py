@@ -0,0 +1,131 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from app.services.openaq_service import OpenAQService
+from app.utils.cache import AsyncTTLCache, TieredCache
+from app.utils.resilience import CircuitBreaker, CircuitOpenError, Upstream
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeOpenAQ:
+    """ASGI stand-in for OpenAQ with injectable latency and faults."""
+
+    def __init__(self):
+        self.latency = 0.0
+        self.status = 200
+        self.value = 12.0
+        self.calls = 0
+        self.app = FastAPI()
+
+        @self.app.get("/locations")
+        async def locations():
+            self.calls += 1
+            await asyncio.sleep(self.latency)
+            if self.status != 200:
+                return JSONResponse({"error": "upstream fault"}, status_code=self.status)
+            return {"results": [{
+                "id": 1, "name": "Station 1", "coordinates": {"latitude": 40.713, "longitude": -74.005},
+                "parameters": [{"parameter": "pm25", "lastValue": self.value, "unit": "µg/m³"}],
+            }]}
+
+    def service(self, clock=None, threshold=2, budget=0.1) -> OpenAQService:
+        service = OpenAQService()
+        service._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=self.app), base_url="http://openaq.test")
+        service.upstream = Upstream(
+            "openaq-test",
+            budgets={"/locations": budget},
+            breaker=CircuitBreaker(failure_threshold=threshold, reset_timeout=30, clock=clock or time.monotonic),
+        )
+        return service
+
+
+def test_breaker_opens_then_half_open_probe_decides():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    clock.now = 31
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()  # one probe at a time
+    breaker.record_failure()  # failed probe re-opens
+    assert breaker.state == "open"
+    clock.now = 62
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.stats()["opened"] == 2
+
+
+def test_slow_upstream_fails_fast_and_opens_circuit():
+    fake = FakeOpenAQ()
+    fake.latency = 1.0
+    service = fake.service()
+
+    async def run():
+        results = []
+        for _ in range(3):
+            start = time.perf_counter()
+            results.append((await service._fetch_stations(40.7, -74.0, 10, ["pm25"], 10), time.perf_counter() - start))
+        return results
+
+    results = asyncio.run(run())
+    assert all("error" in data for data, _ in results)
+    assert all(elapsed < 0.5 for _, elapsed in results)  # budget, not the 15 s client timeout
+    assert "budget" in results[0][0]["error"]
+    assert "circuit open" in results[2][0]["error"]
+    assert fake.calls == 2  # third call never reached the upstream
+    assert service.upstream.stats()["timeouts"] == 2
+
+
+def test_client_errors_do_not_open_circuit():
+    fake = FakeOpenAQ()
+    fake.status = 404
+    service = fake.service(threshold=1)
+    asyncio.run(service._fetch_stations(40.7, -74.0, 10, ["pm25"], 10))
+    assert service.upstream.breaker.state == "closed"
+    fake.status = 503
+    asyncio.run(service._fetch_stations(40.7, -74.0, 10, ["pm25"], 10))
+    assert service.upstream.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(service._get("/locations", {}))
+
+
+def test_stale_tile_served_while_refreshing():
+    fake = FakeOpenAQ()
+    clock = FakeClock()
+    service = fake.service(threshold=5)
+    service._stations_cache = TieredCache(AsyncTTLCache("test-stale-tiles", ttl=600, stale_ttl=3600, clock=clock))
+
+    async def value():
+        data = await service.get_nearby_stations(40.713, -74.005, 10, ["pm25"], 5)
+        return data["stations"][0]["measurements"][0]["value"], data.get("stale", False)
+
+    async def run():
+        steps = [await value()]
+        clock.now = 700  # past TTL, inside the stale window
+        fake.status = 503
+        steps.append(await value())  # stale; background refresh fails
+        await asyncio.sleep(0.05)
+        fake.status, fake.value = 200, 30.0
+        steps.append(await value())  # still stale; background refresh succeeds
+        await asyncio.sleep(0.05)
+        steps.append(await value())
+        return steps
+
+    assert asyncio.run(run()) == [(12.0, False), (12.0, True), (12.0, True), (30.0, False)]
+    assert fake.calls == 3
@@ -0,0 +1,111 @@
+import asyncio
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+from app.services.openaq_service import OpenAQService
+from app.utils.scheduler import (
+    BATCH,
+    INTERACTIVE,
+    PREFETCH,
+    RateLimited,
+    RequestScheduler,
+    current_lane,
+    parse_retry_after,
+    request_lane,
+)
+
+NO_RESERVE = {BATCH: 0.0, PREFETCH: 0.0}
+
+
+def test_lanes_are_served_by_priority():
+    scheduler = RequestScheduler("prio-test", rate=50, burst=1, reserve=NO_RESERVE)
+    order = []
+
+    async def call(lane):
+        await scheduler.acquire(lane)
+        order.append(lane)
+
+    async def main():
+        await scheduler.acquire(INTERACTIVE)  # empty the bucket
+        tasks = [asyncio.create_task(call(lane)) for lane in (PREFETCH, BATCH, INTERACTIVE)]
+        await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order == [INTERACTIVE, BATCH, PREFETCH]
+    assert scheduler.stats()["granted"] == {INTERACTIVE: 2, BATCH: 1, PREFETCH: 1}
+
+
+def test_over_budget_waits_are_rejected_early():
+    scheduler = RequestScheduler("budget-test", rate=1, burst=1, queue_limit=1,
+                                 max_wait={INTERACTIVE: 0.5, BATCH: 5})
+
+    async def main():
+        await scheduler.acquire(INTERACTIVE)
+        started = time.monotonic()
+        with pytest.raises(RateLimited):
+            await scheduler.acquire(INTERACTIVE)  # next token is ~1 s away
+        assert time.monotonic() - started < 0.1
+        queued = asyncio.create_task(scheduler.acquire(BATCH))
+        await asyncio.sleep(0)
+        with pytest.raises(RateLimited):
+            await scheduler.acquire(BATCH)  # queue full
+        queued.cancel()
+
+    asyncio.run(main())
+    assert scheduler.stats()["rejected"][INTERACTIVE] == 1
+
+
+def test_background_lanes_leave_a_reserve():
+    scheduler = RequestScheduler("reserve-test", rate=0.1, burst=5, max_wait={PREFETCH: 0})
+
+    async def main():
+        granted = 0
+        with request_lane(PREFETCH):
+            assert current_lane() == PREFETCH
+            while True:
+                try:
+                    await scheduler.acquire()
+                except RateLimited:
+                    break
+                granted += 1
+        for _ in range(2):
+            await scheduler.acquire()  # the reserve is left for interactive calls
+        return granted
+
+    assert asyncio.run(main()) == 3
+    assert current_lane() == INTERACTIVE
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after(None) is None and parse_retry_after("soon") is None
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+    assert 55 <= parse_retry_after(later) <= 60
+
+
+def test_openaq_honours_retry_after():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(429, headers={"Retry-After": "30"}, json={"error": "slow down"})
+
+    service = OpenAQService()
+    service._client = httpx.AsyncClient(base_url="https://openaq.test", transport=httpx.MockTransport(handler))
+    service.scheduler = RequestScheduler("openaq-429-test", rate=10, burst=10)
+
+    async def main():
+        first = await service.search_cities("first")
+        with pytest.raises(RateLimited):
+            await service._get("/locations", {})
+        return first
+
+    assert asyncio.run(main()) == []
+    assert calls == ["/locations"]
+    stats = service.scheduler.stats()
+    assert stats["throttled"] == 1 and stats["pausedFor"] > 25
@@ -0,0 +1,86 @@
+import asyncio
+import os
+
+import httpx
+
+from app.services.openaq_service import OpenAQService
+from app.services.station_catalog import StationCatalog
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "stations.json")
+
+
+def load_catalog():
+    catalog = StationCatalog()
+    assert catalog.load_file(FIXTURE)
+    return catalog
+
+
+def test_fixture_loads_and_skips_stations_without_coordinates():
+    catalog = load_catalog()
+    assert catalog.ready
+    assert len(catalog.snapshot) == 9
+    assert catalog.snapshot.values.shape == (9, 7)
+
+
+def test_nearest_and_radius_queries():
+    snap = load_catalog().snapshot
+    idx, dist = snap.query_nearest(40.7128, -74.0060, k=2)
+    assert [snap.stations[i]["stationId"] for i in idx] == [102, 101]
+    assert dist[0] < dist[1]
+
+    stations = snap.nearby(40.7128, -74.0060, 20, limit=10)
+    assert [s["stationId"] for s in stations] == [102, 101, 103, 104]
+    assert all(s["distance"] <= 20 for s in stations)
+
+
+def test_parameter_filter():
+    snap = load_catalog().snapshot
+    stations = snap.nearby(40.7128, -74.0060, 25, limit=10, parameters=["o3"])
+    assert [s["stationId"] for s in stations] == [101, 103]
+
+
+def test_swap_is_versioned_and_atomic():
+    catalog = load_catalog()
+    old = catalog.snapshot
+    catalog.swap(old.stations[:2])
+    assert catalog.version == old.version + 1
+    assert len(old) == 9  # readers holding the old snapshot are unaffected
+    assert len(catalog.snapshot) == 2
+
+
+def test_service_answers_from_catalog_without_upstream():
+    def no_network(request):
+        raise AssertionError("upstream should not be called")
+
+    service = OpenAQService()
+    service._client = httpx.AsyncClient(base_url="https://openaq.test", transport=httpx.MockTransport(no_network))
+    service.catalog = load_catalog()
+
+    async def run():
+        nearby = await service.get_nearby_stations(31.52, 74.35, 25, None, 5)
+        nearest = await service.get_nearest_station(24.86, 67.00)
+        return nearby, nearest
+
+    nearby, nearest = asyncio.run(run())
+    assert nearby["stations"][0]["stationId"] == 301
+    assert nearby["summary"]["pm25"]["avg"] == 148.0
+    assert nearest["stationId"] == 302
+
+
+def test_outdated_catalog_defers_to_upstream_and_backs_it_up():
+    calls = []
+
+    def failing(request):
+        calls.append(request)
+        return httpx.Response(503)
+
+    service = OpenAQService()
+    service._client = httpx.AsyncClient(base_url="https://openaq.test", transport=httpx.MockTransport(failing))
+    service.catalog = load_catalog()
+    service.catalog.refreshed_at -= service.catalog_max_age + 1
+    assert not service.catalog_fresh
+
+    nearby = asyncio.run(service.get_nearby_stations(31.52, 74.35, 25, None, 5))
+    assert len(calls) == 1  # tried live data first
+    assert nearby["stale"] is True
+    assert nearby["stations"][0]["stationId"] == 301
@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from app.services import swath_index
+from app.services.swath_index import INDEX_SUFFIX, SwathIndex, sample_granule
+from app.utils.geo import haversine_km
+
+
+def swath(ms=60, xt=40):
+    s, p = np.meshgrid(np.arange(ms), np.arange(xt), indexing="ij")
+    return 38.0 + s * 0.02 + p * 0.003, -76.0 + p * 0.04 - s * 0.004
+
+
+def test_nearest_matches_brute_force():
+    lat, lon = swath()
+    lat[3, 5] = np.nan  # missing geolocation is skipped
+    index = SwathIndex(lat, lon)
+    assert len(index) == lat.size - 1
+    rng = np.random.default_rng(0)
+    qlat, qlon = rng.uniform(38.2, 39.0, 200), rng.uniform(-75.8, -74.8, 200)
+    idx, km = index.query(qlat, qlon)
+    d = haversine_km(qlat[:, None], qlon[:, None], lat.ravel()[None, :], lon.ravel()[None, :])
+    d = np.where(np.isnan(d), np.inf, d)
+    np.testing.assert_array_equal(idx[:, 0], d.argmin(axis=1))
+    np.testing.assert_allclose(km[:, 0], d.min(axis=1), rtol=1e-6)
+
+
+def test_sample_modes_and_outside_swath():
+    lat, lon = swath()
+    values = lat * 10.0  # smooth field
+    index = SwathIndex(lat, lon)
+    qlat, qlon = np.array([38.5, 10.0]), np.array([-75.5, 0.0])
+    nearest = index.sample(values, qlat, qlon)
+    assert nearest[0] == pytest.approx(385.0, abs=0.2)
+    assert np.isnan(nearest[1])
+    idw = index.sample(values, qlat, qlon, mode="idw", k=4)
+    assert idw[0] == pytest.approx(385.0, abs=0.1)
+    assert np.isnan(idw[1])
+    with pytest.raises(ValueError):
+        index.sample(values, qlat, qlon, mode="cubic")
+
+
+def test_index_persisted_next_to_granule(tmp_path, monkeypatch):
+    lat, lon = swath()
+    dims = ("mirror_step", "xtrack")
+    path = str(tmp_path / "granule.nc")
+    xr.Dataset().to_netcdf(path, engine="h5netcdf")
+    xr.Dataset({"latitude": (dims, lat), "longitude": (dims, lon)}).to_netcdf(
+        path, group="geolocation", mode="a", engine="h5netcdf")
+    xr.Dataset({"vertical_column": (dims, lat * 10.0)}).to_netcdf(
+        path, group="product", mode="a", engine="h5netcdf")
+
+    out = sample_granule(path, {"hcho": "product/vertical_column", "no2": "product/missing"},
+                         np.array([38.5]), np.array([-75.5]))
+    assert list(out) == ["hcho"]
+    assert out["hcho"][0] == pytest.approx(385.0, abs=0.2)
+    assert os.path.exists(path + INDEX_SUFFIX)
+
+    # A fresh process loads the persisted index instead of rebuilding it
+    swath_index._loaded.clear()
+    monkeypatch.setattr(SwathIndex, "__init__", lambda *a, **k: pytest.fail("index rebuilt"))
+    assert SwathIndex.for_granule(path).shape == lat.shape
@@ -0,0 +1,136 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from app.services.tempo_cube import CubeGrid, TEMPOCube, granule_time_key
+from app.services.tempo_service import TEMPOService
+
+GRID = CubeGrid(lat_min=38.0, lat_max=42.0, lon_min=-76.0, lon_max=-72.0, res=0.5)
+
+
+def write_granule(path, value, start="2024-09-13T14:12:00Z", quality_bad=False, extra_product=None):
+    """Small swath-like granule: 2D lat/lon geolocation + product group."""
+    scan, pixel = np.meshgrid(np.arange(12), np.arange(10), indexing="ij")
+    lat = 38.1 + scan * 0.3 + pixel * 0.02
+    lon = -75.9 + pixel * 0.35 - scan * 0.01
+    dims = ("mirror_step", "xtrack")
+    xr.Dataset(attrs={"time_coverage_start": start}).to_netcdf(path, engine="h5netcdf")
+    xr.Dataset({"latitude": (dims, lat), "longitude": (dims, lon)}).to_netcdf(
+        path, group="geolocation", mode="a", engine="h5netcdf")
+    column = np.full(lat.shape, value, dtype=float)
+    column[0, 0] = np.nan  # fill value pixel
+    flag = np.zeros(lat.shape, dtype=np.int8)
+    if quality_bad:
+        flag[:] = 1
+    product = {"vertical_column_troposphere": (dims, column), "main_data_quality_flag": (dims, flag)}
+    product.update(extra_product or {})
+    xr.Dataset(product).to_netcdf(path, group="product", mode="a", engine="h5netcdf")
+    return str(path)
+
+
+def test_ingest_regrids_onto_memmapped_slice(tmp_path):
+    cube = TEMPOCube(str(tmp_path / "cube"), grid=GRID)
+    granule = write_granule(tmp_path / "g1.nc", 4.0e15)
+    assert granule_time_key(granule) == "20240913T14"
+    assert cube.ingest(granule) == ["no2"]  # no HCHO / O3 variables in an NO2 granule
+    array = cube.array("no2")
+    assert isinstance(array, np.memmap)
+    assert array.shape == GRID.shape
+    assert np.nanmax(array) == pytest.approx(4.0e15)
+    assert cube.point(38.2, -75.8) == {"no2": pytest.approx(4.0e15)}
+    assert cube.point(10.0, 0.0) == {}  # outside the grid
+    assert cube.has_granule(granule)
+
+
+def test_granules_merge_by_pixel_count_and_persist(tmp_path):
+    root = str(tmp_path / "cube")
+    cube = TEMPOCube(root, grid=GRID)
+    cube.ingest(write_granule(tmp_path / "a.nc", 2.0))
+    cube.ingest(write_granule(tmp_path / "b.nc", 4.0))
+    assert cube.point(39.0, -74.5)["no2"] == pytest.approx(3.0)
+    # Reopened cube reads the saved index and grid
+    reopened = TEMPOCube(root)
+    assert reopened.grid == GRID
+    assert reopened.slices() == ["20240913T14"]
+    assert reopened.point(39.0, -74.5)["no2"] == pytest.approx(3.0)
+    window = reopened.bbox(-75.0, 39.0, -74.0, 40.0, "no2")
+    assert window["values"].shape == (2, 2)
+    np.testing.assert_allclose(window["lat"], [39.25, 39.75])
+
+
+def test_quality_flag_and_retention(tmp_path):
+    cube = TEMPOCube(str(tmp_path / "cube"), grid=GRID, max_slices=2)
+    assert cube.ingest(write_granule(tmp_path / "bad.nc", 1.0, quality_bad=True)) == ["no2"]
+    assert cube.point(39.0, -74.5) == {}
+    for hour in (15, 16):
+        cube.ingest(write_granule(tmp_path / f"h{hour}.nc", float(hour), start=f"2024-09-13T{hour}:00:00Z"))
+    assert cube.slices() == ["20240913T15", "20240913T16"]
+    assert not (tmp_path / "cube" / "20240913T14").exists()
+    assert cube.point(39.0, -74.5, time_key="20240913T15")["no2"] == pytest.approx(15.0)
+    values = cube.points(np.array([39.0, 0.0]), np.array([-74.5, 0.0]), "no2")
+    assert values[0] == pytest.approx(16.0) and np.isnan(values[1])
+
+
+def test_pruning_deletes_downloaded_granules_and_sidecars(tmp_path):
+    cube = TEMPOCube(str(tmp_path / "cube"), grid=GRID, max_slices=2)
+    downloads = tmp_path / "cube" / "granules"
+    downloads.mkdir()
+    outside = write_granule(tmp_path / "outside.nc", 1.0, start="2024-09-13T13:00:00Z")
+    paths = {}
+    for hour in (14, 15, 16):
+        paths[hour] = write_granule(downloads / f"h{hour}.nc", float(hour), start=f"2024-09-13T{hour}:00:00Z")
+        (downloads / f"h{hour}.nc.kdtree.joblib").write_bytes(b"index")
+        cube.ingest(paths[hour])
+    assert sorted(p.name for p in downloads.iterdir()) == [
+        "h15.nc", "h15.nc.kdtree.joblib", "h16.nc", "h16.nc.kdtree.joblib"]
+    # Older than every retained hour: dropped without touching the cube
+    late = write_granule(downloads / "h12.nc", 12.0, start="2024-09-13T12:00:00Z")
+    assert cube.ingest(late) == [] and not os.path.exists(late)
+    assert cube.ingest(outside) == [] and os.path.exists(outside)  # not the cube's to delete
+    assert cube.slices() == ["20240913T15", "20240913T16"]
+
+
+def test_service_reads_cube_without_network(tmp_path, monkeypatch):
+    cube = TEMPOCube(str(tmp_path / "cube"), grid=GRID)
+    cube.ingest(write_granule(
+        tmp_path / "o3.nc", 300.0,
+        extra_product={
+            "column_amount_o3": (("mirror_step", "xtrack"), np.full((12, 10), 300.0)),
+            "uv_aerosol_index": (("mirror_step", "xtrack"), np.full((12, 10), 1.234)),
+        },
+    ))
+    service = TEMPOService()
+    service.use_real = True
+    service._cube = cube
+    monkeypatch.setattr(service, "_schedule_ingest", lambda: None)
+    data = asyncio.run(service._fetch_uncached(39.0, -74.5, None))
+    assert data["cubeSlice"] == "20240913T14"
+    assert data["columns"]["o3"] == {"value": pytest.approx(300.0), "unit": "DU"}
+    assert data["measurements"]["aerosolIndex"] == 1.23
+    assert data["quality"] == "provisional"
+    # Outside the cube: synthetic response
+    assert "columns" not in asyncio.run(service._fetch_uncached(10.0, 0.0, None))
+
+
+def test_service_samples_downloaded_granules_at_native_resolution(tmp_path, monkeypatch):
+    service = TEMPOService()
+    service.use_real = True
+    service._cube = TEMPOCube(str(tmp_path / "cube"), grid=GRID)
+    monkeypatch.setattr(service, "_schedule_ingest", lambda: None)
+    downloads = tmp_path / "cube" / "granules"
+    downloads.mkdir()
+    scan, pixel = np.meshgrid(np.arange(12), np.arange(10), indexing="ij")
+    gradient = (1.0 + scan * 10 + pixel).astype(float) * 1e15  # varies inside every 0.5 deg cell
+    granule = write_granule(downloads / "no2.nc", 0.0, extra_product={
+        "vertical_column_troposphere": (("mirror_step", "xtrack"), gradient)})
+    assert asyncio.run(service.ingest_files([granule])) == 1
+    assert os.path.exists(granule + ".kdtree.joblib")
+
+    lat, lon = 38.1 + 3 * 0.3 + 4 * 0.02, -75.9 + 4 * 0.35 - 3 * 0.01  # centre of pixel (3, 4)
+    data = asyncio.run(service._fetch_uncached(lat, lon, None))
+    assert data["columns"]["no2"]["value"] == pytest.approx(gradient[3, 4])
+    assert data["resolution"] == "native swath pixel"
+    assert service.cube.point(lat, lon)["no2"] != pytest.approx(gradient[3, 4])  # cell mean differs
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from app.services.tempo_service import TEMPOService, _urban_bias_array
+
+SCALAR = {
+    "no2": "_get_realistic_no2",
+    "o3": "_get_realistic_o3",
+    "hcho": "_get_realistic_hcho",
+    "pm25": "_get_realistic_pm25",
+    "aerosolIndex": "_get_realistic_aerosol",
+}
+
+
+def test_stable_hash_is_process_independent():
+    service = TEMPOService()
+    # Fixed values: no dependence on PYTHONHASHSEED
+    assert service._stable_hash(40.7128, -74.006) == pytest.approx(0.9226029051753234, abs=0)
+    assert service._stable_hash(-33.8688, 151.2093) == pytest.approx(0.08632111760934841, abs=0)
+
+
+@pytest.mark.parametrize("hour", [0, 6, 13, 23])
+def test_sample_grid_matches_scalar_path(hour):
+    service = TEMPOService()
+    rng = np.random.default_rng(hour)
+    lat = np.concatenate([rng.uniform(-90, 90, 400), rng.uniform(39.5, 42, 200), np.round(rng.uniform(-60, 60, 200), 4)])
+    lon = np.concatenate([rng.uniform(-180, 180, 400), rng.uniform(-75, -73, 200), np.round(rng.uniform(-180, 180, 200), 4)])
+    grid = service.sample_grid(lat, lon, hour)
+    for field, method in SCALAR.items():
+        expected = [getattr(service, method)(a, b, hour) for a, b in zip(lat.tolist(), lon.tolist())]
+        np.testing.assert_array_equal(grid[field], expected)
+
+
+def test_sample_grid_keeps_shape_and_metro_bias():
+    service = TEMPOService()
+    lat, lon = np.meshgrid([40.7, 45.0], [-74.0, -80.0, -90.0], indexing="ij")
+    grid = service.sample_grid(lat, lon, 12)
+    assert grid["no2"].shape == (2, 3)
+    assert grid["no2"][0, 0] == service._get_realistic_no2(40.7, -74.0, 12)
+    # NYC and LA boxes; first match wins, outside every box -> 0
+    bias = _urban_bias_array(np.array([40.7, 34.0, 45.0]), np.array([-74.0, -118.0, -80.0]))
+    np.testing.assert_array_equal(bias, [6.0, 7.5, 0.0])
@@ -0,0 +1,69 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from app.services.timeseries_store import PARAMETERS, TimeSeriesStore
+
+T0 = datetime(2026, 9, 1, tzinfo=timezone.utc)
+
+
+def hourly(store, series, hours, **fields):
+    return store.append((series, T0 + timedelta(hours=h, minutes=20),
+                         {name: fn(h) for name, fn in fields.items()}) for h in range(hours))
+
+
+def test_scan_spans_day_segments_and_fills_gaps(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    assert hourly(store, "station-1", 48, pm25=float, o3=lambda h: float("nan")) == 48
+    times, values = store.scan("station-1", T0 + timedelta(hours=20), T0 + timedelta(hours=52), ["pm25", "o3"])
+    assert len(times) == 32 and str(times[0]) == "2026-09-01T20"
+    assert values[:28, 0].tolist() == list(range(20, 48))
+    assert np.isnan(values[28:, 0]).all() and np.isnan(values[:, 1]).all()
+    assert sorted(p.name for p in (tmp_path / "station-1").iterdir()) == ["20260901.npy", "20260902.npy"]
+
+
+def test_later_value_for_an_hour_replaces_it(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    store.append([("tile-dr5ru", T0, {"no2": 10.0})])
+    store.scan("tile-dr5ru", T0, T0 + timedelta(hours=1))  # reader maps the segment first
+    store.append([("tile-dr5ru", T0 + timedelta(minutes=40), {"no2": 12.0, "unknown": 1.0})])
+    _, values = store.scan("tile-dr5ru", T0, T0 + timedelta(hours=1), ["no2"])
+    assert values.tolist() == [[12.0]]
+
+
+def test_rolling_means_require_75_percent_coverage(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    hourly(store, "s", 30, o3=lambda h: float(h))
+    times, means = store.rolling_mean("s", "o3", 8, T0, T0 + timedelta(hours=40))
+    assert str(times[0]) == "2026-09-01T00" and len(means) == 40
+    assert np.isnan(means[:5]).all()  # fewer than 6 of 8 hours yet
+    assert means[5] == np.mean(range(6)) and means[10] == np.mean(range(3, 11))
+    assert means[31] == np.mean(range(24, 30))  # 6 of 8 hours: still reported
+    assert np.isnan(means[32:]).all()
+
+
+def test_month_of_hourly_data_scans_in_milliseconds(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    hourly(store, "station-42", 31 * 24, pm25=lambda h: 10 + h % 24, o3=lambda h: 30 + h % 8)
+    end = T0 + timedelta(days=31)
+    store.rolling_mean("station-42", "pm25", 24, T0, end)  # open the segment maps
+    began = time.perf_counter()
+    times, values = store.scan("station-42", T0, end)
+    _, pm = store.rolling_mean("station-42", "pm25", 24, T0, end)
+    _, o3 = store.rolling_mean("station-42", "o3", 8, T0, end)
+    elapsed = time.perf_counter() - began
+    assert values.shape == (31 * 24, len(PARAMETERS)) and not np.isnan(values[:, 0]).any()
+    assert np.allclose(pm[24:], 21.5) and np.allclose(o3[8:], 33.5)
+    assert elapsed < 0.05
+
+
+def test_prune_drops_old_days(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    hourly(store, "old", 24, pm25=float)
+    hourly(store, "recent", 24 * 5, pm25=float)
+    removed = store.prune(keep_days=2, now=T0 + timedelta(days=4, hours=3))
+    assert removed == 1 + 2
+    assert store.series() == ["recent"]
+    _, values = store.scan("recent", T0, T0 + timedelta(days=5), ["pm25"])
+    assert np.isnan(values[:48]).all() and not np.isnan(values[48:]).any()